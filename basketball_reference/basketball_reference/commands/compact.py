@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import os
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from basketball_reference.compaction import DATASETS, SeasonArchive
+
+
+class Command(ScrapyCommand):
+    '''
+    Merges the per-game box score and shot files of each year into a season
+    archive (see compaction.py). Only new or changed games are added, so it
+    can run after every crawl:
+
+        $ scrapy compact                      # every dataset and year
+        $ scrapy compact -d shots 2021 --remove
+    '''
+    requires_project = True
+    default_settings = {'LOG_ENABLED': False}
+
+    def syntax(self):
+        return '[options] [year ...]'
+
+    def short_desc(self):
+        return 'Merge per-game CSV files into compressed season archives'
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument('-d', '--dataset', dest='datasets', action='append', default=[],
+                            help='one of {} (default: all)'.format(', '.join(DATASETS)))
+        parser.add_argument('--remove', action='store_true',
+                            help='delete the per-game files once archived')
+
+    def run(self, args, opts):
+        for dataset in opts.datasets:
+            if dataset not in DATASETS:
+                raise UsageError('Unknown dataset {}.'.format(dataset))
+
+        output_dir = self.settings.get('OUTPUT_DIR')
+        for dataset in opts.datasets or DATASETS:
+            dataset_dir = '{}/games/{}'.format(output_dir, dataset)
+            if args:
+                years = args
+            elif os.path.isdir(dataset_dir):
+                years = sorted(x for x in os.listdir(dataset_dir)
+                               if os.path.isdir('{}/{}'.format(dataset_dir, x)))
+            else:
+                years = []
+
+            for year in years:
+                archive = SeasonArchive('{}/{}'.format(dataset_dir, year))
+                added = archive.compact(remove=opts.remove)
+                print('{}/{}: {} games added, {} archived.'.format(
+                        dataset, year, len(added), len(archive.index['games'])))
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import os, sys, subprocess
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from scrapy.utils.conf import arglist_to_dict
+
+from basketball_reference.sharding import get_shards, get_shard_settings, ShardMerger
+
+
+class Command(ScrapyCommand):
+    '''
+    Runs a crawl in several crawler processes (see sharding.py), then merges
+    their outputs into OUTPUT_DIR:
+
+        $ scrapy shard boxscores -a from_season=1950 -a to_season=2021 -n 8
+        $ scrapy shard player -a all=1
+    '''
+    requires_project = True
+    default_settings = {'LOG_ENABLED': False}
+
+    def syntax(self):
+        return '[options] <spider>'
+
+    def short_desc(self):
+        return 'Run a crawl split among several processes'
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument('-a', dest='spargs', action='append', default=[], metavar='NAME=VALUE',
+                            help='set spider argument (may be repeated)')
+        parser.add_argument('-n', '--processes', type=int, default=None,
+                            help='crawler processes (default: SHARD_PROCESSES)')
+
+    def process_options(self, args, opts):
+        super().process_options(args, opts)
+        try:
+            opts.spargs = arglist_to_dict(opts.spargs)
+        except ValueError:
+            raise UsageError('Invalid -a value, use -a NAME=VALUE', print_help=False)
+
+    def run(self, args, opts):
+        if len(args) != 1:
+            raise UsageError()
+        spider = args[0]
+        count = opts.processes or self.settings.getint('SHARD_PROCESSES')
+
+        shards = get_shards(spider, opts.spargs, count)
+        if shards is None:
+            raise UsageError('{} can not be sharded with these arguments.'.format(spider), print_help=False)
+
+        shards_dir = '{}/.shards'.format(self.settings.get('OUTPUT_DIR'))
+        os.makedirs(shards_dir, exist_ok=True)
+
+        processes = []
+        for index, spider_args in enumerate(shards):
+            command = [sys.executable, '-m', 'scrapy', 'crawl', spider,
+                       '--logfile', '{}/{}.log'.format(shards_dir, index)]
+            for name, value in spider_args.items():
+                command += ['-a', '{}={}'.format(name, value)]
+            for setting in opts.set:
+                command += ['-s', setting]
+            for name, value in get_shard_settings(self.settings, shards_dir, index, len(shards)).items():
+                command += ['-s', '{}={}'.format(name, value)]
+
+            print('Shard {}: {}'.format(index, ' '.join('{}={}'.format(k, v) for k, v in spider_args.items())))
+            processes.append(subprocess.Popen(command))
+
+        failed = []
+        for index, process in enumerate(processes):
+            if process.wait() != 0:
+                failed.append(index)
+
+        # Files of failed shards are complete too (written atomically)
+        merger = ShardMerger(self.settings, spider)
+        for index in range(len(shards)):
+            shard_dir = '{}/{}'.format(shards_dir, index)
+            if os.path.isdir(shard_dir):
+                merger.merge(shard_dir)
+        merger.close()
+        print('Merged {} files ({} unchanged) of {} shards.'.format(merger.files, merger.unchanged, len(shards)))
+        if merger.unfinished:
+            print('Skipped unfinished files: {}.'.format(', '.join(merger.unfinished)))
+
+        if failed:
+            print('Shards failed: {} (see their logs in {}).'.format(', '.join(str(x) for x in failed), shards_dir))
+            self.exitcode = 1
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+# Season archives: the per-game CSV files of a year directory (e.g.
+# games/boxscores/basic/2021/) merged into one compressed file sorted by
+# game id, with a side index for random access:
+#
+#   games/boxscores/basic/2021.csv.gz      header, then one gzip member per game
+#   games/boxscores/basic/2021.index.json  game id -> [offset, length, sha1]
+#
+# Concatenated gzip members are a valid gzip file, so the archive reads like
+# a plain CSV (gzip.open, pandas.read_csv). A single game is read by
+# decompressing its member only (SeasonArchive.read_game).
+
+import os, io, csv, gzip, json, hashlib
+
+# Directories under OUTPUT_DIR/games with per-game files
+DATASETS = ['boxscores/basic', 'boxscores/advanced', 'shots']
+
+
+class SeasonArchive:
+    def __init__(self, dir_path):
+        self.dir_path = dir_path.rstrip('/')
+        self.path = '{}.csv.gz'.format(self.dir_path)
+        self.index_path = '{}.index.json'.format(self.dir_path)
+        self.index = self.load_index()
+
+    def load_index(self):
+        if os.path.exists(self.index_path) and os.path.exists(self.path):
+            with open(self.index_path, encoding='utf-8') as f:
+                return json.load(f)
+        return {'fieldnames': None, 'size': 0, 'games': {}}
+
+    def save_index(self):
+        tmp_path = '{}.{}.tmp'.format(self.index_path, os.getpid())
+        with open(tmp_path, mode='w', encoding='utf-8') as f:
+            json.dump(self.index, f, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
+
+
+    def game_ids(self):
+        return sorted(self.index['games'])
+
+    def read_game(self, game_id):
+        '''
+        Rows (dicts) of an archived game, or None if it is not archived.
+        '''
+        if game_id not in self.index['games']:
+            return None
+        offset, length, digest = self.index['games'][game_id]
+        with open(self.path, mode='rb') as f:
+            f.seek(offset)
+            text = gzip.decompress(f.read(length)).decode('utf-8')
+        return list(csv.DictReader(io.StringIO(text, newline=''), fieldnames=self.index['fieldnames']))
+
+
+    def get_game_files(self):
+        '''
+        Per-game files of the directory: game id -> path.
+        '''
+        if not os.path.isdir(self.dir_path):
+            return {}
+        year = os.path.basename(self.dir_path)  # file names are game ids without the year
+        return {year + x[:-len('.csv')]: '{}/{}'.format(self.dir_path, x)
+                for x in os.listdir(self.dir_path) if x.endswith('.csv')}
+
+    def compact(self, remove=False):
+        '''
+        Adds the new (or changed) per-game files to the archive, and deletes
+        the per-game files if remove. Games sorting after the last archived
+        one are appended, otherwise the archive is rewritten (copying the
+        compressed members of the other games, extended when the new files
+        have more columns). Returns the game ids added.
+        '''
+        files = self.get_game_files()
+        games = self.index['games']
+        self.widened = False  # new columns in the per-game files
+
+        members = {}  # game id -> [compressed rows, sha1 of the file]
+        for game_id in sorted(files):
+            with open(files[game_id], mode='rb') as f:
+                data = f.read()
+            digest = hashlib.sha1(data).hexdigest()
+            if game_id in games and games[game_id][2] == digest:
+                continue
+            members[game_id] = [gzip.compress(self.get_rows(data), mtime=0), digest]
+
+        if members:
+            if self.widened:
+                members = {x: [self.pad(data), digest] for x, (data, digest) in members.items()}
+            if games and (self.widened or set(members) & set(games) or min(members) < max(games)):
+                self.rewrite(members)
+            else:
+                self.append(members)
+            self.save_index()
+
+        if remove:
+            for path in files.values():
+                os.remove(path)
+            # Already removed by a previous run, if no files
+            if os.path.isdir(self.dir_path) and not os.listdir(self.dir_path):
+                os.rmdir(self.dir_path)
+
+        return sorted(members)
+
+    def get_rows(self, data):
+        '''
+        Rows of a per-game file (bytes) without its header, in the column
+        order of the archive. Columns missing from the archive are added to
+        its header (the archive is then rewritten, see pad).
+        '''
+        header, _, rows = data.partition(b'\n')
+        fieldnames = next(csv.reader([header.decode('utf-8')]))
+        if self.index['fieldnames'] is None:
+            self.index['fieldnames'] = fieldnames
+        new_columns = [x for x in fieldnames if x not in self.index['fieldnames']]
+        if new_columns:
+            self.index['fieldnames'] = self.index['fieldnames'] + new_columns
+            self.widened = True
+        if fieldnames == self.index['fieldnames']:
+            return rows
+
+        # Written by another version of the spider: columns are matched by name
+        reader = csv.DictReader(io.StringIO(data.decode('utf-8'), newline=''))
+        f = io.StringIO(newline='\n')
+        writer = csv.DictWriter(f, fieldnames=self.index['fieldnames'], lineterminator='\n')
+        writer.writerows(reader)
+        return f.getvalue().encode('utf-8')
+
+    def pad(self, data):
+        '''
+        Compressed member (bytes) with its rows extended with empty values
+        up to the columns of the archive (new columns are added at the end).
+        '''
+        width = len(self.index['fieldnames'])
+        reader = csv.reader(io.StringIO(gzip.decompress(data).decode('utf-8'), newline=''))
+        f = io.StringIO(newline='\n')
+        csv.writer(f, lineterminator='\n').writerows(row + [''] * (width - len(row)) for row in reader)
+        return gzip.compress(f.getvalue().encode('utf-8'), mtime=0)
+
+    def get_header(self):
+        f = io.StringIO(newline='\n')
+        csv.writer(f, lineterminator='\n').writerow(self.index['fieldnames'])
+        return gzip.compress(f.getvalue().encode('utf-8'), mtime=0)
+
+    def append(self, members):
+        mode = 'r+b' if self.index['games'] else 'wb'
+        with open(self.path, mode=mode) as f:
+            if mode == 'wb':
+                f.write(self.get_header())
+            else:
+                # Drops what an interrupted run appended after the last indexed game
+                f.seek(self.index['size'])
+                f.truncate()
+
+            for game_id in sorted(members):
+                data, digest = members[game_id]
+                self.index['games'][game_id] = [f.tell(), len(data), digest]
+                f.write(data)
+            self.index['size'] = f.tell()
+
+    def rewrite(self, members):
+        games = {}
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(self.path, mode='rb') as old, open(tmp_path, mode='wb') as f:
+            f.write(self.get_header())
+            for game_id in sorted(set(self.index['games']) | set(members)):
+                if game_id in members:
+                    data, digest = members[game_id]
+                else:
+                    offset, length, digest = self.index['games'][game_id]
+                    old.seek(offset)
+                    data = old.read(length)
+                    if self.widened:
+                        data = self.pad(data)
+                games[game_id] = [f.tell(), len(data), digest]
+                f.write(data)
+            size = f.tell()
+        os.replace(tmp_path, self.path)
+
+        self.index['games'] = games
+        self.index['size'] = size
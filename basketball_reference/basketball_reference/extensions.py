@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+# Define here your extensions
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/extensions.html
+
+import os, json, time
+from collections import deque
+from datetime import datetime
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+from basketball_reference.signals import response_parsed, item_written
+
+
+def percentile(values, q):
+    '''
+    q-th percentile (0 to 100) of values, nearest rank. None if empty.
+    '''
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(round(q / 100 * (len(values) - 1)))
+    return values[rank]
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'total': sum(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'max': max(values) if values else None,
+    }
+
+def format_seconds(seconds):
+    if seconds is None:
+        return '-'
+    return '{:.0f}ms'.format(seconds * 1000)
+
+
+class CrawlReport:
+    '''
+    Aggregates the response_parsed and item_written signals of a crawl
+    (INSTRUMENTATION_ENABLED): time spent in each callback and pipeline,
+    download latency, items and rows, plus the crawl stats. The report is
+    logged and written to INSTRUMENTATION_REPORT_DIR/<spider>-<time>.json
+    when the spider closes.
+    '''
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.dir = crawler.settings.get('INSTRUMENTATION_REPORT_DIR')
+
+        self.start_time = None
+        self.callbacks = {}  # callback name -> {'seconds', 'latency', 'items', 'rows'}
+        self.pipelines = {}  # pipeline name -> {'seconds', 'rows'}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('INSTRUMENTATION_ENABLED'):
+            raise NotConfigured
+
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_parsed, signal=response_parsed)
+        crawler.signals.connect(ext.item_written, signal=item_written)
+        return ext
+
+    def spider_opened(self, spider):
+        self.start_time = time.perf_counter()
+
+    def response_parsed(self, response, spider, callback, seconds, items, rows):
+        if callback not in self.callbacks:
+            self.callbacks[callback] = {'seconds': [], 'latency': [], 'items': 0, 'rows': 0}
+        totals = self.callbacks[callback]
+        totals['seconds'].append(seconds)
+        if 'download_latency' in response.meta:
+            totals['latency'].append(response.meta['download_latency'])
+        totals['items'] += items
+        totals['rows'] += rows
+
+    def item_written(self, item, spider, pipeline, seconds, rows):
+        if pipeline not in self.pipelines:
+            self.pipelines[pipeline] = {'seconds': [], 'rows': 0}
+        totals = self.pipelines[pipeline]
+        totals['seconds'].append(seconds)
+        totals['rows'] += rows
+
+    def spider_closed(self, spider, reason):
+        report = self.get_report(spider, reason)
+        self.log_report(report, spider)
+
+        os.makedirs(self.dir, exist_ok=True)
+        path = '{}/{}-{}.json'.format(self.dir, spider.name, datetime.now().strftime('%Y%m%d-%H%M%S'))
+        try:
+            with open(path, mode='w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, default=str)
+        except Exception:
+            spider.logger.error("Error writing to {}.".format(path))
+
+
+    def get_report(self, spider, reason):
+        elapsed = time.perf_counter() - self.start_time
+
+        callbacks = {}
+        for callback, totals in self.callbacks.items():
+            callbacks[callback] = {
+                'pages': len(totals['seconds']),
+                'pages_per_sec': len(totals['seconds']) / elapsed,
+                'items': totals['items'],
+                'rows': totals['rows'],
+                'parse_seconds': summarize(totals['seconds']),
+                'download_latency': summarize(totals['latency']),
+            }
+
+        pipelines = {}
+        for pipeline, totals in self.pipelines.items():
+            pipelines[pipeline] = {
+                'rows': totals['rows'],
+                'write_seconds': summarize(totals['seconds']),
+            }
+
+        return {
+            'spider': spider.name,
+            'reason': reason,
+            'elapsed': elapsed,
+            'callbacks': callbacks,
+            'pipelines': pipelines,
+            'stats': self.crawler.stats.get_stats(),
+        }
+
+    def log_report(self, report, spider):
+        lines = ['Crawl report ({:.0f}s):'.format(report['elapsed'])]
+        for callback, totals in report['callbacks'].items():
+            lines.append('  {:<24} {:>6} pages {:>8} rows  parse p50 {:.1f}ms p95 {:.1f}ms  latency p50 {}'.format(
+                callback, totals['pages'], totals['rows'],
+                totals['parse_seconds']['p50'] * 1000, totals['parse_seconds']['p95'] * 1000,
+                format_seconds(totals['download_latency']['p50'])))
+        for pipeline, totals in report['pipelines'].items():
+            lines.append('  {:<24} {:>8} rows  write p50 {:.1f}ms p95 {:.1f}ms total {:.1f}s'.format(
+                pipeline, totals['rows'],
+                totals['write_seconds']['p50'] * 1000, totals['write_seconds']['p95'] * 1000,
+                totals['write_seconds']['total']))
+        spider.logger.info('\n'.join(lines))
+
+
+class Histogram:
+    '''
+    Cumulative histogram, as exposed by Prometheus.
+    '''
+
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for i, bucket in enumerate(self.buckets):
+            if value <= bucket:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsResource(Resource):
+    isLeaf = True
+
+    def __init__(self, metrics):
+        Resource.__init__(self)
+        self.metrics = metrics
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', b'text/plain; version=0.0.4; charset=utf-8')
+        return self.metrics.render().encode('utf-8')
+
+
+class MetricsServer:
+    '''
+    Serves live crawl metrics (METRICS_ENABLED) in the Prometheus text format
+    on http://METRICS_HOST:METRICS_PORT/metrics: pages per second, scheduler
+    queue depth, retries and throttled responses, rows written per pipeline
+    and item type, write latency histograms and parse time percentiles (over
+    the last METRICS_WINDOW pages of each callback).
+    '''
+
+    PREFIX = 'basketball_reference'
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.host = crawler.settings.get('METRICS_HOST')
+        self.port = crawler.settings.getint('METRICS_PORT')
+        self.interval = crawler.settings.getfloat('METRICS_INTERVAL')
+        self.window = crawler.settings.getint('METRICS_WINDOW')
+        self.buckets = crawler.settings.getlist('METRICS_LATENCY_BUCKETS')
+
+        self.spider = None
+        self.listener = None
+        self.task = None
+        self.pages = 0
+        self.pages_per_sec = 0.0
+
+        self.parse_seconds = {}  # callback name -> deque of the last seconds
+        self.rows = {}  # (pipeline, item type) -> rows
+        self.write_seconds = {}  # pipeline -> Histogram
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_parsed, signal=response_parsed)
+        crawler.signals.connect(ext.item_written, signal=item_written)
+        return ext
+
+    def spider_opened(self, spider):
+        self.spider = spider
+        from twisted.internet import reactor
+        self.listener = reactor.listenTCP(self.port, Site(MetricsResource(self)), interface=self.host)
+        spider.logger.info('Metrics on http://{}:{}/metrics'.format(self.host, self.port))
+
+        self.task = task.LoopingCall(self.update_rate)
+        self.task.start(self.interval)
+
+    def spider_closed(self, spider, reason):
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        if self.listener is not None:
+            return self.listener.stopListening()
+
+    def update_rate(self):
+        pages = self.crawler.stats.get_value('response_received_count', 0)
+        self.pages_per_sec = (pages - self.pages) / self.interval
+        self.pages = pages
+
+    def response_parsed(self, response, spider, callback, seconds, items, rows):
+        if callback not in self.parse_seconds:
+            self.parse_seconds[callback] = deque(maxlen=self.window)
+        self.parse_seconds[callback].append(seconds)
+
+    def item_written(self, item, spider, pipeline, seconds, rows):
+        key = (pipeline, item['type'])
+        self.rows[key] = self.rows.get(key, 0) + rows
+        if pipeline not in self.write_seconds:
+            self.write_seconds[pipeline] = Histogram(float(x) for x in self.buckets)
+        self.write_seconds[pipeline].observe(seconds)
+
+
+    def render(self):
+        stats = self.crawler.stats
+        spider = self.spider.name if self.spider else ''
+        lines = []
+
+        def add(name, kind, description, samples):
+            name = '{}_{}'.format(self.PREFIX, name)
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for suffix, labels, value in samples:
+                labels = dict(labels, spider=spider)
+                labels = ','.join('{}="{}"'.format(k, v) for k, v in sorted(labels.items()))
+                lines.append('{}{}{{{}}} {}'.format(name, suffix, labels, value))
+
+        add('pages_per_second', 'gauge', 'Responses received per second.',
+            [('', {}, self.pages_per_sec)])
+        add('pages_total', 'counter', 'Responses received.',
+            [('', {}, stats.get_value('response_received_count', 0))])
+        add('queue_depth', 'gauge', 'Requests waiting in the scheduler.',
+            [('', {}, self.get_queue_depth())])
+        add('requests_in_progress', 'gauge', 'Requests being downloaded.',
+            [('', {}, self.get_in_progress())])
+        add('retries_total', 'counter', 'Requests retried.',
+            [('', {}, stats.get_value('retry/count', 0))])
+        add('throttled_total', 'counter', 'Responses with HTTP status 429.',
+            [('', {}, stats.get_value('downloader/response_status_count/429', 0))])
+        add('items_total', 'counter', 'Items scraped.',
+            [('', {}, stats.get_value('item_scraped_count', 0))])
+
+        add('rows_written_total', 'counter', 'Rows written, by pipeline and item type.',
+            [('', {'pipeline': pipeline, 'type': item_type}, rows)
+             for (pipeline, item_type), rows in sorted(self.rows.items())])
+
+        samples = []
+        for pipeline, histogram in sorted(self.write_seconds.items()):
+            for bucket, count in zip(histogram.buckets, histogram.counts):
+                samples.append(('_bucket', {'pipeline': pipeline, 'le': bucket}, count))
+            samples.append(('_bucket', {'pipeline': pipeline, 'le': '+Inf'}, histogram.count))
+            samples.append(('_sum', {'pipeline': pipeline}, histogram.sum))
+            samples.append(('_count', {'pipeline': pipeline}, histogram.count))
+        add('write_seconds', 'histogram', 'Time spent writing an item, by pipeline.', samples)
+
+        samples = []
+        for callback, values in sorted(self.parse_seconds.items()):
+            for q in [0.5, 0.9, 0.99]:
+                samples.append(('', {'callback': callback, 'quantile': q}, percentile(values, q * 100)))
+            samples.append(('_count', {'callback': callback}, len(values)))
+            samples.append(('_sum', {'callback': callback}, sum(values)))
+        add('parse_seconds', 'summary', 'Time spent in a callback, over the last pages.', samples)
+
+        return '\n'.join(lines) + '\n'
+
+    def get_queue_depth(self):
+        # The engine slot was renamed _slot in Scrapy 2.6
+        engine = self.crawler.engine
+        slot = getattr(engine, '_slot', None) or getattr(engine, 'slot', None)
+        if slot is None:
+            return 0
+        return len(slot.scheduler)
+
+    def get_in_progress(self):
+        engine = self.crawler.engine
+        if engine is None:
+            return 0
+        return len(engine.downloader.active)
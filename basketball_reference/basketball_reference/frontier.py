@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+# Durable crawl frontier on local disk (SQLite), so an interrupted crawl can
+# resume where it stopped.
+#
+# Every request followed by a spider is recorded with its callback and a
+# status: pending, done or failed.
+
+import re, sqlite3, os
+from datetime import datetime
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+KINDS = [
+    ('schedule', re.compile(r'/(leagues|playoffs)/NBA_[0-9]{4}_games')),
+    ('shot_chart', re.compile(r'/boxscores/shot-chart/[0-9]{9}[A-Z]{3}\.html')),
+    ('game', re.compile(r'/boxscores/[0-9]{9}[A-Z]{3}\.html')),
+    ('player', re.compile(r'/players/[a-z]/[a-z]{1,7}[0-9]{2}\.html')),
+    ('player_list', re.compile(r'/players/[a-z]/?$')),
+]
+
+
+def get_kind(url):
+    for kind, pattern in KINDS:
+        if pattern.search(url):
+            return kind
+    return None
+
+
+class CrawlFrontier:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS frontier (
+                url TEXT PRIMARY KEY,
+                kind TEXT,
+                callback TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated TEXT
+            )''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS frontier_status ON frontier (status)')
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def commit(self):
+        self.conn.commit()
+
+
+    def get_status(self, url):
+        row = self.conn.execute('SELECT status FROM frontier WHERE url = ?', (url,)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def add(self, url, callback):
+        '''
+        Records url as pending, unless it is already known.
+        '''
+        self.conn.execute('''
+            INSERT OR IGNORE INTO frontier (url, kind, callback, status, updated)
+            VALUES (?, ?, ?, ?, ?)''', (url, get_kind(url), callback, PENDING, self.now()))
+
+    def set_status(self, url, status):
+        self.conn.execute('''
+            UPDATE frontier SET status = ?, updated = ?,
+                attempts = attempts + (CASE WHEN ? = 'pending' THEN 0 ELSE 1 END)
+            WHERE url = ?''', (status, self.now(), status, url))
+
+    def get_urls(self, status):
+        '''
+        Returns (url, callback) of every url with status.
+        '''
+        cursor = self.conn.execute(
+            'SELECT url, callback FROM frontier WHERE status = ? ORDER BY url', (status,))
+        return cursor.fetchall()
+
+    def count(self):
+        cursor = self.conn.execute('SELECT status, COUNT(*) FROM frontier GROUP BY status')
+        return dict(cursor.fetchall())
+
+    def now(self):
+        return datetime.now().isoformat(timespec='seconds')
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# HTTP cache policy for basketball-reference pages.
+#
+# See: https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
+
+import re
+from datetime import date, datetime, timedelta, timezone
+
+from scrapy.extensions.httpcache import RFC2616Policy, rfc1123_to_epoch
+
+MONTHS = ['january', 'february', 'march', 'april', 'may', 'june', 'july', 
+            'august', 'september', 'october', 'november', 'december']
+
+
+class SeasonCachePolicy(RFC2616Policy):
+    '''
+    Pages that can no longer change are served straight from the cache, with
+    no request at all, when they were stored (Date header) HTTPCACHE_FINAL_DAYS
+    after:
+      - the end of the month, for schedule months,
+      - the game date, for box scores and shot charts,
+      - the end of the season (November 1st), for playoff schedules.
+    Copies stored earlier (e.g. on game night) are downloaded once more.
+
+    Any other page (current schedules, players...) is revalidated with
+    If-None-Match / If-Modified-Since, as in RFC2616Policy.
+    '''
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.final_days = settings.getint('HTTPCACHE_FINAL_DAYS')
+
+    def should_cache_response(self, response, request):
+        if response.status == 200 and self.is_final(request.url):
+            return True
+        return super().should_cache_response(response, request)
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        if self.is_final(request.url, self.get_stored_date(cachedresponse)):
+            return True
+        if self.is_final(request.url):
+            # Downloaded in full (no If-None-Match) to store the final copy
+            return False
+        return super().is_cached_response_fresh(cachedresponse, request)
+
+
+    def is_final(self, url, day=None):
+        '''
+        True if the page at url can no longer change on day (today by default).
+        '''
+        last_date = self.get_last_date(url)
+        if last_date is None:
+            return False
+        return (day or date.today()) >= last_date + timedelta(days=self.final_days)
+
+    def get_stored_date(self, cachedresponse):
+        '''
+        Date (UTC) on which the cached response was served, from its Date
+        header, or date.min if unknown.
+        '''
+        epoch = rfc1123_to_epoch(cachedresponse.headers.get(b'Date'))
+        if epoch is None:
+            return date.min
+        return datetime.fromtimestamp(epoch, timezone.utc).date()
+
+    def get_last_date(self, url):
+        '''
+        Last date in which the page at url can change, or None if unknown.
+        '''
+        # e.g. /leagues/NBA_2021_games-january.html, /leagues/NBA_2020_games-october-2019.html
+        match = re.search(r'/leagues/NBA_([0-9]{4})_games-([a-z]*)(-[0-9]{4})?\.html', url)
+        if match and match.group(2) in MONTHS:
+            month = MONTHS.index(match.group(2)) + 1
+            if match.group(3):
+                year = int(match.group(3)[1:])
+            elif month >= 9:  # The season starts the previous year.
+                year = int(match.group(1)) - 1
+            else:
+                year = int(match.group(1))
+
+            if month == 12:
+                return date(year, 12, 31)
+            return date(year, month + 1, 1) - timedelta(days=1)
+
+        # e.g. /boxscores/202101010BOS.html, /boxscores/shot-chart/202101010BOS.html
+        match = re.search(r'/boxscores/(shot-chart/)?([0-9]{8})[0-9][A-Z]{3}\.html', url)
+        if match:
+            game_date = match.group(2)
+            return date(int(game_date[0:4]), int(game_date[4:6]), int(game_date[6:8]))
+
+        # e.g. /playoffs/NBA_2021_games.html
+        match = re.search(r'/playoffs/NBA_([0-9]{4})_games\.html', url)
+        if match:
+            return date(int(match.group(1)), 11, 1)
+
+        return None
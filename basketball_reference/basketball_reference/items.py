@@ -12,3 +12,37 @@ class BasketballReferenceItem(scrapy.Item):
     # define the fields for your item here like:
     # name = scrapy.Field()
     pass
+
+
+# Items are plain dicts: {'file_name', 'type', 'dir', 'data', 'fieldnames'},
+# data being the rows of the output file (or the tables of a player).
+#
+# In stream mode (-a stream=1) the rows are yielded as they are extracted,
+# as small items with 'stream': True holding a single row (or player table),
+# followed by an end item once the file is complete. The pipelines append
+# them to the output file, which is only replaced on the end item.
+
+def get_row_item(item_type, dir, file_name, fieldnames, entry):
+    return { 'file_name': file_name,
+             'type': item_type,
+             'dir': dir,
+             'data': [entry],
+             'fieldnames': fieldnames,
+             'stream': True }
+
+def get_table_item(dir, player_id, table_id, entries):
+    return { 'file_name': player_id,
+             'type': 'player',
+             'dir': dir,
+             'data': {table_id: entries},
+             'fieldnames': None,
+             'stream': True }
+
+def get_end_item(item_type, dir, file_name, fieldnames=None):
+    return { 'file_name': file_name,
+             'type': item_type,
+             'dir': dir,
+             'data': {} if item_type == 'player' else [],
+             'fieldnames': fieldnames,
+             'stream': True,
+             'end': True }
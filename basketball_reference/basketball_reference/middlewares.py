@@ -5,7 +5,31 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
-from scrapy import signals
+import os, random, time, logging
+import cProfile
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from functools import partial
+
+from scrapy import signals, Request
+from scrapy.exceptions import NotConfigured, IgnoreRequest
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.url import url_is_from_any_domain
+from twisted.internet.task import deferLater
+
+from basketball_reference.frontier import CrawlFrontier, PENDING, DONE, FAILED
+from basketball_reference.pipelines import count_rows
+from basketball_reference.signals import response_parsed
+from basketball_reference.snapshots import SnapshotStore
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+logger = logging.getLogger(__name__)
 
 
 class BasketballReferenceSpiderMiddleware:
@@ -101,3 +125,560 @@ class BasketballReferenceDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info('Spider opened: %s' % spider.name)
+
+
+class SnapshotMiddleware:
+    '''
+    Records raw responses into a SnapshotStore (SNAPSHOT_ENABLED) or replays
+    them to the spider callbacks without hitting the network (SNAPSHOT_REPLAY).
+
+    Replayed requests that were never recorded (robots.txt included) are
+    dropped, logged and counted in the snapshot/miss stat.
+    '''
+
+    def __init__(self, store, record, replay, stats):
+        self.store = store
+        self.record = record
+        self.replay = replay
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        record = crawler.settings.getbool('SNAPSHOT_ENABLED')
+        replay = crawler.settings.getbool('SNAPSHOT_REPLAY')
+        if not record and not replay:
+            raise NotConfigured
+
+        store = SnapshotStore(crawler.settings.get('SNAPSHOT_DIR'))
+        return cls(store, record, replay, crawler.stats)
+
+    def process_request(self, request, spider):
+        if not self.replay:
+            return None
+
+        snapshot = self.store.get(request.url)
+        if snapshot is None:
+            self.stats.inc_value('snapshot/miss')
+            spider.logger.warning('No snapshot stored for {}, skipped.'.format(request.url))
+            raise IgnoreRequest('No snapshot stored for {}'.format(request.url))
+
+        headers = Headers(snapshot['headers'])
+        respcls = responsetypes.from_args(headers=headers, url=request.url,
+                                          body=snapshot['body'])
+        return respcls(url=request.url, status=snapshot['status'],
+                       headers=headers, body=snapshot['body'],
+                       request=request, flags=['snapshot'])
+
+    def process_response(self, request, response, spider):
+        if not self.record or 'snapshot' in response.flags:
+            return response
+
+        if response.status == 200:
+            headers = {}
+            if b'Content-Type' in response.headers:
+                headers['Content-Type'] = response.headers[b'Content-Type'].decode('latin-1')
+
+            # Redirected requests are also stored under their original URLs.
+            for url in request.meta.get('redirect_urls', []) + [request.url]:
+                self.store.put(url, response.body, headers, response.status)
+        return response
+
+
+class TokenBucket:
+    '''
+    Token bucket of rate tokens per second, holding up to capacity tokens.
+    Tokens can go negative: each reservation queues after the previous ones.
+    '''
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        '''
+        Takes a token and returns the seconds to wait before using it.
+        '''
+        self.refill()
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+    def pause(self, seconds):
+        '''
+        Delays the next reservations by (at least) seconds.
+        '''
+        self.refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def is_paused(self):
+        return time.monotonic() < self.paused_until
+
+
+class RateLimitMiddleware(BasketballReferenceDownloaderMiddleware):
+    '''
+    Adaptive per-domain rate control, in place of a fixed DOWNLOAD_DELAY.
+
+    Requests are paced by a token bucket at up to RATELIMIT_MAX_RATE requests
+    per minute (the site's published limit). Responses with a status in
+    RATELIMIT_HTTP_CODES (429) pause the domain for Retry-After seconds,
+    multiply its rate by RATELIMIT_BACKOFF and are retried. Healthy responses
+    ramp the rate back up by RATELIMIT_RAMP_UP (responses from the HTTP cache
+    or the snapshot store do not count, they never reached the site).
+
+    Requests already waiting for their turn when a pause starts wait again
+    (for a new reservation) if their delay ends during the pause.
+
+    The current rate of each domain is kept in the ratelimit/rate/<domain> stat.
+    '''
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.stats = crawler.stats
+
+        # Rates are configured per minute, buckets work per second.
+        self.max_rate = settings.getfloat('RATELIMIT_MAX_RATE') / 60
+        self.min_rate = settings.getfloat('RATELIMIT_MIN_RATE') / 60
+        self.ramp_up = settings.getfloat('RATELIMIT_RAMP_UP') / 60
+        self.backoff = settings.getfloat('RATELIMIT_BACKOFF')
+        self.burst = settings.getint('RATELIMIT_BURST')
+        self.default_pause = settings.getfloat('RATELIMIT_DEFAULT_PAUSE')
+        self.max_retries = settings.getint('RATELIMIT_MAX_RETRIES')
+        self.http_codes = [int(x) for x in settings.getlist('RATELIMIT_HTTP_CODES')]
+
+        self.buckets = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('RATELIMIT_ENABLED'):
+            if not crawler.settings.getfloat('DOWNLOAD_DELAY'):
+                logger.warning('RATELIMIT_ENABLED and DOWNLOAD_DELAY are off: requests are not paced, '
+                               'set DOWNLOAD_DELAY = 3 to stay under the site limit.')
+            raise NotConfigured
+
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        return s
+
+    def process_request(self, request, spider):
+        domain = urlparse_cached(request).hostname
+        if domain not in self.buckets:
+            self.buckets[domain] = TokenBucket(self.max_rate, self.burst)
+            self.set_rate_stat(domain)
+
+        wait = self.buckets[domain].reserve()
+        if wait > 0:
+            return self.delay(self.buckets[domain], wait)
+        return None
+
+    def delay(self, bucket, wait):
+        from twisted.internet import reactor
+        d = deferLater(reactor, wait, bucket.is_paused)
+        d.addCallback(self.delay_done, bucket)
+        return d
+
+    def delay_done(self, paused, bucket):
+        # The bucket may have been paused by a throttled response meanwhile.
+        if paused:
+            return self.delay(bucket, max(bucket.reserve(), bucket.paused_until - time.monotonic()))
+        return None
+
+    def process_response(self, request, response, spider):
+        domain = urlparse_cached(request).hostname
+        if domain not in self.buckets:
+            return response
+        bucket = self.buckets[domain]
+        if 'cached' in response.flags or 'snapshot' in response.flags:
+            return response
+
+        if response.status in self.http_codes:
+            pause = self.get_retry_after(response)
+            bucket.pause(pause)
+            bucket.rate = max(self.min_rate, bucket.rate * self.backoff)
+            self.set_rate_stat(domain)
+            self.stats.inc_value('ratelimit/throttled')
+
+            retries = request.meta.get('ratelimit_retries', 0)
+            spider.logger.warning('Throttled ({}) by {}: pausing {:.0f}s, rate {:.1f} req/min.'.format(
+                                    response.status, domain, pause, bucket.rate * 60))
+            if retries < self.max_retries:
+                retry_request = request.copy()
+                retry_request.meta['ratelimit_retries'] = retries + 1
+                retry_request.dont_filter = True
+                return retry_request
+            return response
+
+        if response.status < 400 and bucket.rate < self.max_rate:
+            bucket.rate = min(self.max_rate, bucket.rate + self.ramp_up)
+            self.set_rate_stat(domain)
+        return response
+
+
+    def get_retry_after(self, response):
+        '''
+        Seconds to wait from the Retry-After header (seconds or HTTP date).
+        '''
+        value = response.headers.get(b'Retry-After')
+        if not value:
+            return self.default_pause
+
+        value = value.decode('latin-1').strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return self.default_pause
+
+    def set_rate_stat(self, domain):
+        rate = round(self.buckets[domain].rate * 60, 2)
+        self.stats.set_value('ratelimit/rate/{}'.format(domain), rate)
+
+
+class FrontierMiddleware:
+    '''
+    Keeps a durable crawl frontier (FRONTIER_ENABLED) in
+    FRONTIER_DIR/<spider>.sqlite, so a restarted crawl picks up where it
+    stopped: requests already done are skipped and the pending ones of the
+    previous runs are resumed.
+
+    Failed requests are not crawled again until a separate pass with
+    FRONTIER_RETRY, which only crawls them, with FRONTIER_RETRY_CONCURRENCY.
+
+    Requests that will never be crawled are marked done: duplicates dropped
+    by the scheduler and requests ignored by a downloader middleware (e.g.
+    disallowed by robots.txt). Offsite requests are not recorded.
+    '''
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.dir = crawler.settings.get('FRONTIER_DIR')
+        self.retry = crawler.settings.getbool('FRONTIER_RETRY')
+        self.retry_concurrency = crawler.settings.getint('FRONTIER_RETRY_CONCURRENCY')
+
+        self.frontier = None
+        self.requested = set()  # urls requested in this run
+        self.scheduled = Counter()  # url -> requests scheduled in this run, not dropped
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('FRONTIER_ENABLED'):
+            raise NotConfigured
+
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(s.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(s.request_dropped, signal=signals.request_dropped)
+        return s
+
+    def spider_opened(self, spider):
+        frontier = self.get_frontier(spider)
+        spider.logger.info('Frontier: {}'.format(frontier.count()))
+
+        if self.retry:
+            downloader = self.crawler.engine.downloader
+            downloader.total_concurrency = self.retry_concurrency
+            downloader.domain_concurrency = self.retry_concurrency
+
+    def spider_closed(self, spider):
+        frontier = self.get_frontier(spider)
+        spider.logger.info('Frontier: {}'.format(frontier.count()))
+        frontier.close()
+
+    def get_frontier(self, spider):
+        if self.frontier is None:
+            self.frontier = CrawlFrontier('{}/{}.sqlite'.format(self.dir, spider.name))
+        return self.frontier
+
+
+    def process_start_requests(self, start_requests, spider):
+        if self.retry:
+            for request in self.get_stored_requests(FAILED, spider):
+                yield request
+            return
+
+        for request in start_requests:
+            if self.is_new_start_request(request, spider):
+                yield self.add_request(request, spider)
+
+        for request in self.get_stored_requests(PENDING, spider):
+            yield request
+
+    async def process_start(self, start):
+        # Same as process_start_requests, for Scrapy 2.13+.
+        spider = self.crawler.spider
+        if self.retry:
+            for request in self.get_stored_requests(FAILED, spider):
+                yield request
+            return
+
+        async for request in start:
+            if not isinstance(request, Request):
+                yield request
+            elif self.is_new_start_request(request, spider):
+                yield self.add_request(request, spider)
+
+        for request in self.get_stored_requests(PENDING, spider):
+            yield request
+
+    def is_new_start_request(self, request, spider):
+        return self.get_frontier(spider).get_status(request.url) not in [DONE, FAILED]
+
+    def get_stored_requests(self, status, spider):
+        '''
+        Requests with status from previous runs: failed ones for a retry pass,
+        or pending ones, followed in previous runs but never completed.
+        '''
+        for url, callback in self.get_frontier(spider).get_urls(status):
+            if url not in self.requested:
+                yield self.add_request(Request(url, callback=getattr(spider, callback)), spider)
+
+    def process_spider_output(self, response, result, spider):
+        for x in result:
+            if self.filter_output(x, spider):
+                yield x
+        self.response_done(response, spider)
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for x in result:
+            if self.filter_output(x, spider):
+                yield x
+        self.response_done(response, spider)
+
+    def filter_output(self, x, spider):
+        '''
+        False for requests already done (or failed, out of a retry pass).
+        '''
+        if isinstance(x, Request):
+            if not self.is_on_site(x, spider):
+                return True
+            status = self.get_frontier(spider).get_status(x.url)
+            if status == DONE or (status == FAILED and not self.retry):
+                return False
+            self.add_request(x, spider)
+        return True
+
+    def response_done(self, response, spider):
+        # The callback is done once all its output is consumed.
+        frontier = self.get_frontier(spider)
+        for url in self.get_request_urls(response):
+            frontier.set_status(url, DONE)
+        frontier.commit()
+
+    def process_spider_exception(self, response, exception, spider):
+        frontier = self.get_frontier(spider)
+        for url in self.get_request_urls(response):
+            frontier.set_status(url, FAILED)
+        frontier.commit()
+        return None
+
+
+    def add_request(self, request, spider):
+        if request.callback is None:
+            callback = 'parse'
+        else:
+            callback = request.callback.__name__
+
+        # Download (and HTTP) errors never reach the spider middlewares.
+        if request.errback is None:
+            request.errback = partial(self.request_failed, request.url, spider)
+
+        self.get_frontier(spider).add(request.url, callback)
+        self.requested.add(request.url)
+        return request
+
+    def is_on_site(self, request, spider):
+        # Same rule as the OffsiteMiddleware, which drops the others silently.
+        allowed_domains = getattr(spider, 'allowed_domains', None)
+        if not allowed_domains or request.dont_filter or request.meta.get('allow_offsite'):
+            return True
+        return url_is_from_any_domain(request.url, allowed_domains)
+
+    def request_failed(self, url, spider, failure):
+        frontier = self.get_frontier(spider)
+        if failure.check(IgnoreRequest):
+            spider.logger.info('Request ignored, marked done: {} ({})'.format(
+                                url, failure.getErrorMessage()))
+            frontier.set_status(url, DONE)
+        else:
+            spider.logger.error('Request failed, kept for a retry pass: {} ({})'.format(
+                                    url, failure.getErrorMessage()))
+            frontier.set_status(url, FAILED)
+        frontier.commit()
+
+    def request_scheduled(self, request, spider):
+        self.scheduled[request.url] += 1
+
+    def request_dropped(self, request, spider):
+        '''
+        Duplicates of a request with another URL (e.g. a #fragment) are never
+        crawled: marked done, unless a request of the same URL was scheduled.
+        '''
+        self.scheduled[request.url] -= 1
+        if self.scheduled[request.url] > 0:
+            return
+        frontier = self.get_frontier(spider)
+        if frontier.get_status(request.url) == PENDING:
+            frontier.set_status(request.url, DONE)
+            frontier.commit()
+
+    def get_request_urls(self, response):
+        # Redirected requests are recorded under their original URL.
+        return response.meta.get('redirect_urls', []) + [response.request.url]
+
+
+class InstrumentationMiddleware:
+    '''
+    Times every spider callback (INSTRUMENTATION_ENABLED or METRICS_ENABLED)
+    and sends the response_parsed signal with the time spent, items and rows
+    produced, which the CrawlReport and MetricsServer extensions aggregate.
+
+    A sample of the responses (PROFILE_SAMPLE_RATE, 0 to 1) is also profiled
+    with PROFILE_BACKEND (cprofile or pyinstrument); the profiles of each
+    callback are written to INSTRUMENTATION_REPORT_DIR when the spider closes.
+    '''
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.dir = crawler.settings.get('INSTRUMENTATION_REPORT_DIR')
+        self.sample_rate = crawler.settings.getfloat('PROFILE_SAMPLE_RATE')
+        self.backend = crawler.settings.get('PROFILE_BACKEND')
+
+        self.profilers = {}  # callback name -> profiler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not (crawler.settings.getbool('INSTRUMENTATION_ENABLED')
+                or crawler.settings.getbool('METRICS_ENABLED')):
+            raise NotConfigured
+
+        s = cls(crawler)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def spider_closed(self, spider):
+        if not self.profilers:
+            return
+
+        os.makedirs(self.dir, exist_ok=True)
+        for callback, profiler in self.profilers.items():
+            path = '{}/{}-{}'.format(self.dir, spider.name, callback)
+            try:
+                if self.backend == 'pyinstrument':
+                    with open(path + '.html', mode='w', encoding='utf-8') as f:
+                        f.write(profiler.output_html())
+                else:
+                    profiler.dump_stats(path + '.prof')
+            except Exception:
+                spider.logger.error("Error writing to {}.".format(path))
+        spider.logger.info('Profiles written to {}'.format(self.dir))
+
+
+    def process_spider_output(self, response, result, spider):
+        callback = self.get_callback_name(response, spider)
+        profiler = self.get_profiler(callback, spider)
+        totals = {'seconds': 0, 'items': 0, 'rows': 0}
+
+        # Only the time spent producing the output is measured, not the time
+        # spent by the other middlewares and the engine consuming it.
+        result = iter(result)
+        while True:
+            start = self.start(profiler)
+            try:
+                x = next(result)
+            except StopIteration:
+                break
+            finally:
+                self.stop(profiler, start, totals)
+            yield self.count(x, totals)
+
+        self.report(response, spider, callback, totals)
+
+    async def process_spider_output_async(self, response, result, spider):
+        # Same as process_spider_output, for asynchronous callbacks output.
+        callback = self.get_callback_name(response, spider)
+        profiler = self.get_profiler(callback, spider)
+        totals = {'seconds': 0, 'items': 0, 'rows': 0}
+
+        result = result.__aiter__()
+        while True:
+            start = self.start(profiler)
+            try:
+                x = await result.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                self.stop(profiler, start, totals)
+            yield self.count(x, totals)
+
+        self.report(response, spider, callback, totals)
+
+
+    def start(self, profiler):
+        if profiler is not None:
+            self.start_profiler(profiler)
+        return time.perf_counter()
+
+    def stop(self, profiler, start, totals):
+        totals['seconds'] += time.perf_counter() - start
+        if profiler is not None:
+            self.stop_profiler(profiler)
+
+    def count(self, x, totals):
+        if isinstance(x, dict):
+            totals['items'] += 1
+            totals['rows'] += count_rows(x)
+        return x
+
+    def report(self, response, spider, callback, totals):
+        self.crawler.stats.inc_value('instrumentation/callback_seconds/{}'.format(callback),
+                                     totals['seconds'])
+        self.crawler.signals.send_catch_log(signal=response_parsed, response=response, spider=spider,
+                                            callback=callback, **totals)
+
+
+    def get_callback_name(self, response, spider):
+        callback = response.request.callback
+        if callback is None:
+            return 'parse'
+        return getattr(callback, '__name__', str(callback))
+
+    def get_profiler(self, callback, spider):
+        '''
+        Profiler of callback, if this response is sampled.
+        '''
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return None
+
+        if callback not in self.profilers:
+            if self.backend == 'pyinstrument':
+                if pyinstrument is None:
+                    spider.logger.error('PROFILE_BACKEND pyinstrument is not installed.')
+                    self.sample_rate = 0
+                    return None
+                self.profilers[callback] = pyinstrument.Profiler()
+            else:
+                self.profilers[callback] = cProfile.Profile()
+        return self.profilers[callback]
+
+    def start_profiler(self, profiler):
+        if self.backend == 'pyinstrument':
+            profiler.start()
+        else:
+            profiler.enable()
+
+    def stop_profiler(self, profiler):
+        if self.backend == 'pyinstrument':
+            profiler.stop()
+        else:
+            profiler.disable()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+# Regular expressions and XPath queries of the spiders, compiled once.
+#
+# The XPath objects run on lxml elements (response.selector.root, or the
+# .root of any selector) and return lists, like Selector.xpath().getall().
+# Links are filtered in the XPath queries with EXSLT regular expressions
+# (re:test). lxml runs re:test as a Python callback per href, so these only
+# save building the selectors of the links, not the regex calls.
+
+import re
+from lxml import etree
+
+NAMESPACES = {'re': 'http://exslt.org/regular-expressions'}
+
+# URLs
+GAME_ID_RE = re.compile(r"/([\dA-Z]*)?.html")  # game and shot chart pages
+PLAYER_ID_RE = re.compile(r"/([a-z\d]*)?.html")
+SCHEDULE_URL_RE = re.compile(r"/NBA_([0-9]{4})?_games-([a-z]*)?.html")  # season, month
+PLAYOFF_SCHEDULE_URL_RE = re.compile(r"/NBA_([0-9]{4})?_games.html")  # season
+
+# Element ids, e.g. box-BRK-game-basic, shots-BRK
+BOX_TABLE_ID_RE = re.compile(r'box-([A-Z]{3})-(.*-.*)')  # team id, box type
+SHOTS_DIV_ID_RE = re.compile(r"shots-([A-Z]{3})")
+
+# Shot chart attributes, e.g.
+#   tip="1st quarter, 11:40.0 remaining<br>... missed 2-pointer from 4 ft<br>..."
+#   class="tooltip p-hardeja01 make"  style="top:71px;left:238px;"
+QUARTER_RE = re.compile(r'([\w\s]+),')
+PLAYER_RE = re.compile(r' p-([a-z]{1,7}[\d]{2}) ')
+LEFT_RE = re.compile(r'left:([\d]*)px')
+TOP_RE = re.compile(r'top:([\d]*)px')
+
+
+# Links
+GAME_LINKS = etree.XPath(
+    r'//a/@href[re:test(., "^/boxscores/[0-9]{9}[A-Z]{3}\.html")]', namespaces=NAMESPACES)
+SHOT_CHART_LINKS = etree.XPath(
+    r'//a/@href[re:test(., "^/boxscores/shot-chart/[0-9]{9}[A-Z]{3}\.html")]', namespaces=NAMESPACES)
+PLAYER_LINKS = etree.XPath(
+    r'//a/@href[re:test(., "^/players/[a-z]/[a-z]{7}[0-9]{2}\.html")]', namespaces=NAMESPACES)
+
+# Tables
+SCHEDULE_ROWS = etree.XPath('//table[@id="schedule"]//tbody//tr[not(contains(@class, "thead"))]')
+PLAYERS_ROWS = etree.XPath('//table[@id="players"]//tbody//tr[not(contains(@class, "thead"))]')
+BOX_TABLES = etree.XPath('//table[starts-with(@id, "box-")]')
+SHOTS_DIVS = etree.XPath('//div[starts-with(@id, "shots-")]')
+BODY_ROWS = etree.XPath('tbody//tr[not(contains(@class, "thead"))]')
+CELLS = etree.XPath('th | td')
+
+# Status lines under the scores of a box score page: "Final" (or "Final/OT")
+# once the game is over, the quarter and clock while it is played.
+GAME_STATUS = etree.XPath('//div[@class="scorebox_meta"]/div/text()')
+
+# Cells (stat: the data-stat attribute)
+STAT_TEXT = etree.XPath('.//*[@data-stat=$stat]//text()')
+STAT_CSK = etree.XPath('.//*[@data-stat=$stat]//@csk')
+LINKS = etree.XPath('a')
+DESCENDANT_LINKS = etree.XPath('.//a')
+LINK_TEXT = etree.XPath('.//a/text()')
+LINK_HREF = etree.XPath('.//a/@href')
+TEXT = etree.XPath('text()')
+
+
+def first(results):
+    '''
+    First result of an XPath query as a plain string (like .get()), or None.
+    '''
+    if results:
+        return str(results[0])
+    return None
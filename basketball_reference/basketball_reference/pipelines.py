@@ -5,58 +5,890 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
-import os
-import csv, json
-from scrapy.utils.project import get_project_settings
-# usage: https://stackoverflow.com/questions/14075941/how-to-access-scrapy-settings-from-item-pipeline
-# > settings = get_project_settings()
-# > settings.get('USER_AGENT')
+import os, re, io, time, uuid, threading
+import csv, json, sqlite3, hashlib
+from collections import OrderedDict, Counter
+from datetime import datetime
+from scrapy.exceptions import NotConfigured
+from twisted.internet import defer, threads
+from twisted.python import threadable
+from twisted.python.failure import Failure
+from twisted.python.threadpool import ThreadPool
+
+from basketball_reference.schemas import convert_entry, get_column_type
+from basketball_reference.signals import item_written
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+# Settings are loaded once in open_spider from spider.settings, which also
+# include the -s command line overrides.
+
+def count_rows(item):
+    if isinstance(item['data'], dict):  # player tables
+        return sum(len(rows) for rows in item['data'].values())
+    return len(item['data'])
+
+def report_item_written(spider, pipeline, item, start):
+    '''
+    Counts the rows written by pipeline and sends the item_written signal.
+    '''
+    crawler = getattr(spider, 'crawler', None)
+    if crawler is None:
+        return
+    name = type(pipeline).__name__
+    rows = count_rows(item)
+    crawler.stats.inc_value('{}/rows_written/{}'.format(name, item['type']), rows)
+    crawler.signals.send_catch_log(signal=item_written, item=item, spider=spider, pipeline=name,
+                                   seconds=time.perf_counter() - start, rows=rows)
+
+def report_bytes_written(spider, pipeline, item_type, size):
+    inc_stat(spider, '{}/bytes_written/{}'.format(type(pipeline).__name__, item_type), size)
+
+def inc_stat(spider, key, count=1):
+    crawler = getattr(spider, 'crawler', None)
+    if crawler is None:
+        return
+    # Stats are only updated from the reactor thread (see ThreadedWriterPipeline).
+    if threadable.isInIOThread():
+        crawler.stats.inc_value(key, count)
+    else:
+        from twisted.internet import reactor
+        reactor.callFromThread(crawler.stats.inc_value, key, count)
+
+def write_atomic(path, data):
+    '''
+    Writes data (bytes) to a temporary file renamed to path, so readers
+    never see a partially written file.
+    '''
+    tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+    with open(tmp_path, mode='wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def get_manifest_entry(file_name, digest=None):
+    '''
+    Delta manifest entry of a file: [sha1, size, mtime (ns)]. The SHA-1 is
+    computed if not given.
+    '''
+    if digest is None:
+        with open(file_name, mode='rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+    stat = os.stat(file_name)
+    return [digest, stat.st_size, stat.st_mtime_ns]
+
+def get_file_hash(manifest, file_name, key):
+    '''
+    SHA-1 of the file on disk: from the manifest if its size and mtime are
+    the recorded ones, otherwise computed (files written before the manifest
+    existed, or since rewritten without DELTA_ENABLED, by a shard merge or by
+    hand) and recorded. None if there is no file.
+    '''
+    if not os.path.exists(file_name):
+        return None
+    entry = manifest.get(key)
+    stat = os.stat(file_name)
+    if isinstance(entry, list) and entry[1:] == [stat.st_size, stat.st_mtime_ns]:
+        return entry[0]
+    manifest[key] = get_manifest_entry(file_name)
+    return manifest[key][0]
+
 
 class BasketballReferencePipeline:
+    '''
+    Writes one CSV (or JSON, for players) file per item.
+
+    With DELTA_ENABLED, files whose content did not change are not written
+    again, so their mtime is kept. The SHA-1, size and mtime of every file
+    are kept in OUTPUT_DIR/.delta/manifest.json (a file whose size or mtime
+    changed since is hashed again), and the files added or modified by each
+    crawl are listed in OUTPUT_DIR/.delta/changes/<spider>-<time>.json.
+
+    Stream items (see items.py) are appended to a temporary file, renamed to
+    the output file on the end item of the file.
+    '''
+    def open_spider(self, spider):
+        self.output_dir = spider.settings.get('OUTPUT_DIR')
+        self.delta = spider.settings.getbool('DELTA_ENABLED')
+
+        self.manifest = {}  # file path (relative to OUTPUT_DIR) -> sha1
+        self.changes = {}  # file path -> 'added' or 'modified'
+        self.streams = {}  # file path -> [temporary file, sha1, temporary path, size]
+        self.manifest_path = '{}/.delta/manifest.json'.format(self.output_dir)
+        if self.delta and os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        self.manifest_lock = threading.Lock()  # files are also written by ThreadedWriterPipeline threads
+
+    def close_spider(self, spider):
+        # Files not completed (e.g. the crawl was interrupted) are dropped.
+        for file_name in list(self.streams):
+            spider.logger.warning("Incomplete file {} not written.".format(file_name))
+            f, sha1, tmp_path, size = self.streams.pop(file_name)
+            f.close()
+            os.remove(tmp_path)
+
+        if not self.delta:
+            return
+
+        os.makedirs('{}/.delta/changes'.format(self.output_dir), exist_ok=True)
+        write_atomic(self.manifest_path, json.dumps(self.manifest, sort_keys=True).encode('utf-8'))
+
+        if self.changes:
+            changes_path = '{}/.delta/changes/{}-{}.json'.format(
+                self.output_dir, spider.name, datetime.now().strftime('%Y%m%d-%H%M%S'))
+            with open(changes_path, mode='w', encoding='utf-8') as f:
+                json.dump(self.changes, f, indent=1, sort_keys=True)
+        spider.logger.info('Delta: {} files added or modified.'.format(len(self.changes)))
+
     def process_item(self, item, spider):
-        if item['type'] in ['boxscore', 'player_list', 'schedule', 'shot']:
+        start = time.perf_counter()
+        self.write_item(item, spider)
+        report_item_written(spider, self, item, start)
+        return item
+
+    def write_item(self, item, spider):
+        if item.get('stream'):
+            self.store_item_stream(item, spider)
+            return
+
+        if item['type'] in ['boxscore', 'boxscore_update', 'player_list', 'schedule', 'shot']:
             self.store_item_csv(item, spider)
 
         if item['type'] in ['player']:
             self.store_item_json(item, spider)
-        return None
 
     
     def store_item_csv(self, item, spider):
-        settings = get_project_settings()
-        output_dir = settings.get('OUTPUT_DIR')
-
-        dir_path = '{}/{}'.format(output_dir, item['dir'])
+        dir_path = '{}/{}'.format(self.output_dir, item['dir'])
         os.makedirs(dir_path, exist_ok=True)
 
         file_name = '{}/{}.csv'.format(dir_path, item['file_name'])
 
         try:
-            f = open(file_name, mode='w', encoding='utf-8', newline='\n')
+            f = io.StringIO(newline='\n')
             writer = csv.DictWriter(f, fieldnames=item['fieldnames'], 
                                     extrasaction='ignore', lineterminator='\n')
             writer.writeheader()
             for entry in item['data']:  
                 writer.writerow(entry)
-            f.close()
+            self.write_file(file_name, f.getvalue(), item, spider)
         except:
             spider.logger.error("Error writing to {}.".format(file_name))
 
 
 
     def store_item_json(self, item, spider):
-        settings = get_project_settings()
-        output_dir = settings.get('OUTPUT_DIR')
-
-        dir_path = '{}/{}'.format(output_dir, item['dir'])
+        dir_path = '{}/{}'.format(self.output_dir, item['dir'])
         os.makedirs(dir_path, exist_ok=True)
 
         file_name = '{}/{}.json'.format(dir_path, item['file_name'])
 
         try:
-            f = open(file_name, mode='w', encoding='utf-8', newline='\n')
-            json.dump(item['data'], f, ensure_ascii=False)
-            f.close()
+            self.write_file(file_name, json.dumps(item['data'], ensure_ascii=False), item, spider)
         except:
             spider.logger.error("Error writing to {}.".format(file_name))
-            
+
+
+    def store_item_stream(self, item, spider):
+        '''
+        Appends the rows of a stream item to its file. The files are written
+        exactly like store_item_csv and store_item_json would.
+        '''
+        extension = 'json' if item['type'] == 'player' else 'csv'
+        file_name = '{}/{}/{}.{}'.format(self.output_dir, item['dir'], item['file_name'], extension)
+
+        try:
+            if item.get('end'):
+                self.close_stream(file_name, item, spider)
+                return
+
+            if file_name in self.streams:
+                stream = self.streams[file_name]
+                separator = ', '
+            else:
+                stream = self.open_stream(file_name)
+                separator = '{'
+
+            if extension == 'csv':
+                f = io.StringIO(newline='\n')
+                writer = csv.DictWriter(f, fieldnames=item['fieldnames'],
+                                        extrasaction='ignore', lineterminator='\n')
+                if separator == '{':
+                    writer.writeheader()
+                writer.writerows(item['data'])
+                text = f.getvalue()
+            else:
+                # {"<table id>": [rows], ...}, as json.dumps of the whole dict
+                text = ''.join('{}{}: {}'.format(separator if i == 0 else ', ', json.dumps(table_id),
+                                                  json.dumps(entries, ensure_ascii=False))
+                               for i, (table_id, entries) in enumerate(item['data'].items()))
+            self.write_stream(stream, text)
+        except:
+            spider.logger.error("Error writing to {}.".format(file_name))
+
+    def open_stream(self, file_name):
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        tmp_path = '{}.{}.{}.tmp'.format(file_name, os.getpid(), threading.get_ident())
+        self.streams[file_name] = [open(tmp_path, mode='wb'), hashlib.sha1(), tmp_path, 0]
+        return self.streams[file_name]
+
+    def write_stream(self, stream, text):
+        data = text.encode('utf-8')
+        stream[0].write(data)
+        stream[1].update(data)
+        stream[3] += len(data)
+
+    def close_stream(self, file_name, item, spider):
+        if file_name not in self.streams:  # no rows
+            return
+        stream = self.streams.pop(file_name)
+        if item['type'] == 'player':
+            self.write_stream(stream, '}')
+
+        f, sha1, tmp_path, size = stream
+        f.close()
+        if self.is_unchanged(file_name, sha1.hexdigest(), item, spider):
+            os.remove(tmp_path)
+            return
+        os.replace(tmp_path, file_name)
+        self.record_written(file_name, sha1.hexdigest())
+        report_bytes_written(spider, self, item['type'], size)
+
+
+    def write_file(self, file_name, text, item, spider):
+        data = text.encode('utf-8')
+        digest = hashlib.sha1(data).hexdigest()
+
+        if self.is_unchanged(file_name, digest, item, spider):
+            return
+
+        write_atomic(file_name, data)
+        self.record_written(file_name, digest)
+        report_bytes_written(spider, self, item['type'], len(data))
+
+    def is_unchanged(self, file_name, digest, item, spider):
+        '''
+        With DELTA_ENABLED, True if the stored file has the same SHA-1.
+        Otherwise the new file is recorded in the changes.
+        '''
+        if not self.delta:
+            return False
+
+        key = os.path.relpath(file_name, self.output_dir)
+        with self.manifest_lock:
+            previous = get_file_hash(self.manifest, file_name, key)
+            if digest == previous:
+                inc_stat(spider, 'delta/unchanged/{}'.format(item['type']))
+                return True
+            self.changes[key] = 'modified' if previous else 'added'
+        inc_stat(spider, 'delta/changed/{}'.format(item['type']))
+        return False
+
+    def record_written(self, file_name, digest):
+        if not self.delta:
+            return
+        key = os.path.relpath(file_name, self.output_dir)
+        entry = get_manifest_entry(file_name, digest)
+        with self.manifest_lock:
+            self.manifest[key] = entry
+
+
+class CsvWriterPipeline(BasketballReferencePipeline):
+    '''
+    Streaming CSV writer. Keeps an LRU pool of open writers keyed by output
+    file (CSV_WRITER_POOL_SIZE) and writes rows in batches
+    (CSV_WRITER_BATCH_SIZE).
+
+    With CSV_CONSOLIDATE, box score and shot rows are appended to one file
+    per season and box type (e.g. games/boxscores/basic/2021.csv) instead of
+    one file per game. When the spider closes, only the last write of each
+    game is kept: rows stored by previous crawls for the games written again,
+    and earlier writes of the games written twice in this crawl, are dropped.
+    A stored file with other columns is rewritten with the current ones
+    first (plus the stored columns no longer written, left empty).
+
+    CSV rows are streamed, so DELTA_ENABLED only applies to the player JSON
+    files. The rows of stream items go to the same writers.
+    '''
+    CONSOLIDATE_TYPES = ['boxscore', 'shot']
+
+    def open_spider(self, spider):
+        super().open_spider(spider)
+        self.pool_size = spider.settings.getint('CSV_WRITER_POOL_SIZE')
+        self.batch_size = spider.settings.getint('CSV_WRITER_BATCH_SIZE')
+        self.consolidate = spider.settings.getbool('CSV_CONSOLIDATE')
+
+        self.writers = OrderedDict()  # file name -> [file, csv writer, pending rows, item type]
+        self.opened = set()  # files opened (and truncated) during this crawl
+        self.headers = {}  # consolidated file -> columns written
+        self.dirs = set()
+        # consolidated file -> [size before this crawl, stored game ids, game ids written again]
+        self.stored = {}
+        # consolidated file -> {game id: [rows of its last write, write complete]}
+        self.written = {}
+        self.repeated = {}  # consolidated file -> game ids written twice in this crawl
+
+    def close_spider(self, spider):
+        while self.writers:
+            self.close_writer(spider)
+        for file_name in set(self.stored) | set(self.repeated):
+            size, stored_games, replaced_games = self.stored.get(file_name, [0, set(), set()])
+            repeats = {x: self.written[file_name][x][0] for x in self.repeated.get(file_name, [])}
+            if replaced_games or repeats:
+                self.drop_stored_rows(file_name, size, replaced_games, spider, repeats)
+        super().close_spider(spider)
+
+
+    def store_item_csv(self, item, spider):
+        append = self.consolidate and item['type'] in self.CONSOLIDATE_TYPES
+        if append:
+            file_name = '{}/{}.csv'.format(self.output_dir, item['dir'])
+        else:
+            file_name = '{}/{}/{}.csv'.format(self.output_dir, item['dir'], item['file_name'])
+
+        try:
+            writer = self.get_writer(file_name, item['fieldnames'], append, spider)
+            if file_name in self.stored:
+                size, stored_games, replaced_games = self.stored[file_name]
+                replaced_games.update(x.get('game_id') for x in item['data'] if x.get('game_id') in stored_games)
+            if append:
+                self.track_game_rows(file_name, item)
+            writer[2].extend(item['data'])
+            writer[3] = item['type']
+            if len(writer[2]) >= self.batch_size:
+                self.flush_writer(writer, spider)
+        except Exception:
+            spider.logger.error("Error writing to {}.".format(file_name))
+
+
+    def store_item_stream(self, item, spider):
+        if item['type'] == 'player':
+            super().store_item_stream(item, spider)
+        elif not item.get('end'):
+            self.store_item_csv(item, spider)
+        elif self.consolidate and item['type'] in self.CONSOLIDATE_TYPES:
+            # e.g. games/boxscores/basic/2021 and 01010BOS
+            game_id = os.path.basename(item['dir']) + item['file_name']
+            file_name = '{}/{}.csv'.format(self.output_dir, item['dir'])
+            if game_id in self.written.get(file_name, {}):
+                self.written[file_name][game_id][1] = True
+
+    def track_game_rows(self, file_name, item):
+        '''
+        Counts the rows of the current write of each game of a consolidated
+        file. A game written again once a write is complete (a whole item,
+        or the end item of a stream) is recorded as repeated.
+        '''
+        written = self.written.setdefault(file_name, {})
+        for game_id, rows in Counter(x.get('game_id') for x in item['data']).items():
+            last = written.get(game_id)
+            if last is not None and not last[1]:
+                last[0] += rows
+                continue
+            if last is not None:
+                self.repeated.setdefault(file_name, set()).add(game_id)
+            written[game_id] = [rows, not item.get('stream')]
+
+
+    def get_writer(self, file_name, fieldnames, append, spider):
+        if file_name in self.writers:
+            self.writers.move_to_end(file_name)
+            return self.writers[file_name]
+
+        while len(self.writers) >= self.pool_size:
+            self.close_writer(spider)
+
+        dir_path = os.path.dirname(file_name)
+        if dir_path not in self.dirs:
+            os.makedirs(dir_path, exist_ok=True)
+            self.dirs.add(dir_path)
+
+        # Per-game files are rewritten on their first write of the crawl,
+        # consolidated files are always appended to.
+        if file_name in self.opened or append:
+            mode = 'a'
+        else:
+            mode = 'w'
+        if append and file_name not in self.opened and os.path.exists(file_name):
+            fieldnames = self.check_header(file_name, fieldnames)
+            self.stored[file_name] = [os.path.getsize(file_name), self.get_stored_games(file_name), set()]
+        elif append and file_name in self.opened:
+            fieldnames = self.headers.get(file_name, fieldnames)
+        if append:
+            self.headers[file_name] = fieldnames
+        self.opened.add(file_name)
+
+        f = open(file_name, mode=mode, encoding='utf-8', newline='\n')
+        csv_writer = csv.DictWriter(f, fieldnames=fieldnames,
+                                    extrasaction='ignore', lineterminator='\n')
+        if f.tell() == 0:
+            csv_writer.writeheader()
+
+        self.writers[file_name] = [f, csv_writer, [], None]
+        return self.writers[file_name]
+
+    def check_header(self, file_name, fieldnames):
+        '''
+        Columns of a stored consolidated file: fieldnames, then the stored
+        columns not in fieldnames. The file is rewritten if its header differs.
+        '''
+        with open(file_name, encoding='utf-8', newline='') as f:
+            header = next(csv.reader(f), [])
+        columns = list(fieldnames) + [x for x in header if x not in fieldnames]
+        if columns == header:
+            return columns
+
+        with open(file_name, encoding='utf-8', newline='') as f:
+            text = io.StringIO(newline='\n')
+            writer = csv.DictWriter(text, fieldnames=columns, lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(csv.DictReader(f))
+        write_atomic(file_name, text.getvalue().encode('utf-8'))
+        return columns
+
+    def get_stored_games(self, file_name):
+        with open(file_name, encoding='utf-8', newline='') as f:
+            return set(row.get('game_id') for row in csv.DictReader(f))
+
+    def drop_stored_rows(self, file_name, size, games, spider, repeats=None):
+        '''
+        Rewrites a consolidated file without the rows of games stored before
+        this crawl (its first size bytes) and written again since. Of the
+        games written several times since, only the last rows are kept
+        (repeats: game id -> rows of its last write).
+        '''
+        try:
+            with open(file_name, mode='rb') as f:
+                stored = f.read(size).decode('utf-8')
+                new_rows = f.read()
+
+            reader = csv.reader(io.StringIO(stored, newline=''))
+            new_reader = csv.reader(io.StringIO(new_rows.decode('utf-8'), newline=''))
+            header = next(reader, None) or next(new_reader)
+            column = header.index('game_id')
+            text = io.StringIO(newline='\n')
+            writer = csv.writer(text, lineterminator='\n')
+            writer.writerow(header)
+            writer.writerows(row for row in reader if row[column] not in games)
+            if not repeats:
+                write_atomic(file_name, text.getvalue().encode('utf-8') + new_rows)
+                return
+
+            rows = list(new_reader)
+            kept = Counter()
+            keep = []
+            for row in reversed(rows):
+                game_id = row[column]
+                if game_id in repeats:
+                    kept[game_id] += 1
+                    if kept[game_id] > repeats[game_id]:
+                        continue
+                keep.append(row)
+            writer.writerows(reversed(keep))
+            write_atomic(file_name, text.getvalue().encode('utf-8'))
+        except Exception:
+            spider.logger.error("Error writing to {}.".format(file_name))
+
+    def flush_writer(self, writer, spider):
+        f, csv_writer, rows, item_type = writer
+        position = f.tell()
+        csv_writer.writerows(rows)
+        rows.clear()
+        report_bytes_written(spider, self, item_type, f.tell() - position)
+
+    def close_writer(self, spider):
+        '''
+        Flushes and closes the least recently used writer.
+        '''
+        file_name, writer = self.writers.popitem(last=False)
+        try:
+            self.flush_writer(writer, spider)
+        except Exception:
+            spider.logger.error("Error writing to {}.".format(file_name))
+        finally:
+            writer[0].close()
+
+
+class ThreadedWriterPipeline(BasketballReferencePipeline):
+    '''
+    Writes the files of BasketballReferencePipeline in a pool of
+    WRITER_THREADS threads, so slow disks do not block the reactor (and the
+    downloads). At most WRITER_QUEUE_SIZE items are being written at once:
+    when the queue is full, process_item waits for a slot, which holds the
+    engine back. Pending writes are flushed in close_spider.
+
+    Writes of the same file are serialized: an item whose file is being
+    written waits for that write to finish, so the last item of a file wins.
+
+    Stream items are small and must be appended in order: they are written
+    right away, in the reactor thread.
+    '''
+
+    def open_spider(self, spider):
+        super().open_spider(spider)
+        self.pool = ThreadPool(minthreads=1, maxthreads=spider.settings.getint('WRITER_THREADS'),
+                               name='writers')
+        self.pool.start()
+        self.semaphore = defer.DeferredSemaphore(spider.settings.getint('WRITER_QUEUE_SIZE'))
+        self.pending = set()
+        self.queues = {}  # (dir, file name) being written -> items waiting for it
+
+    def close_spider(self, spider):
+        d = defer.DeferredList(list(self.pending))
+        d.addCallback(self.finish, spider)
+        return d
+
+    def finish(self, result, spider):
+        # Queued writes were started meanwhile.
+        if self.pending:
+            return self.close_spider(spider)
+        self.pool.stop()
+        super().close_spider(spider)
+
+
+    def process_item(self, item, spider):
+        if item.get('stream'):
+            return super().process_item(item, spider)
+
+        d = self.semaphore.acquire()
+        d.addCallback(self.start_write, item, spider)
+        return d
+
+    def start_write(self, semaphore, item, spider):
+        key = (item['dir'], item['file_name'])
+        if key in self.queues:
+            self.queues[key].append(item)
+        else:
+            self.queues[key] = []
+            self.write_in_pool(key, item, spider)
+        return item
+
+    def write_in_pool(self, key, item, spider):
+        start = time.perf_counter()
+        from twisted.internet import reactor
+        d = threads.deferToThreadPool(reactor, self.pool, self.write_item, item, spider)
+        self.pending.add(d)
+        d.addBoth(self.write_done, d, key, item, spider, start)
+
+    def write_done(self, result, d, key, item, spider, start):
+        # Back in the reactor thread.
+        self.pending.discard(d)
+        self.semaphore.release()
+        if isinstance(result, Failure):
+            spider.logger.error("Error writing {} {}: {}".format(
+                                    item['type'], item['file_name'], result.getErrorMessage()))
+        else:
+            report_item_written(spider, self, item, start)
+
+        if self.queues[key]:
+            self.write_in_pool(key, self.queues[key].pop(0), spider)
+        else:
+            del self.queues[key]
+
+
+class ParquetPipeline:
+    '''
+    Writes boxscore, shot and schedule rows as typed Parquet datasets under
+    OUTPUT_DIR/parquet, partitioned like the CSV directories:
+
+        parquet/boxscores/year=<year>/box_type=<basic|advanced>/part-*.parquet
+        parquet/shots/year=<year>/part-*.parquet
+        parquet/schedule/kind=<games|playoffs>/season=<season>/part-*.parquet
+
+    Rows are buffered per partition (PARQUET_BATCH_SIZE) and each batch is
+    written as a new part file. Rows of re-scraped games are removed from
+    the part files of previous crawls (only those holding them are
+    rewritten). Needs pyarrow.
+    '''
+    TYPES = ['boxscore', 'shot', 'schedule']
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if pa is None:
+            raise NotConfigured('ParquetPipeline needs pyarrow installed.')
+        return cls()
+
+    def open_spider(self, spider):
+        self.output_dir = '{}/parquet'.format(spider.settings.get('OUTPUT_DIR'))
+        self.batch_size = spider.settings.getint('PARQUET_BATCH_SIZE')
+        self.buffers = {}  # partition path -> [fieldnames, typed rows]
+        self.stored = {}  # partition path -> {part file of previous crawls: game ids}
+        self.crawl_id = '{}-{}'.format(datetime.now().strftime('%Y%m%d%H%M%S'), uuid.uuid4().hex[:8])
+        self.parts = 0
+
+    def close_spider(self, spider):
+        for path in list(self.buffers):
+            self.write_partition(path, spider)
+
+    def process_item(self, item, spider):
+        # End items of stream items (see items.py) have no rows.
+        if item['type'] in self.TYPES and not item.get('end'):
+            start = time.perf_counter()
+            path = self.get_partition_path(item)
+            if path not in self.buffers:
+                self.buffers[path] = [item['fieldnames'], []]
+
+            fieldnames, rows = self.buffers[path]
+            for entry in item['data']:
+                rows.append(convert_entry(entry, fieldnames))
+
+            if len(rows) >= self.batch_size:
+                self.write_partition(path, spider)
+            report_item_written(spider, self, item, start)
+        return item
+
+
+    def get_partition_path(self, item):
+        dirs = item['dir'].split('/')
+        if item['type'] == 'boxscore':  # games/boxscores/<box type>/<year>
+            partition = 'boxscores/year={}/box_type={}'.format(dirs[3], dirs[2])
+        elif item['type'] == 'shot':  # games/shots/<year>
+            partition = 'shots/year={}'.format(dirs[2])
+        else:  # schedule/<kind>, files named <season>[_<month>]
+            season = str(item['file_name']).split('_')[0]
+            partition = 'schedule/kind={}/season={}'.format(dirs[1], season)
+        return '{}/{}'.format(self.output_dir, partition)
+
+    def get_schema(self, fieldnames):
+        arrow_types = {
+            'int': pa.int64(),
+            'float': pa.float64(),
+            'bool': pa.bool_(),
+            'str': pa.string(),
+        }
+        return pa.schema([(key, arrow_types[get_column_type(key)]) for key in fieldnames])
+
+    def write_partition(self, path, spider):
+        '''
+        Writes the buffered rows of a partition as a new part file.
+        '''
+        fieldnames, rows = self.buffers.pop(path)
+        file_name = '{}/part-{}-{:05d}.parquet'.format(path, self.crawl_id, self.parts)
+        self.parts += 1
+
+        try:
+            schema = self.get_schema(fieldnames)
+            columns = {}
+            for field in schema:
+                columns[field.name] = pa.array([row[field.name] for row in rows], 
+                                               type=field.type)
+            table = pa.table(columns, schema=schema)
+
+            os.makedirs(path, exist_ok=True)
+            self.drop_stored_games(path, set(table['game_id'].to_pylist()), schema)
+            pq.write_table(table, file_name + '.tmp')
+            os.replace(file_name + '.tmp', file_name)
+        except Exception:
+            spider.logger.error("Error writing to {}.".format(file_name))
+
+    def drop_stored_games(self, path, game_ids, schema):
+        '''
+        Removes the rows of game_ids from the part files written before this
+        crawl. The rows of a stream item game can span batches: the part
+        files of this crawl are left alone.
+        '''
+        if path not in self.stored:
+            self.stored[path] = {}
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.parquet'):
+                    part = '{}/{}'.format(path, name)
+                    stored = pq.read_table(part, columns=['game_id'])
+                    self.stored[path][part] = set(stored['game_id'].to_pylist())
+
+        for part, stored_games in list(self.stored[path].items()):
+            if not stored_games & game_ids:
+                continue
+            stored_games -= game_ids
+
+            stored = pq.read_table(part)
+            replaced = pc.is_in(stored['game_id'], value_set=pa.array(list(game_ids), type=pa.string()))
+            stored = self.align_table(stored.filter(pc.invert(replaced)), schema)
+            if stored.num_rows:
+                pq.write_table(stored, part + '.tmp')
+                os.replace(part + '.tmp', part)
+            else:
+                os.remove(part)
+                del self.stored[path][part]
+
+    def align_table(self, table, schema):
+        '''
+        Casts a stored table to schema, adding missing columns as nulls.
+        '''
+        columns = {}
+        for field in schema:
+            if field.name in table.column_names:
+                columns[field.name] = table[field.name].cast(field.type)
+            else:
+                columns[field.name] = pa.nulls(table.num_rows, type=field.type)
+        return pa.table(columns, schema=schema)
+
+
+class SQLitePipeline:
+    '''
+    Upserts the items into a local SQLite database (SQLITE_PATH), with one
+    table per item kind indexed on game_id, player_id, team_id and date:
+
+        schedule, boxscores_basic, boxscores_advanced, shots,
+        players (player lists), player_stats (player pages, rows as JSON)
+
+    Rows are inserted in batches (SQLITE_BATCH_SIZE), one transaction per
+    batch. Re-scraped games and players replace their stored rows (once per
+    crawl, as the rows of a stream item player can span batches), so rows
+    no longer in a corrected box score are dropped. Players without an id
+    are skipped.
+    '''
+    # table: primary key columns, or None to replace every row of the parent key
+    KEYS = {
+        'schedule': ['game_id'],
+        'boxscores_basic': ['game_id', 'team_id', 'box_type', 'pnum'],
+        'boxscores_advanced': ['game_id', 'team_id', 'box_type', 'pnum'],
+        'players': ['player_id'],
+        'shots': None,
+        'player_stats': None,
+    }
+    # Rows of these tables are replaced as a whole for each game (and box
+    # type) or player.
+    PARENT_KEYS = {
+        'boxscores_basic': ['game_id', 'box_type'],
+        'boxscores_advanced': ['game_id', 'box_type'],
+        'shots': ['game_id'],
+        'player_stats': ['player_id'],
+    }
+    INDEX_COLUMNS = ['game_id', 'player_id', 'team_id', 'date']
+    SQL_TYPES = {
+        'int': 'INTEGER',
+        'float': 'REAL',
+        'bool': 'INTEGER',
+        'str': 'TEXT',
+    }
+
+    def open_spider(self, spider):
+        self.path = spider.settings.get('SQLITE_PATH')
+        self.batch_size = spider.settings.getint('SQLITE_BATCH_SIZE')
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.columns = {}  # table -> columns
+        self.batches = {}  # table -> [rows, parent keys to replace]
+        self.replaced = {}  # table -> parent keys replaced during this crawl
+
+    def close_spider(self, spider):
+        for table in list(self.batches):
+            self.flush(table, spider)
+        self.conn.close()
+
+    def process_item(self, item, spider):
+        start = time.perf_counter()
+        if item['type'] == 'player':
+            self.add_player_stats(item, spider)
+        elif item['type'] in ['boxscore', 'player_list', 'schedule', 'shot']:
+            table = self.get_table_name(item)
+            fieldnames = item['fieldnames']
+            if table == 'shots':
+                fieldnames = ['shot_num'] + fieldnames
+
+            rows = []
+            for index, entry in enumerate(item['data']):
+                row = convert_entry(entry, fieldnames)
+                if table == 'shots':
+                    row['shot_num'] = index + 1
+                if table == 'players' and row['player_id'] is None and row['player_href']:
+                    row['player_id'] = re.search(r"/([a-z\d]*)?.html", row['player_href']).group(1)
+                if table == 'players' and row['player_id'] is None:
+                    spider.logger.warning('Player without id skipped: {}'.format(row.get('player')))
+                    continue
+                rows.append(row)
+            self.add_rows(table, fieldnames, rows, spider)
+        report_item_written(spider, self, item, start)
+        return item
+
+
+    def get_table_name(self, item):
+        if item['type'] == 'boxscore':  # games/boxscores/<box type>/<year>
+            return 'boxscores_{}'.format(item['dir'].split('/')[2])
+        if item['type'] == 'shot':
+            return 'shots'
+        if item['type'] == 'player_list':
+            return 'players'
+        return 'schedule'
+
+    def add_player_stats(self, item, spider):
+        fieldnames = ['player_id', 'table_id', 'row_num', 'season', 'team_id', 'data']
+        rows = []
+        for table_id, entries in item['data'].items():
+            for index, entry in enumerate(entries):
+                rows.append({
+                    'player_id': item['file_name'],
+                    'table_id': table_id,
+                    'row_num': index + 1,
+                    'season': entry.get('season'),
+                    'team_id': entry.get('team_id'),
+                    'data': json.dumps(entry, ensure_ascii=False),
+                })
+        self.add_rows('player_stats', fieldnames, rows, spider)
+
+    def add_rows(self, table, fieldnames, rows, spider):
+        if table not in self.columns:
+            self.create_table(table, fieldnames)
+        if table not in self.batches:
+            self.batches[table] = [[], set()]
+
+        batch_rows, parents = self.batches[table]
+        if table in self.PARENT_KEYS:
+            replaced = self.replaced.setdefault(table, set())
+            keys = set(tuple(row[x] for x in self.PARENT_KEYS[table]) for row in rows) - replaced
+            parents.update(keys)
+            replaced.update(keys)
+        batch_rows.extend(rows)
+
+        if len(batch_rows) >= self.batch_size:
+            self.flush(table, spider)
+
+
+    def create_table(self, table, fieldnames):
+        '''
+        Creates table if needed, adding the columns missing in an existing one.
+        '''
+        columns_sql = ['"{}" {}'.format(key, self.SQL_TYPES[get_column_type(key)])
+                            for key in fieldnames]
+        if self.KEYS[table]:
+            columns_sql.append('PRIMARY KEY ({})'.format(', '.join(self.KEYS[table])))
+
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS {} ({})'.format(table, ', '.join(columns_sql)))
+
+            stored = [x[1] for x in self.conn.execute('PRAGMA table_info({})'.format(table))]
+            for key in fieldnames:
+                if key not in stored:
+                    self.conn.execute('ALTER TABLE {} ADD COLUMN "{}" {}'.format(
+                                        table, key, self.SQL_TYPES[get_column_type(key)]))
+
+            for key in self.INDEX_COLUMNS:
+                if key in fieldnames:
+                    self.conn.execute('CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} ({1})'.format(table, key))
+
+        self.columns[table] = list(fieldnames)
+
+    def flush(self, table, spider):
+        rows, parents = self.batches.pop(table)
+        columns = self.columns[table]
+
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+                table, ', '.join('"{}"'.format(x) for x in columns), ', '.join('?' for x in columns))
+        if self.KEYS[table]:
+            updates = ['"{0}" = excluded."{0}"'.format(x) for x in columns if x not in self.KEYS[table]]
+            sql += ' ON CONFLICT ({}) DO UPDATE SET {}'.format(', '.join(self.KEYS[table]), ', '.join(updates))
+
+        try:
+            with self.conn:
+                if parents:
+                    where = ' AND '.join('"{}" = ?'.format(x) for x in self.PARENT_KEYS[table])
+                    self.conn.executemany('DELETE FROM {} WHERE {}'.format(table, where), list(parents))
+                self.conn.executemany(sql, [tuple(row.get(x) for x in columns) for row in rows])
+        except sqlite3.Error:
+            spider.logger.error("Error writing to {} ({}).".format(self.path, table))
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+# Compact row types of the scraped CSV items.
+#
+# Each record kind stores its fields in slots, with the field list built once
+# per class, instead of a fresh dict per row. Records behave like the dicts
+# the pipelines expect (get, [], keys, items). Fields not in FIELDS are
+# ignored on assignment, as the CSV writers do (extrasaction='ignore').
+
+from basketball_reference.schemas import get_converter
+
+
+class Record:
+    __slots__ = ()
+    FIELDS = []
+    DEFAULTS = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.FIELD_SET = frozenset(cls.FIELDS)
+        cls.CONVERTERS = [(key, get_converter(key)) for key in cls.FIELDS]
+
+    def __init__(self):
+        for key in self.FIELDS:
+            setattr(self, key, None)
+        for key, value in self.DEFAULTS.items():
+            setattr(self, key, value)
+
+    def __getitem__(self, key):
+        if key not in self.FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key in self.FIELD_SET:
+            setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.FIELD_SET
+
+    def __iter__(self):
+        return iter(self.FIELDS)
+
+    def __len__(self):
+        return len(self.FIELDS)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, self.as_dict())
+
+    def get(self, key, default=None):
+        if key not in self.FIELD_SET:
+            return default
+        return getattr(self, key)
+
+    def keys(self):
+        return self.FIELDS
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.FIELDS]
+
+    def as_dict(self):
+        return dict(self.items())
+
+    def convert(self):
+        '''
+        Converts the (string) values to the types of their columns, see schemas.py.
+        '''
+        for key, converter in self.CONVERTERS:
+            setattr(self, key, converter(getattr(self, key)))
+        return self
+
+
+class BasicBoxscoreRecord(Record):
+    FIELDS = [
+        "game_id",
+        "team_id",
+        "box_type",
+        "date", 
+        "ishome",
+        "pnum",
+        "player",
+        "player_href",
+        "player_csk",
+        "player_id",
+        "mp",
+        "sp",
+        "fg",
+        "fga",
+        "fg_pct",
+        "fg3",
+        "fg3a",
+        "fg3_pct",
+        "ft",
+        "fta",
+        "ft_pct",
+        "orb",
+        "drb",
+        "trb",
+        "ast",
+        "stl",
+        "blk",
+        "tov",
+        "pf",
+        "pts",
+        "plus_minus",
+        "reason",
+    ]
+    DEFAULTS = {'sp': 0, 'mp': 0}
+    __slots__ = FIELDS
+
+
+class AdvancedBoxscoreRecord(Record):
+    FIELDS = [
+        "game_id", 
+        "team_id", 
+        "box_type", 
+        "date",  
+        "ishome", 
+        "pnum", 
+        "player", 
+        "player_href", 
+        "player_csk", 
+        "player_id", 
+        "mp",
+        "sp",
+        "ts_pct", 
+        "efg_pct", 
+        "fg3a_per_fga_pct", 
+        "fta_per_fga_pct", 
+        "orb_pct", 
+        "drb_pct", 
+        "trb_pct", 
+        "ast_pct", 
+        "stl_pct", 
+        "blk_pct", 
+        "tov_pct", 
+        "usg_pct", 
+        "off_rtg", 
+        "def_rtg", 
+        "bpm", 
+        "reason",
+    ]
+    DEFAULTS = {'sp': 0, 'mp': 0}
+    __slots__ = FIELDS
+
+
+class GameRecord(Record):
+    FIELDS = [
+        "game_id",
+        "date",
+        "start_time",
+        "visitor_team",
+        "visitor_team_id",
+        "visitor_pts",
+        "home_team",
+        "home_team_id",
+        "home_pts",
+        "overtimes",
+        "attendance",
+        "game_remarks",
+    ]
+    __slots__ = FIELDS
+
+
+class ShotRecord(Record):
+    FIELDS = [
+        'game_id',
+        'team_id',
+        'player_id',
+        'quarter',
+        'make',
+        'points',
+        'x_px',
+        'y_px',
+        'distance_cm',
+        'angle_deg',
+        'zone',
+        'corner_three',
+    ]
+    __slots__ = FIELDS
+
+
+class PlayerListRecord(Record):
+    FIELDS = [
+        "player",
+        "player_href",
+        "player_id",
+        "year_min",
+        "year_max",
+        "pos",
+        "weight",
+        "height",
+        "height_csk",
+        "birth_date",
+        "birth_date_csk",
+        "colleges",
+    ]
+    __slots__ = FIELDS
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# Column types of the scraped rows, shared by the typed outputs (Parquet,
+# database). Columns not listed here are strings.
+
+import math
+
+INT_COLUMNS = {
+    # boxscores
+    "pnum", "sp", "fg", "fga", "fg3", "fg3a", "ft", "fta", "orb", "drb", "trb",
+    "ast", "stl", "blk", "tov", "pf", "pts", "plus_minus",
+    # schedules
+    "visitor_pts", "home_pts", "attendance",
+    # shots
+    "points", "x_px", "y_px", "distance_cm", "angle_deg",
+    # player lists
+    "year_min", "year_max", "weight", "height_csk", "birth_date_csk",
+    # database row numbers
+    "shot_num", "row_num",
+}
+
+FLOAT_COLUMNS = {
+    "fg_pct", "fg3_pct", "ft_pct", "ts_pct", "efg_pct", "fg3a_per_fga_pct",
+    "fta_per_fga_pct", "orb_pct", "drb_pct", "trb_pct", "ast_pct", "stl_pct",
+    "blk_pct", "tov_pct", "usg_pct", "off_rtg", "def_rtg", "bpm",
+}
+
+BOOL_COLUMNS = {
+    "ishome", "make", "corner_three",
+}
+
+
+def get_column_type(column):
+    if column in INT_COLUMNS:
+        return 'int'
+    if column in FLOAT_COLUMNS:
+        return 'float'
+    if column in BOOL_COLUMNS:
+        return 'bool'
+    return 'str'
+
+
+def to_int(value):
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return None if math.isnan(value) else int(value)
+    try:
+        # e.g. attendance '18,997' or plus_minus '+5'
+        return int(value.replace(',', '').replace('+', ''))
+    except ValueError:
+        return None
+
+def to_float(value):
+    if value is None or isinstance(value, float):
+        return value
+    if isinstance(value, int):
+        return float(value)
+    try:
+        return float(value.replace(',', '').replace('+', ''))
+    except ValueError:
+        return None
+
+def to_bool(value):
+    if value is None or isinstance(value, bool):
+        return value
+    return value in ['True', 'true', '1']
+
+def to_str(value):
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+
+CONVERTERS = {
+    'int': to_int,
+    'float': to_float,
+    'bool': to_bool,
+    'str': to_str,
+}
+
+
+def get_converter(column):
+    return CONVERTERS[get_column_type(column)]
+
+def convert_value(column, value):
+    '''
+    Converts a scraped value (usually a string) to the type of its column.
+    Empty and unparseable values become None.
+    '''
+    return CONVERTERS[get_column_type(column)](value)
+
+def convert_entry(entry, fieldnames):
+    '''
+    Returns a typed copy of entry, restricted to fieldnames.
+    '''
+    return {key: convert_value(key, entry.get(key)) for key in fieldnames}
@@ -13,6 +13,7 @@ BOT_NAME = 'basketball_reference'
 
 SPIDER_MODULES = ['basketball_reference.spiders']
 NEWSPIDER_MODULE = 'basketball_reference.spiders'
+COMMANDS_MODULE = 'basketball_reference.commands'
 
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
@@ -27,9 +28,11 @@ ROBOTSTXT_OBEY = True
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
 # See also autothrottle settings and docs
-DOWNLOAD_DELAY = 3
+# Requests are paced by RateLimitMiddleware (see RATELIMIT_* settings) instead
+# of the 3s delay, set DOWNLOAD_DELAY = 3 if it is disabled.
+DOWNLOAD_DELAY = 0
 # The download delay setting will honor only one of:
-#CONCURRENT_REQUESTS_PER_DOMAIN = 16
+CONCURRENT_REQUESTS_PER_DOMAIN = 4
 #CONCURRENT_REQUESTS_PER_IP = 16
 
 # Disable cookies (enabled by default)
@@ -46,26 +49,36 @@ DOWNLOAD_DELAY = 3
 
 # Enable or disable spider middlewares
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
-#SPIDER_MIDDLEWARES = {
+SPIDER_MIDDLEWARES = {
 #    'basketball_reference.middlewares.BasketballReferenceSpiderMiddleware': 543,
-#}
+    'basketball_reference.middlewares.FrontierMiddleware': 543,
+    'basketball_reference.middlewares.InstrumentationMiddleware': 950,
+}
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
+DOWNLOADER_MIDDLEWARES = {
 #    'basketball_reference.middlewares.BasketballReferenceDownloaderMiddleware': 543,
-#}
+    'basketball_reference.middlewares.SnapshotMiddleware': 580,
+    'basketball_reference.middlewares.RateLimitMiddleware': 950,
+}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
+EXTENSIONS = {
 #    'scrapy.extensions.telnet.TelnetConsole': None,
-#}
+    'basketball_reference.extensions.CrawlReport': 500,
+    'basketball_reference.extensions.MetricsServer': 510,
+}
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 ITEM_PIPELINES = {
     'basketball_reference.pipelines.BasketballReferencePipeline': 300,
+#    'basketball_reference.pipelines.CsvWriterPipeline': 300,
+#    'basketball_reference.pipelines.ThreadedWriterPipeline': 300,
+#    'basketball_reference.pipelines.ParquetPipeline': 400,
+#    'basketball_reference.pipelines.SQLitePipeline': 500,
 }
 
 # Enable and configure the AutoThrottle extension (disabled by default)
@@ -83,15 +96,98 @@ ITEM_PIPELINES = {
 
 # Enable and configure HTTP caching (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
-#HTTPCACHE_ENABLED = True
-#HTTPCACHE_EXPIRATION_SECS = 0
-#HTTPCACHE_DIR = 'httpcache'
-#HTTPCACHE_IGNORE_HTTP_CODES = []
-#HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'
+# Finished seasons and games are served from the cache without requests,
+# other pages are revalidated with ETag / Last-Modified (see httpcache.py).
+# The cache grows with every page crawled, enable it with -s HTTPCACHE_ENABLED=1.
+HTTPCACHE_ENABLED = False
+HTTPCACHE_EXPIRATION_SECS = 0
+HTTPCACHE_DIR = 'httpcache'
+HTTPCACHE_IGNORE_HTTP_CODES = []
+HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'
+HTTPCACHE_POLICY = 'basketball_reference.httpcache.SeasonCachePolicy'
+HTTPCACHE_GZIP = True
+# Days after a game (or the end of a schedule month) before its page is final
+HTTPCACHE_FINAL_DAYS = 3
 
 LOG_LEVEL='INFO'
 
 
 # [MY SETTINGS]
 
-OUTPUT_DIR = '../data'
\ No newline at end of file
+OUTPUT_DIR = '../data'
+# Stored files read by the spiders (-a incremental, -a active), OUTPUT_DIR if
+# not set. The shard command points its shards to the main OUTPUT_DIR.
+INPUT_DIR = None
+# Unchanged files are not written again (see BasketballReferencePipeline)
+DELTA_ENABLED = True
+
+# Raw response snapshots (see snapshots.py). Record them while crawling with
+# SNAPSHOT_ENABLED, re-parse them offline with SNAPSHOT_REPLAY.
+SNAPSHOT_ENABLED = False
+SNAPSHOT_REPLAY = False
+SNAPSHOT_DIR = '../data/.snapshots'
+
+# CsvWriterPipeline: open files kept in the pool and rows written per batch.
+# CSV_CONSOLIDATE appends box scores and shots to one file per season and
+# box type instead of one file per game.
+CSV_WRITER_POOL_SIZE = 64
+CSV_WRITER_BATCH_SIZE = 500
+CSV_CONSOLIDATE = False
+
+# ThreadedWriterPipeline: writer threads and items being written at most.
+WRITER_THREADS = 4
+WRITER_QUEUE_SIZE = 100
+
+# ParquetPipeline: rows buffered per partition before merging them to disk.
+PARQUET_BATCH_SIZE = 100000
+
+# RateLimitMiddleware: token bucket per domain. Sports Reference blocks
+# clients sending more than 20 requests per minute. Rates in requests/minute.
+RATELIMIT_ENABLED = True
+RATELIMIT_MAX_RATE = 20
+RATELIMIT_MIN_RATE = 2
+RATELIMIT_BURST = 1
+# Added to the rate on each healthy response
+RATELIMIT_RAMP_UP = 0.5
+# Rate multiplier and pause (when Retry-After is missing) on throttled responses
+RATELIMIT_BACKOFF = 0.5
+RATELIMIT_DEFAULT_PAUSE = 60
+RATELIMIT_HTTP_CODES = [429]
+RATELIMIT_MAX_RETRIES = 3
+
+# FrontierMiddleware: resumable crawls. Pages done are skipped and pending
+# ones resumed when the crawl is restarted. Meant for backfills: use a new
+# FRONTIER_DIR (or delete <spider>.sqlite) for refreshes like date=season.
+FRONTIER_ENABLED = False
+FRONTIER_DIR = '../data/.frontier'
+# Separate pass crawling only the failed pages (-s FRONTIER_RETRY=1)
+FRONTIER_RETRY = False
+FRONTIER_RETRY_CONCURRENCY = 1
+
+# SQLitePipeline: database file and rows inserted per transaction.
+SQLITE_PATH = '../data/basketball_reference.sqlite'
+SQLITE_BATCH_SIZE = 5000
+
+# InstrumentationMiddleware and CrawlReport: time spent per callback and
+# pipeline, written as a JSON report per crawl (-s INSTRUMENTATION_ENABLED=1).
+# A sample of the responses (0 to 1) can also be profiled, with cprofile or
+# pyinstrument.
+INSTRUMENTATION_ENABLED = False
+INSTRUMENTATION_REPORT_DIR = '../data/.reports'
+PROFILE_SAMPLE_RATE = 0
+PROFILE_BACKEND = 'cprofile'
+
+# MetricsServer: live metrics for Prometheus on http://127.0.0.1:9410/metrics
+# (-s METRICS_ENABLED=1). Pages per second are measured every METRICS_INTERVAL
+# seconds, parse time percentiles over the last METRICS_WINDOW pages (timed by
+# InstrumentationMiddleware, enabled by either setting).
+METRICS_ENABLED = False
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9410
+METRICS_INTERVAL = 10
+METRICS_WINDOW = 1000
+METRICS_LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5]
+
+# shard command: crawler processes of a sharded crawl (see sharding.py).
+# RATELIMIT_* rates are for the whole crawl, split evenly among the shards.
+SHARD_PROCESSES = 4
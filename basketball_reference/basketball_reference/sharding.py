@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+# Sharded crawls: the seasons (or months, or player letters) of a crawl split
+# among several crawler processes, each writing to its own output directory
+# with its share of the request rate. Their outputs are merged into
+# OUTPUT_DIR once they are done (see the shard command).
+#
+#   <OUTPUT_DIR>/.shards/<n>/output/       OUTPUT_DIR of shard n
+#   <OUTPUT_DIR>/.shards/<n>/db.sqlite     SQLITE_PATH of shard n
+#   <OUTPUT_DIR>/.shards/<n>.log           log of shard n
+
+import os, re, csv, json, shutil, sqlite3, hashlib, logging
+from datetime import datetime
+
+from basketball_reference.pipelines import write_atomic, get_file_hash, get_manifest_entry, CsvWriterPipeline
+
+SPIDERS = ['boxscores', 'shots', 'player']
+
+# Spider arguments that can not be split (a single day, live polling, ...)
+UNSHARDABLE_ARGS = ['date', 'games', 'poll']
+
+# Files appended to by CsvWriterPipeline with CSV_CONSOLIDATE
+CONSOLIDATED_RE = re.compile(r'^games/(boxscores/(basic|advanced)|shots)/[0-9]{4}\.csv$')
+
+
+def split(values, count):
+    '''
+    Splits values round-robin in count lists (older seasons have less games:
+    every shard gets some of each era). Empty lists are dropped.
+    '''
+    return [x for x in (values[i::count] for i in range(count)) if x]
+
+def get_shards(spider, args, count):
+    '''
+    Spider arguments of each shard, or None if the crawl can not be split.
+    '''
+    if spider not in SPIDERS or any(x in args for x in UNSHARDABLE_ARGS):
+        return None
+
+    if spider == 'player':
+        if 'all' in args:
+            letters = [chr(x) for x in range(ord('a'), ord('z') + 1)]
+        elif 'l' in args:
+            letters = args['l'].split(',')
+        else:
+            letters = []
+        ids = args['ids'].split(',') if 'ids' in args else []
+
+        other_args = {k: v for k, v in args.items() if k not in ['all', 'l', 'ids']}
+        shards = [dict(other_args) for x in range(count)]
+        for shard, shard_letters in zip(shards, split(letters, count)):
+            shard['l'] = ','.join(shard_letters)
+        for shard, shard_ids in zip(shards, split(ids, count)):
+            shard['ids'] = ','.join(shard_ids)
+        return [x for x in shards if 'l' in x or 'ids' in x]
+
+    # boxscores and shots: seasons (or months of the seasons, if less seasons than shards)
+    if 'from_season' in args and 'to_season' in args:
+        seasons = [str(x) for x in range(int(args['from_season']), int(args['to_season']) + 1)]
+    elif 'seasons' in args:
+        seasons = args['seasons'].split(',')
+    else:
+        return None
+
+    if args.get('months', 'all') == 'all':
+        months = [str(x) for x in range(1, 13)]
+    else:
+        months = args['months'].split(',')
+
+    other_args = {k: v for k, v in args.items() if k not in ['from_season', 'to_season', 'seasons', 'months']}
+    if len(seasons) >= count:
+        return [dict(other_args, seasons=','.join(x), months=','.join(months))
+                for x in split(seasons, count)]
+    return [dict(other_args, seasons=','.join(seasons), months=','.join(x))
+            for x in split(months, count)]
+
+
+def get_shard_settings(settings, shards_dir, index, count):
+    '''
+    Settings overridden in the process of shard index (of count).
+    '''
+    shard_dir = '{}/{}'.format(shards_dir, index)
+    return {
+        'OUTPUT_DIR': '{}/output'.format(shard_dir),
+        'INPUT_DIR': settings.get('INPUT_DIR') or settings.get('OUTPUT_DIR'),
+        'SQLITE_PATH': '{}/db.sqlite'.format(shard_dir),
+        'DELTA_ENABLED': False,  # applied when merging
+        'FRONTIER_DIR': '{}/shards-{}/{}'.format(settings.get('FRONTIER_DIR'), count, index),
+        'INSTRUMENTATION_REPORT_DIR': '{}/shards/{}'.format(settings.get('INSTRUMENTATION_REPORT_DIR'), index),
+        'METRICS_PORT': settings.getint('METRICS_PORT') + index,
+        # Share of the request rate of the whole crawl
+        'RATELIMIT_MAX_RATE': settings.getfloat('RATELIMIT_MAX_RATE') / count,
+        'RATELIMIT_MIN_RATE': settings.getfloat('RATELIMIT_MIN_RATE') / count,
+        'RATELIMIT_RAMP_UP': settings.getfloat('RATELIMIT_RAMP_UP') / count,
+        'RATELIMIT_BURST': max(1, settings.getint('RATELIMIT_BURST') // count),
+    }
+
+
+class ShardMerger:
+    '''
+    Merges the output of the shards into OUTPUT_DIR: files (with the delta
+    manifest of BasketballReferencePipeline, if DELTA_ENABLED), the SQLite
+    database and the Parquet datasets.
+    '''
+
+    def __init__(self, settings, spider):
+        self.output_dir = settings.get('OUTPUT_DIR')
+        self.sqlite_path = settings.get('SQLITE_PATH')
+        self.delta = settings.getbool('DELTA_ENABLED')
+        self.consolidate = settings.getbool('CSV_CONSOLIDATE')
+        self.spider = spider
+
+        self.manifest = {}  # file path (relative to OUTPUT_DIR) -> [sha1, size, mtime]
+        self.changes = {}  # file path -> 'added' or 'modified'
+        self.manifest_path = '{}/.delta/manifest.json'.format(self.output_dir)
+        if self.delta and os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        self.files = 0
+        self.unchanged = 0
+        self.unfinished = []  # temporary files left by a crashed shard
+        self.logger = logging.getLogger(__name__)  # stands in for the spider of CsvWriterPipeline
+
+    def merge(self, shard_dir):
+        output_dir = '{}/output'.format(shard_dir)
+        if os.path.isdir(output_dir):
+            for dir_path, dir_names, file_names in os.walk(output_dir):
+                if dir_path == output_dir:
+                    dir_names[:] = [x for x in dir_names if x not in ['.delta', 'parquet']]
+                for file_name in file_names:
+                    path = '{}/{}'.format(dir_path, file_name)
+                    if file_name.endswith('.tmp'):
+                        self.unfinished.append(os.path.relpath(path, output_dir))
+                        continue
+                    self.merge_file(path, os.path.relpath(path, output_dir).replace(os.sep, '/'))
+            self.merge_parquet('{}/parquet'.format(output_dir))
+
+        db_path = '{}/db.sqlite'.format(shard_dir)
+        if os.path.exists(db_path):
+            self.merge_sqlite(db_path)
+
+        shutil.rmtree(shard_dir)
+
+    def close(self):
+        if not self.delta:
+            return
+        os.makedirs('{}/.delta/changes'.format(self.output_dir), exist_ok=True)
+        write_atomic(self.manifest_path, json.dumps(self.manifest, sort_keys=True).encode('utf-8'))
+        if self.changes:
+            changes_path = '{}/.delta/changes/{}-{}.json'.format(
+                self.output_dir, self.spider, datetime.now().strftime('%Y%m%d-%H%M%S'))
+            with open(changes_path, mode='w', encoding='utf-8') as f:
+                json.dump(self.changes, f, indent=1, sort_keys=True)
+
+
+    def merge_file(self, path, key):
+        target = '{}/{}'.format(self.output_dir, key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        self.files += 1
+
+        if self.consolidate and CONSOLIDATED_RE.match(key) and os.path.exists(target):
+            self.merge_consolidated(path, target)
+            return
+
+        if self.delta:
+            with open(path, mode='rb') as f:
+                digest = hashlib.sha1(f.read()).hexdigest()
+            previous = get_file_hash(self.manifest, target, key)
+            if digest == previous:
+                self.unchanged += 1
+                os.remove(path)
+                return
+            self.changes[key] = 'modified' if previous else 'added'
+        os.replace(path, target)
+        if self.delta:
+            self.manifest[key] = get_manifest_entry(target, digest)
+
+    def merge_consolidated(self, path, target):
+        '''
+        Appends the rows of a shard season file to the stored one, whose rows
+        of the same games are dropped (see CsvWriterPipeline).
+        '''
+        pipeline = CsvWriterPipeline()
+        with open(path, encoding='utf-8', newline='') as f:
+            reader = csv.DictReader(f)
+            columns = pipeline.check_header(target, reader.fieldnames)
+            size = os.path.getsize(target)
+            stored_games = pipeline.get_stored_games(target)
+            games = set()
+            with open(target, mode='a', encoding='utf-8', newline='\n') as target_file:
+                writer = csv.DictWriter(target_file, fieldnames=columns, lineterminator='\n')
+                for row in reader:
+                    games.add(row.get('game_id'))
+                    writer.writerow(row)
+        if games & stored_games:
+            pipeline.drop_stored_rows(target, size, games & stored_games, self)
+        os.remove(path)
+
+
+    def merge_sqlite(self, db_path):
+        '''
+        Upserts the rows of every table of a shard database (see SQLitePipeline).
+        '''
+        from basketball_reference.pipelines import SQLitePipeline
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.sqlite_path)), exist_ok=True)
+        conn = sqlite3.connect(self.sqlite_path)
+        conn.execute('ATTACH DATABASE ? AS shard', (db_path,))
+        with conn:
+            tables = conn.execute("SELECT name, sql FROM shard.sqlite_master WHERE type = 'table'").fetchall()
+            for table, sql in tables:
+                columns = conn.execute('PRAGMA shard.table_info({})'.format(table)).fetchall()
+                stored = [x[1] for x in conn.execute('PRAGMA main.table_info({})'.format(table))]
+                if not stored:
+                    conn.execute(sql)
+                    for (index_sql,) in conn.execute("SELECT sql FROM shard.sqlite_master "
+                                                     "WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                                                     (table,)).fetchall():
+                        conn.execute(index_sql)
+                else:
+                    for column in columns:
+                        if column[1] not in stored:
+                            conn.execute('ALTER TABLE main.{} ADD COLUMN "{}" {}'.format(table, column[1], column[2]))
+
+                if table in SQLitePipeline.PARENT_KEYS:
+                    parent = ', '.join(SQLitePipeline.PARENT_KEYS[table])
+                    conn.execute('DELETE FROM main.{0} WHERE ({1}) IN (SELECT {1} FROM shard.{0})'.format(table, parent))
+                names = ', '.join('"{}"'.format(x[1]) for x in columns)
+                conn.execute('INSERT OR REPLACE INTO main.{0} ({1}) SELECT {1} FROM shard.{0}'.format(table, names))
+        conn.execute('DETACH DATABASE shard')
+        conn.close()
+
+    def merge_parquet(self, parquet_dir):
+        '''
+        Moves the part files of a shard into the Parquet datasets, once the
+        rows of their games are removed from the stored parts (see
+        ParquetPipeline).
+        '''
+        if not os.path.isdir(parquet_dir):
+            return
+        from basketball_reference.pipelines import ParquetPipeline, pq
+
+        pipeline = ParquetPipeline()
+        pipeline.stored = {}
+        for dir_path, dir_names, file_names in os.walk(parquet_dir):
+            parts = sorted(x for x in file_names if x.endswith('.parquet'))
+            if not parts:
+                continue
+            target_dir = '{}/parquet/{}'.format(self.output_dir, os.path.relpath(dir_path, parquet_dir))
+            os.makedirs(target_dir, exist_ok=True)
+
+            for part in parts:
+                table = pq.read_table('{}/{}'.format(dir_path, part))
+                pipeline.drop_stored_games(target_dir, set(table['game_id'].to_pylist()), table.schema)
+            for part in parts:
+                os.replace('{}/{}'.format(dir_path, part), '{}/{}'.format(target_dir, part))
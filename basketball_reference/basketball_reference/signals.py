@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+
+# Signals of the project, sent with crawler.signals.send_catch_log.
+#
+# See: https://docs.scrapy.org/en/latest/topics/signals.html
+
+# A callback has produced all its output (InstrumentationMiddleware).
+# Arguments: response, spider, callback (name), seconds (spent in the
+# callback), items, rows.
+response_parsed = object()
+
+# A pipeline has written an item.
+# Arguments: item, spider, pipeline (name), seconds, rows.
+item_written = object()
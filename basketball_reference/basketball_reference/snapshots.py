@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# Content-addressed, compressed on-disk store of raw responses.
+#
+# Bodies are stored once per content digest, gzip-compressed:
+#   <SNAPSHOT_DIR>/objects/<ab>/<sha1(body)>.gz
+# Each URL points to the latest body it returned:
+#   <SNAPSHOT_DIR>/urls/<cd>/<sha1(url)>.json
+#
+# Used by SnapshotMiddleware to record responses and to replay them to the
+# spider callbacks without hitting the network.
+
+import os, json, gzip, hashlib
+
+
+class SnapshotStore:
+    def __init__(self, path):
+        self.path = path
+
+    def get_url_path(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return '{}/urls/{}/{}.json'.format(self.path, key[:2], key)
+
+    def get_object_path(self, digest):
+        return '{}/objects/{}/{}.gz'.format(self.path, digest[:2], digest)
+
+    def put(self, url, body, headers=None, status=200):
+        '''
+        Stores the body (bytes) of url. Identical bodies are stored only once.
+        '''
+        digest = hashlib.sha1(body).hexdigest()
+
+        object_path = self.get_object_path(digest)
+        if not os.path.exists(object_path):
+            self.write_atomic(object_path, gzip.compress(body))
+
+        record = {
+            'url': url,
+            'status': status,
+            'digest': digest,
+            'headers': headers or {},
+        }
+        record_data = json.dumps(record, ensure_ascii=False).encode('utf-8')
+        self.write_atomic(self.get_url_path(url), record_data)
+        return digest
+
+    def get(self, url):
+        '''
+        Returns the stored record of url, with its decompressed 'body',
+        or None if url was never stored.
+        '''
+        try:
+            with open(self.get_url_path(url), mode='rb') as f:
+                record = json.loads(f.read().decode('utf-8'))
+            with open(self.get_object_path(record['digest']), mode='rb') as f:
+                record['body'] = gzip.decompress(f.read())
+        except FileNotFoundError:
+            return None
+        return record
+
+    def __contains__(self, url):
+        return os.path.exists(self.get_url_path(url))
+
+    def urls(self):
+        '''
+        Iterates over every URL in the store.
+        '''
+        urls_dir = '{}/urls'.format(self.path)
+        if not os.path.isdir(urls_dir):
+            return
+        for prefix in sorted(os.listdir(urls_dir)):
+            prefix_dir = '{}/{}'.format(urls_dir, prefix)
+            for file_name in sorted(os.listdir(prefix_dir)):
+                with open('{}/{}'.format(prefix_dir, file_name), mode='rb') as f:
+                    yield json.loads(f.read().decode('utf-8'))['url']
+
+    def write_atomic(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, mode='wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
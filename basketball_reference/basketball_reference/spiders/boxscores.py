@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
 import scrapy
 from scrapy.linkextractors import LinkExtractor
+from scrapy.exceptions import DontCloseSpider
 from datetime import date
 # from scrapy.spiders import CrawlSpider, Rule
 
-import re
+import re, os
+
+from basketball_reference import patterns
+from basketball_reference.items import get_row_item, get_end_item
+from basketball_reference.compaction import SeasonArchive
+from basketball_reference.patterns import first
+from basketball_reference.records import BasicBoxscoreRecord, AdvancedBoxscoreRecord, GameRecord
 
 class BoxscoresSpider(scrapy.Spider):
     name = 'boxscores'
@@ -58,6 +65,57 @@ class BoxscoresSpider(scrapy.Spider):
         else:
             self.only_schedules = False
 
+        # Converts numeric fields to numbers at parse time (see schemas.py).
+        if 'typed' in kwargs:
+            self.typed = True
+        else:
+            self.typed = False
+
+        # Skips games whose box score is already stored in INPUT_DIR.
+        if 'incremental' in kwargs:
+            self.incremental = True
+        else:
+            self.incremental = False
+        self.stored_games = set()
+
+        # Box score rows extraction: 'lxml' (single pass) or 'xpath'.
+        if 'parser' in kwargs:
+            self.parser = kwargs['parser']
+        else:
+            self.parser = 'lxml'
+
+        # Yields every row as its own item, as soon as it is extracted
+        # (see items.py), instead of one item per file.
+        if 'stream' in kwargs:
+            self.stream = True
+        else:
+            self.stream = False
+
+        # Live mode: polls the box scores of today's games every poll seconds,
+        # until their page shows the final score, at most max_polls times.
+        if 'poll' in kwargs:
+            self.poll = float(kwargs['poll'])
+        else:
+            self.poll = 0
+
+        if 'max_polls' in kwargs:
+            self.max_polls = int(kwargs['max_polls'])
+        else:
+            self.max_polls = 300
+        self.live_games = {}  # game id -> {'rows', 'polls'}
+
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.spider_idle, signal=scrapy.signals.spider_idle)
+        return spider
+
+    def spider_idle(self, spider):
+        # Live games are waiting for their next poll.
+        if self.live_games:
+            raise DontCloseSpider
+
 
     def start_requests(self):
         '''
@@ -68,6 +126,18 @@ class BoxscoresSpider(scrapy.Spider):
         MONTHS = ['january', 'february', 'march', 'april', 'may', 'june', 'july', 
                         'august', 'september', 'october', 'november', 'december']
 
+        if self.poll:
+            today = date.today()
+            season = today.year + 1 if today.month >= 9 else today.year
+            url = BASE_URL + SCHEDULE_URL.format(season=season, month=MONTHS[today.month - 1])
+            yield scrapy.Request(url, callback=self.parse_live_schedule, meta={'dont_cache': True})
+            return
+
+        if self.incremental:
+            self.stored_games = self.load_stored_games()
+            self.logger.info('Incremental mode: {} games already stored.'.format(
+                                len(self.stored_games)))
+
         for season in self.seasons:
             for month in self.months:
                 url = BASE_URL + SCHEDULE_URL.format(
@@ -84,42 +154,49 @@ class BoxscoresSpider(scrapy.Spider):
         Extracts information about the schedule.
         '''
         if not self.only_schedules:
-            for a in response.xpath('//a/@href'):
-                url = a.extract()
-                if re.match(r'/boxscores/(\d){9}([A-Z]){3}\.html', url):
-                    yield response.follow(url, callback=self.parse_game)
+            for url in patterns.GAME_LINKS(response.selector.root):
+                game_id = patterns.GAME_ID_RE.search(url).group(1)
+                if self.is_stored(game_id):
+                    continue
+                yield response.follow(url, callback=self.parse_game)
 
 
-        games_xpath = '//table[@id="schedule"]//tbody//tr[not(contains(@class, "thead"))]'
-        games = response.xpath(games_xpath)
+        games = patterns.SCHEDULE_ROWS(response.selector.root)
 
-        season = re.search(r"/NBA_([0-9]{4})?_games-[a-z]*.html", response.url).group(1)
-        month = re.search(r"/NBA_[0-9]{4}_games-([a-z]*)?.html", response.url).group(1)
+        season, month = patterns.SCHEDULE_URL_RE.search(response.url).groups()
 
         entries = []
         for game in games:
             entry = self.get_game_entry()
 
-            entry["game_id"] = game.xpath('.//*[@data-stat="date_game"]//@csk').get()
+            entry["game_id"] = first(patterns.STAT_CSK(game, stat="date_game"))
 
             game_id = entry["game_id"] 
             y, m, d = int(game_id[0:4]), int(game_id[4:6]), int(game_id[6:8])
             entry["date"] = date(y, m, d).isoformat()
             
-            entry["start_time"] = game.xpath('.//*[@data-stat="game_start_time"]//text()').get()
-            entry["visitor_team"] = game.xpath('.//*[@data-stat="visitor_team_name"]//text()').get()
-            entry["visitor_team_id"] = game.xpath('.//*[@data-stat="visitor_team_name"]//@csk').get()[:3]
-            entry["visitor_pts"] = game.xpath('.//*[@data-stat="visitor_pts"]//text()').get()
-            entry["home_team"] = game.xpath('.//*[@data-stat="home_team_name"]//text()').get()
-            entry["home_team_id"] = game.xpath('.//*[@data-stat="home_team_name"]//@csk').get()[:3]
-            entry["home_pts"] = game.xpath('.//*[@data-stat="home_pts"]//text()').get()
-            entry["overtimes"] = game.xpath('.//*[@data-stat="overtimes"]//text()').get()
-            entry["attendance"] = game.xpath('.//*[@data-stat="attendance"]//text()').get()
-            entry["game_remarks"] = game.xpath('.//*[@data-stat="game_remarks"]//text()').get()
-
+            entry["start_time"] = first(patterns.STAT_TEXT(game, stat="game_start_time"))
+            entry["visitor_team"] = first(patterns.STAT_TEXT(game, stat="visitor_team_name"))
+            entry["visitor_team_id"] = first(patterns.STAT_CSK(game, stat="visitor_team_name"))[:3]
+            entry["visitor_pts"] = first(patterns.STAT_TEXT(game, stat="visitor_pts"))
+            entry["home_team"] = first(patterns.STAT_TEXT(game, stat="home_team_name"))
+            entry["home_team_id"] = first(patterns.STAT_CSK(game, stat="home_team_name"))[:3]
+            entry["home_pts"] = first(patterns.STAT_TEXT(game, stat="home_pts"))
+            entry["overtimes"] = first(patterns.STAT_TEXT(game, stat="overtimes"))
+            entry["attendance"] = first(patterns.STAT_TEXT(game, stat="attendance"))
+            entry["game_remarks"] = first(patterns.STAT_TEXT(game, stat="game_remarks"))
+
+            if self.typed:
+                entry.convert()
+
+            if self.stream:
+                yield get_row_item('schedule', 'schedule/games', '{}_{}'.format(season, month),
+                                   self.get_game_keys(), entry)
             entries.append(entry)
 
-        if entries:
+        if entries and self.stream:
+            yield get_end_item('schedule', 'schedule/games', '{}_{}'.format(season, month))
+        elif entries:
             yield { 'file_name': '{}_{}'.format(season, month), 
                     'type': 'schedule', 
                     'dir': 'schedule/games', 
@@ -127,67 +204,71 @@ class BoxscoresSpider(scrapy.Spider):
                     'fieldnames': self.get_game_keys() }
             
     def parse_game(self, response):
-        game_id = re.search(r"/([\dA-Z]*)?.html", response.url).group(1)
+        game_id = patterns.GAME_ID_RE.search(response.url).group(1)
+        if self.stream:
+            for item in self.get_game_row_items(response, game_id):
+                yield item
+            return
 
+        basic_entries, advanced_entries = self.get_game_entries(response, game_id)
+
+        for item in self.get_game_items(game_id, basic_entries, advanced_entries):
+            yield item
+
+    def get_game_entries(self, response, game_id):
+        '''
+        Returns the basic and advanced box score rows of a game page.
+        '''
         basic_entries = []
         advanced_entries = []
 
-        boxscores = response.xpath('//table[starts-with(@id, "box-")]')
-        for bs in boxscores:
-            html_id = bs.attrib['id']
-            team_id = re.search('box-([A-Z]{3}?)-.*-.*', html_id).group(1)
-            box_type = re.search('box-[A-Z]{3}-(.*-.*)?', html_id).group(1)
-
-            # player extract
-            players = bs.xpath('tbody//tr[not(contains(@class, "thead"))]')
-            for index, player in enumerate(players):
-                pnum = index + 1
-                
-                if box_type == 'game-advanced':
-                    entry = self.get_advanced_entry()
-                else:
-                    entry = self.get_basic_entry()
+        for box_type, entries in self.get_game_tables(response, game_id):
+            if box_type == 'game-advanced':
+                advanced_entries.extend(entries)
+            else:
+                basic_entries.extend(entries)
 
-                entry["game_id"] = game_id
-                entry["team_id"] = team_id
-                entry["box_type"] = box_type
-                
-                y, m, d = int(game_id[0:4]), int(game_id[4:6]), int(game_id[6:8])
-                entry["date"] = date(y, m, d).isoformat()
+        return basic_entries, advanced_entries
 
-                if re.search(team_id, game_id):
-                    entry["ishome"] = True
-                else:
-                    entry["ishome"] = False
+    def get_game_row_items(self, response, game_id):
+        '''
+        Stream mode: yields the box score rows of a game page one by one,
+        table after table, then the end items of the files written.
+        '''
+        dirs = {}  # dir -> fieldnames
+        for box_type, entries in self.get_game_tables(response, game_id):
+            if box_type == 'game-advanced':
+                dir = 'games/boxscores/advanced/{}'.format(game_id[:4])
+                fieldnames = self.get_advanced_keys()
+            else:
+                dir = 'games/boxscores/basic/{}'.format(game_id[:4])
+                fieldnames = self.get_basic_keys()
 
-                stats = player.xpath('th | td')
-                for stat in stats:
-                    dt_st = stat.attrib['data-stat']
-                    entry["pnum"] = pnum
+            for entry in entries:
+                dirs[dir] = fieldnames
+                yield get_row_item('boxscore', dir, game_id[4:], fieldnames, entry)
 
-                    if stat.xpath('a'):   # if it has link...
-                        entry[dt_st] = stat.xpath('a/text()').get()
-                        entry['{}_href'.format(dt_st)] = stat.xpath('a/@href').get()
-                    else:
-                        entry[dt_st] = stat.xpath('text()').get()
+        for dir, fieldnames in dirs.items():
+            yield get_end_item('boxscore', dir, game_id[4:], fieldnames)
 
-                    if 'csk' in stat.attrib:
-                        if dt_st == "mp":
-                            entry['sp'] = stat.attrib['csk']
-                        else:
-                            entry['{}_csk'.format(dt_st)] = stat.attrib['csk']
+    def get_game_tables(self, response, game_id):
+        '''
+        Yields the box type and the rows of each box score table of a game page.
+        '''
+        boxscores = patterns.BOX_TABLES(response.selector.root)
+        for table in boxscores:
+            team_id, box_type = patterns.BOX_TABLE_ID_RE.search(table.get('id')).groups()
 
-                    if 'data-append-csv' in stat.attrib:
-                        entry['{}_id'.format(dt_st)] = stat.attrib['data-append-csv']
-                pass # end stats for
+            if self.parser == 'xpath':
+                bs = scrapy.Selector(root=table, type='html')
+                entries = self.get_table_entries_xpath(bs, game_id, team_id, box_type)
+            else:
+                entries = self.get_table_entries(table, game_id, team_id, box_type)
 
-                if entry['box_type'] == 'game-advanced':
-                    advanced_entries.append(entry)
-                else:
-                    basic_entries.append(entry)
-                
-            pass # end player for
-        
+            yield box_type, entries
+        pass # end boxscores for
+
+    def get_game_items(self, game_id, basic_entries, advanced_entries):
         if advanced_entries:
             yield { 'file_name': game_id[4:], 
                     'type': 'boxscore', 
@@ -203,117 +284,303 @@ class BoxscoresSpider(scrapy.Spider):
                     'fieldnames': self.get_basic_keys() }
 
 
+    def parse_live_schedule(self, response):
+        '''
+        Live mode: stores today's schedule and starts polling today's games.
+        '''
+        for result in self.parse_schedule(response):
+            if isinstance(result, dict):
+                yield result
+
+        today = date.today().strftime('%Y%m%d')
+        for game in patterns.SCHEDULE_ROWS(response.selector.root):
+            game_id = first(patterns.STAT_CSK(game, stat="date_game"))
+            if game_id.startswith(today):
+                self.live_games[game_id] = {'rows': {}, 'polls': 0}
+                yield self.get_live_request(game_id)
+
+        self.logger.info('Live mode: polling {} games every {}s.'.format(
+                            len(self.live_games), self.poll))
+
+    def parse_live_game(self, response):
+        '''
+        Live mode: yields the rows changed since the previous poll of the game
+        (type boxscore_update, one file per poll under games/boxscores/live).
+        Once the page shows the final score (or after max_polls polls),
+        yields its box score items as parse_game.
+        '''
+        game_id = patterns.GAME_ID_RE.search(response.url).group(1)
+        game = self.live_games[game_id]
+        game['polls'] += 1
+
+        # The box score page is published once the game has started.
+        if response.status != 200:
+            self.schedule_poll(game_id)
+            return
+
+        basic_entries, advanced_entries = self.get_game_entries(response, game_id)
+
+        for box, entries in [('basic', basic_entries), ('advanced', advanced_entries)]:
+            changed_entries = []
+            for entry in entries:
+                key = (entry['team_id'], entry['box_type'], entry['pnum'])
+                row = tuple(entry.items())
+                if game['rows'].get(key) != row:
+                    game['rows'][key] = row
+                    changed_entries.append(entry)
+
+            if changed_entries:
+                if box == 'advanced':
+                    fieldnames = self.get_advanced_keys()
+                else:
+                    fieldnames = self.get_basic_keys()
+                yield { 'file_name': '{}_{:03d}'.format(box, game['polls']),
+                        'type': 'boxscore_update',
+                        'dir': 'games/boxscores/live/{}/{}'.format(game_id[:4], game_id[4:]),
+                        'data': changed_entries,
+                        'fieldnames': fieldnames }
+
+        if self.is_game_final(response):
+            self.logger.info('Live mode: {} is final.'.format(game_id))
+        elif game['polls'] >= self.max_polls:
+            self.logger.warning('Live mode: {} not final after {} polls, last box score written.'.format(
+                                    game_id, game['polls']))
+        else:
+            self.schedule_poll(game_id)
+            return
+
+        del self.live_games[game_id]
+        for item in self.get_game_items(game_id, basic_entries, advanced_entries):
+            yield item
+
+    def is_game_final(self, response):
+        return any(x.strip().startswith('Final') for x in patterns.GAME_STATUS(response.selector.root))
+
+    def get_live_request(self, game_id):
+        url = 'https://www.basketball-reference.com/boxscores/{}.html'.format(game_id)
+        return scrapy.Request(url, callback=self.parse_live_game, errback=self.live_request_failed,
+                              dont_filter=True,
+                              meta={'dont_cache': True, 'handle_httpstatus_list': [404],
+                                    'game_id': game_id})
+
+    def live_request_failed(self, failure):
+        game_id = failure.request.meta['game_id']
+        self.logger.error('Live mode: poll of {} failed ({}).'.format(game_id, failure.getErrorMessage()))
+        self.live_games[game_id]['polls'] += 1
+        self.schedule_poll(game_id)
+
+    def schedule_poll(self, game_id):
+        # Pages never published (postponed games) or always failing are
+        # dropped, so the crawl can close.
+        if self.live_games[game_id]['polls'] >= self.max_polls:
+            self.logger.error('Live mode: no box score of {} after {} polls.'.format(
+                                game_id, self.live_games[game_id]['polls']))
+            del self.live_games[game_id]
+            return
+
+        from twisted.internet import reactor
+        reactor.callLater(self.poll, self.crawl_poll, game_id)
+
+    def crawl_poll(self, game_id):
+        if game_id not in self.live_games or not self.crawler.crawling:
+            return
+        request = self.get_live_request(game_id)
+        try:
+            self.crawler.engine.crawl(request)
+        except TypeError:  # Scrapy < 2.10 also expects the spider
+            self.crawler.engine.crawl(request, self)
+
+
+    def get_table_entries(self, table, game_id, team_id, box_type):
+        '''
+        Extracts the player rows of a box-* table walking its lxml tree once.
+        Gives the same entries as get_table_entries_xpath.
+        '''
+        entries = []
+
+        date_iso = self.get_game_date(game_id)
+        ishome = team_id in game_id
+
+        pnum = 0
+        for tbody in table:
+            if tbody.tag != 'tbody':
+                continue
+
+            for player in tbody.iter('tr'):
+                if 'thead' in player.get('class', ''):
+                    continue
+                pnum += 1
+
+                if box_type == 'game-advanced':
+                    entry = self.get_advanced_entry()
+                else:
+                    entry = self.get_basic_entry()
+
+                entry["game_id"] = game_id
+                entry["team_id"] = team_id
+                entry["box_type"] = box_type
+                entry["date"] = date_iso
+                entry["ishome"] = ishome
+
+                for stat in player:
+                    if stat.tag != 'th' and stat.tag != 'td':
+                        continue
+                    attrib = stat.attrib
+                    dt_st = attrib['data-stat']
+                    entry["pnum"] = pnum
+
+                    links = [child for child in stat if child.tag == 'a']
+                    if links:   # if it has link...
+                        entry[dt_st] = None
+                        for a in links:
+                            text = get_first_text(a)
+                            if text is not None:
+                                entry[dt_st] = text
+                                break
+                        entry['{}_href'.format(dt_st)] = None
+                        for a in links:
+                            if 'href' in a.attrib:
+                                entry['{}_href'.format(dt_st)] = a.attrib['href']
+                                break
+                    else:
+                        entry[dt_st] = get_first_text(stat)
+
+                    if 'csk' in attrib:
+                        if dt_st == "mp":
+                            entry['sp'] = attrib['csk']
+                        else:
+                            entry['{}_csk'.format(dt_st)] = attrib['csk']
+
+                    if 'data-append-csv' in attrib:
+                        entry['{}_id'.format(dt_st)] = attrib['data-append-csv']
+                pass # end stats for
+
+                if self.typed:
+                    entry.convert()
+                entries.append(entry)
+            pass # end player for
+
+        return entries
+
+
+    def get_table_entries_xpath(self, bs, game_id, team_id, box_type):
+        '''
+        Extracts the player rows of a box-* table with per-cell XPath queries.
+        Reference implementation of get_table_entries (-a parser=xpath).
+        '''
+        entries = []
+
+        players = bs.xpath('tbody//tr[not(contains(@class, "thead"))]')
+        for index, player in enumerate(players):
+            pnum = index + 1
+            
+            if box_type == 'game-advanced':
+                entry = self.get_advanced_entry()
+            else:
+                entry = self.get_basic_entry()
+
+            entry["game_id"] = game_id
+            entry["team_id"] = team_id
+            entry["box_type"] = box_type
+            entry["date"] = self.get_game_date(game_id)
+
+            if re.search(team_id, game_id):
+                entry["ishome"] = True
+            else:
+                entry["ishome"] = False
+
+            stats = player.xpath('th | td')
+            for stat in stats:
+                dt_st = stat.attrib['data-stat']
+                entry["pnum"] = pnum
+
+                if stat.xpath('a'):   # if it has link...
+                    entry[dt_st] = stat.xpath('a/text()').get()
+                    entry['{}_href'.format(dt_st)] = stat.xpath('a/@href').get()
+                else:
+                    entry[dt_st] = stat.xpath('text()').get()
+
+                if 'csk' in stat.attrib:
+                    if dt_st == "mp":
+                        entry['sp'] = stat.attrib['csk']
+                    else:
+                        entry['{}_csk'.format(dt_st)] = stat.attrib['csk']
+
+                if 'data-append-csv' in stat.attrib:
+                    entry['{}_id'.format(dt_st)] = stat.attrib['data-append-csv']
+            pass # end stats for
+
+            if self.typed:
+                entry.convert()
+            entries.append(entry)
+        pass # end player for
+
+        return entries
+
+
+    def get_game_date(self, game_id):
+        y, m, d = int(game_id[0:4]), int(game_id[4:6]), int(game_id[6:8])
+        return date(y, m, d).isoformat()
+
+
+    def is_stored(self, game_id):
+        '''
+        Whether the game is skipped by the incremental mode.
+        '''
+        return game_id in self.stored_games
+
+    def load_stored_games(self, games_dir='games/boxscores/basic'):
+        '''
+        Builds the set of game ids that already have a file stored under
+        INPUT_DIR/games_dir (<year>/<id>.csv), or in a season archive
+        (<year>.csv.gz). Basic box scores by default.
+        '''
+        output_dir = self.settings.get('INPUT_DIR') or self.settings.get('OUTPUT_DIR')
+        basic_dir = '{}/{}'.format(output_dir, games_dir)
+
+        stored_games = set()
+        if not os.path.isdir(basic_dir):
+            return stored_games
+
+        for year in os.listdir(basic_dir):
+            year_dir = '{}/{}'.format(basic_dir, year)
+            if year.endswith('.index.json'):
+                stored_games.update(SeasonArchive(year_dir[:-len('.index.json')]).game_ids())
+                continue
+            if not os.path.isdir(year_dir):
+                continue
+            for file_name in os.listdir(year_dir):
+                if file_name.endswith('.csv'):
+                    stored_games.add(year + file_name[:-len('.csv')])
+        return stored_games
+
     
     def get_basic_keys(self):
-        keys = [
-            "game_id",
-            "team_id",
-            "box_type",
-            "date", 
-            "ishome",
-            "pnum",
-            "player",
-            "player_href",
-            "player_csk",
-            "player_id",
-            "mp",
-            "sp",
-            "fg",
-            "fga",
-            "fg_pct",
-            "fg3",
-            "fg3a",
-            "fg3_pct",
-            "ft",
-            "fta",
-            "ft_pct",
-            "orb",
-            "drb",
-            "trb",
-            "ast",
-            "stl",
-            "blk",
-            "tov",
-            "pf",
-            "pts",
-            "plus_minus",
-            "reason",
-        ]
-        return keys
+        return BasicBoxscoreRecord.FIELDS
 
     def get_advanced_keys(self):
-        keys = ["game_id", 
-            "team_id", 
-            "box_type", 
-            "date",  
-            "ishome", 
-            "pnum", 
-            "player", 
-            "player_href", 
-            "player_csk", 
-            "player_id", 
-            "mp",
-            "sp",
-            "ts_pct", 
-            "efg_pct", 
-            "fg3a_per_fga_pct", 
-            "fta_per_fga_pct", 
-            "orb_pct", 
-            "drb_pct", 
-            "trb_pct", 
-            "ast_pct", 
-            "stl_pct", 
-            "blk_pct", 
-            "tov_pct", 
-            "usg_pct", 
-            "off_rtg", 
-            "def_rtg", 
-            "bpm", 
-            "reason"]
-        return keys    
+        return AdvancedBoxscoreRecord.FIELDS
         
     def get_basic_entry(self):
-        entry = {}
-        keys = self.get_basic_keys()
-        for key in keys:
-            if key in ['sp', 'mp']:
-                entry[key] = 0
-            else:
-                entry[key] = None
-        return entry
+        return BasicBoxscoreRecord()
 
     def get_advanced_entry(self):
-        entry = {}
-        keys = self.get_advanced_keys()
-        for key in keys:
-            if key in ['sp', 'mp']:
-                entry[key] = 0
-            else:
-                entry[key] = None
-        return entry
+        return AdvancedBoxscoreRecord()
 
     def get_game_keys(self):
-        keys = [
-            "game_id",
-            "date",
-            "start_time",
-            "visitor_team",
-            "visitor_team_id",
-            "visitor_pts",
-            "home_team",
-            "home_team_id",
-            "home_pts",
-            "overtimes",
-            "attendance",
-            "game_remarks"
-        ]
-        return keys
+        return GameRecord.FIELDS
 
     def get_game_entry(self):
-        entry = {}
-        keys = self.get_game_keys()
-
-        for key in keys:
-            entry[key] = None
-
-        return entry
+        return GameRecord()
+
+def get_first_text(element):
+    '''
+    Returns the first text node child of an lxml element, as the XPath
+    'text()' query followed by .get() would, or None.
+    '''
+    if element.text is not None:
+        return element.text
+    for child in element:
+        if child.tail is not None:
+            return child.tail
+    return None
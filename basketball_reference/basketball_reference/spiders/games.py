@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import scrapy
+
+from basketball_reference import patterns
+from basketball_reference.spiders.boxscores import BoxscoresSpider
+from basketball_reference.spiders.shots import ShotsSpider
+
+class GamesSpider(BoxscoresSpider, ShotsSpider):
+    '''
+    Combined crawl: each schedule page is downloaded once and fans out to
+    schedule, box score and shot chart extraction.
+    '''
+    name = 'games'
+    allowed_domains = ['basketball-reference.com']
+    start_urls = []
+
+    def __init__(self, **kwargs):
+        '''
+        Same arguments as the boxscores spider, plus no-boxscores and no-shots.
+        '''
+        BoxscoresSpider.__init__(self, **kwargs)
+
+        self.boxscores = 'no-boxscores' not in kwargs
+        self.shots = 'no-shots' not in kwargs
+
+        # With incremental, box scores and shot charts are skipped separately.
+        self.stored_shots = set()
+
+
+    def start_requests(self):
+        if self.incremental and self.shots:
+            self.stored_shots = self.load_stored_games('games/shots')
+            self.logger.info('Incremental mode: {} shot charts already stored.'.format(
+                                len(self.stored_shots)))
+
+        for request in BoxscoresSpider.start_requests(self):
+            if request.callback == self.parse_game:
+                for game_request in self.get_game_requests(request):
+                    yield game_request
+            else:
+                yield request
+
+    def parse_schedule(self, response):
+        for result in BoxscoresSpider.parse_schedule(self, response):
+            if isinstance(result, scrapy.Request):
+                game_id = patterns.GAME_ID_RE.search(result.url).group(1)
+                if self.boxscores and game_id not in self.stored_games:
+                    yield result
+                if self.shots and game_id not in self.stored_shots:
+                    yield self.get_shots_request(result)
+            else:
+                yield result
+
+    def parse_shots(self, response):
+        return ShotsSpider.parse_game(self, response)
+
+
+    def is_stored(self, game_id):
+        return ((not self.boxscores or game_id in self.stored_games) and
+                (not self.shots or game_id in self.stored_shots))
+
+    def get_game_requests(self, boxscore_request):
+        '''
+        Box score and shot chart requests of the game of a box score request.
+        '''
+        if self.boxscores:
+            yield boxscore_request
+
+        if self.shots:
+            yield self.get_shots_request(boxscore_request)
+
+    def get_shots_request(self, boxscore_request):
+        game_id = patterns.GAME_ID_RE.search(boxscore_request.url).group(1)
+        url = boxscore_request.url.replace('/boxscores/{}'.format(game_id),
+                                           '/boxscores/shot-chart/{}'.format(game_id))
+        return scrapy.Request(url, callback=self.parse_shots)
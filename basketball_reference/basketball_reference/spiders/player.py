@@ -4,7 +4,14 @@ from scrapy.linkextractors import LinkExtractor
 from datetime import date
 # from scrapy.spiders import CrawlSpider, Rule
 
-import re, string
+import os, csv, string, asyncio
+from concurrent.futures import ProcessPoolExecutor
+from lxml import etree
+
+from basketball_reference import patterns
+from basketball_reference.patterns import first
+from basketball_reference.items import get_row_item, get_table_item, get_end_item
+from basketball_reference.records import PlayerListRecord
 
 class PlayerSpider(scrapy.Spider):
     name = 'player'
@@ -29,6 +36,51 @@ class PlayerSpider(scrapy.Spider):
         else:
             self.letters = []
 
+        # Converts numeric fields to numbers at parse time (see schemas.py).
+        if 'typed' in kwargs:
+            self.typed = True
+        else:
+            self.typed = False
+
+        # Parses player pages in a pool of this many worker processes.
+        if 'processes' in kwargs:
+            self.processes = int(kwargs['processes'])
+        else:
+            self.processes = 0
+        self.pool = None
+
+        # Stats tables extraction: 'comments' (only the commented tables are
+        # parsed again) or 'full' (the whole body without comments).
+        if 'extract' in kwargs:
+            self.extract = kwargs['extract']
+        else:
+            self.extract = 'comments'
+
+        # Extracts only these tables (ids), e.g. per_game,totals,advanced
+        if 'tables' in kwargs:
+            self.table_ids = [x for x in kwargs['tables'].split(',')]
+        else:
+            self.table_ids = None
+
+        # Only players active in the last active seasons (year_max), read from
+        # the stored players/list/<letter>.csv when present. refresh-lists
+        # downloads the list pages anyway (e.g. for new players).
+        if 'active' in kwargs:
+            today = date.today()
+            season = today.year + 1 if today.month >= 9 else today.year
+            self.min_year_max = season - int(kwargs['active']) + 1
+        else:
+            self.min_year_max = None
+        self.refresh_lists = 'refresh-lists' in kwargs
+
+        # Yields every list row and player table as its own item, as soon as
+        # it is extracted (see items.py). Not with processes.
+        if 'stream' in kwargs:
+            self.stream = True
+        else:
+            self.stream = False
+
+        self.requested_players = set()  # each player page is requested once per run
         
 
     def start_requests(self):
@@ -40,10 +92,19 @@ class PlayerSpider(scrapy.Spider):
         PLAYER_URL = 'https://www.basketball-reference.com/players/{}/{}.html'
         for id in self.ids:
             url = PLAYER_URL.format(id[0], id)
-            yield scrapy.Request(url, callback=self.parse_player)
+            request = self.get_player_request(url)
+            if request:
+                yield request
 
         LIST_URL = 'https://www.basketball-reference.com/players/{}'
         for letter in self.letters:
+            if self.min_year_max and not self.refresh_lists:
+                stored_entries = self.load_stored_list(letter)
+                if stored_entries is not None:
+                    for request in self.get_active_requests(stored_entries):
+                        yield request
+                    continue
+
             url = LIST_URL.format(letter)
             yield scrapy.Request(url, callback=self.parse_list)
 
@@ -52,31 +113,31 @@ class PlayerSpider(scrapy.Spider):
         '''
         Extracts information about the 
         '''
-        for a in response.xpath('//a/@href'):
-            url = a.extract()
-            if re.match(r'/players/[a-z]/([a-z]){7}(\d){2}\.html', url):
-                yield response.follow(url, callback=self.parse_player)
-                pass
+        if not self.min_year_max:
+            for url in patterns.PLAYER_LINKS(response.selector.root):
+                request = self.get_player_request(response.urljoin(url))
+                if request:
+                    yield request
 
         list_entries = []
-        players_xpath = '//table[@id="players"]//tbody//tr[not(contains(@class, "thead"))]'
-        players = response.xpath(players_xpath)
+        players = patterns.PLAYERS_ROWS(response.selector.root)
         for player in players:
             
             entry = self.get_list_entry()
 
-            stats = player.xpath('th | td')
+            stats = patterns.CELLS(player)
             for stat in stats:
                 dt_st = stat.attrib['data-stat']
 
-                if stat.xpath('.//a'):   # if it has link...
+                if patterns.DESCENDANT_LINKS(stat):   # if it has link...
                     if dt_st == 'colleges':
-                        entry[dt_st] = stat.get()
+                        entry[dt_st] = etree.tostring(stat, method='html', encoding='unicode',
+                                                      with_tail=False)
                     else:
-                        entry[dt_st] = stat.xpath('.//a/text()').get()
-                        entry['{}_href'.format(dt_st)] = stat.xpath('.//a/@href').get()
+                        entry[dt_st] = first(patterns.LINK_TEXT(stat))
+                        entry['{}_href'.format(dt_st)] = first(patterns.LINK_HREF(stat))
                 else:
-                    entry[dt_st] = stat.xpath('text()').get()
+                    entry[dt_st] = first(patterns.TEXT(stat))
 
                 if 'csk' in stat.attrib:
                     entry['{}_csk'.format(dt_st)] = stat.attrib['csk']
@@ -86,9 +147,21 @@ class PlayerSpider(scrapy.Spider):
 
             pass # end stats for
 
+            if self.typed:
+                entry.convert()
+
+            if self.stream:
+                yield get_row_item('player_list', 'players/list', response.url.rstrip('/')[-1],
+                                   self.get_list_keys(), entry)
             list_entries.append(entry)
             
-        if list_entries:
+        if self.min_year_max:
+            for request in self.get_active_requests(list_entries):
+                yield request
+
+        if list_entries and self.stream:
+            yield get_end_item('player_list', 'players/list', response.url.rstrip('/')[-1])
+        elif list_entries:
             yield { 'file_name': response.url.rstrip('/')[-1], 
                     'type': 'player_list', 
                     'dir': 'players/list', 
@@ -100,85 +173,83 @@ class PlayerSpider(scrapy.Spider):
 
             
     def parse_player(self, response):
-        player_id = re.search(r"/([a-z\d]*)?.html", response.url).group(1)
+        if self.processes:
+            return self.parse_player_in_pool(response)
+        return self.parse_player_inline(response)
 
-        player_data = {}
+    def parse_player_inline(self, response):
+        if self.stream:
+            for item in get_player_table_items(response.url, response.selector, self.extract, self.table_ids):
+                yield item
+            return
 
-        # Tables are commented: need to remove HTML comments.
-        html_body = response.xpath('//body').get()
-        html_body_uncommented = html_body.replace("<!--", "").replace("-->", "")
-        selector = scrapy.selector.Selector(text=html_body_uncommented)
-        data_tables = selector.xpath('//table[contains(@class, "stats_table")]')
+        item = get_player_item(response.url, response.selector, self.extract, self.table_ids)
+        if item:
+            yield item
 
-        for data_table in data_tables:
-            table_id = data_table.attrib['id']
+    async def parse_player_in_pool(self, response):
+        '''
+        Parses the page in a worker process, so the reactor keeps downloading
+        meanwhile. Items are delivered back when the worker is done (the
+        future is awaited in the loop of the asyncio reactor).
+        '''
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.processes)
 
-            player_data[table_id] = []
+        future = self.pool.submit(get_player_item_from_text, response.url, response.text,
+                                  self.extract, self.table_ids)
+        item = await asyncio.wrap_future(future)
+        if item:
+            return [item]
+        return []
 
-            data_rows = data_table.xpath('tbody//tr[not(contains(@class, "thead"))]')
-            for data_row in data_rows:
+    def closed(self, reason):
+        if self.pool is not None:
+            self.pool.shutdown()
 
-                entry = {
-                    "player_id": player_id,
-                    "table_id": table_id,
-                }
-                
-                stats = data_row.xpath('th | td')
-                for stat in stats:
-                    try:
-                        dt_st = stat.attrib['data-stat']
-
-                        if stat.xpath('a'):   # if it has link...
-                            entry[dt_st] = stat.xpath('.//a/text()').get()
-                            entry['{}_href'.format(dt_st)] = stat.xpath('.//a/@href').get()
-                        else:
-                            entry[dt_st] = stat.xpath('text()').get()
-
-                        if 'csk' in stat.attrib:
-                            entry['{}_csk'.format(dt_st)] = stat.attrib['csk']
-
-                        if 'data-append-csv' in stat.attrib:
-                            entry['{}_data_append_csv'.format(dt_st)] = stat.attrib['data-append-csv']
-                    except KeyError:
-                        pass
-                        
-
-                player_data[table_id].append(entry)
-            pass # end player for
-        
-        if player_data:
-            yield { 'file_name': player_id, 
-                    'type': 'player', 
-                    'dir': 'players/data/{}'.format(player_id[0]), 
-                    'data': player_data, 
-                    'fieldnames': None }
+
+    def get_player_request(self, url):
+        '''
+        Request of a player page, or None if it was already requested.
+        '''
+        player_id = patterns.PLAYER_ID_RE.search(url).group(1)
+        if player_id in self.requested_players:
+            return None
+        self.requested_players.add(player_id)
+        return scrapy.Request(url, callback=self.parse_player)
+
+    def get_active_requests(self, list_entries):
+        '''
+        Requests of the players of a list active since min_year_max.
+        '''
+        BASE_URL = 'https://www.basketball-reference.com'
+        for entry in list_entries:
+            try:
+                year_max = int(entry['year_max'])
+            except (TypeError, ValueError):
+                continue
+            if year_max >= self.min_year_max and entry['player_href']:
+                request = self.get_player_request(BASE_URL + entry['player_href'])
+                if request:
+                    yield request
+
+    def load_stored_list(self, letter):
+        '''
+        Rows of INPUT_DIR/players/list/<letter>.csv, or None if not stored.
+        '''
+        input_dir = self.settings.get('INPUT_DIR') or self.settings.get('OUTPUT_DIR')
+        file_name = '{}/players/list/{}.csv'.format(input_dir, letter)
+        if not os.path.exists(file_name):
+            return None
+        with open(file_name, encoding='utf-8', newline='') as f:
+            return list(csv.DictReader(f))
 
     
     def get_list_keys(self):
-        keys = [
-            "player",
-            "player_href",
-            "player_id",
-            "year_min",
-            "year_max",
-            "pos",
-            "weight",
-            "height",
-            "height_csk",
-            "birth_date",
-            "birth_date_csk",
-            "colleges"
-        ]
-        return keys
+        return PlayerListRecord.FIELDS
 
     def get_list_entry(self):
-        entry = {}
-        keys = self.get_list_keys()
-
-        for key in keys:
-            entry[key] = None
-
-        return entry
+        return PlayerListRecord()
 
     def get_stats_keys(self):
         keys = [
@@ -269,4 +340,132 @@ class PlayerSpider(scrapy.Spider):
                 entry[key] = 0
             else:
                 entry[key] = None
-        return entry
\ No newline at end of file
+        return entry
+
+
+def get_player_item(url, selector, extract='comments', table_ids=None):
+    '''
+    Extracts the stats tables of a player page, given its selector.
+    Returns the player item, or None if the page has no tables.
+
+    Only tables whose id is in table_ids are extracted, if given.
+    '''
+    player_id = patterns.PLAYER_ID_RE.search(url).group(1)
+
+    player_data = {}
+    for table_id, entries in get_player_tables(player_id, selector, extract, table_ids):
+        player_data[table_id] = entries
+    
+    if player_data:
+        return { 'file_name': player_id, 
+                 'type': 'player', 
+                 'dir': 'players/data/{}'.format(player_id[0]), 
+                 'data': player_data, 
+                 'fieldnames': None }
+    return None
+
+def get_player_table_items(url, selector, extract='comments', table_ids=None):
+    '''
+    Stream mode: yields the stats tables of a player page one by one, then
+    the end item of the player file.
+    '''
+    player_id = patterns.PLAYER_ID_RE.search(url).group(1)
+    dir = 'players/data/{}'.format(player_id[0])
+
+    tables = 0
+    for table_id, entries in get_player_tables(player_id, selector, extract, table_ids):
+        tables += 1
+        yield get_table_item(dir, player_id, table_id, entries)
+
+    if tables:
+        yield get_end_item('player', dir, player_id)
+
+def get_player_tables(player_id, selector, extract='comments', table_ids=None):
+    '''
+    Yields the id and the rows of each stats table of a player page.
+    '''
+    if extract == 'full':
+        data_tables = get_stats_tables_full(selector)
+    else:
+        data_tables = get_stats_tables(selector, table_ids)
+
+    for data_table in data_tables:
+        table_id = data_table.attrib['id']
+        if table_ids and table_id not in table_ids:
+            continue
+
+        entries = []
+
+        data_rows = patterns.BODY_ROWS(data_table.root)
+        for data_row in data_rows:
+
+            entry = {
+                "player_id": player_id,
+                "table_id": table_id,
+            }
+            
+            stats = patterns.CELLS(data_row)
+            for stat in stats:
+                try:
+                    dt_st = stat.attrib['data-stat']
+
+                    if patterns.LINKS(stat):   # if it has link...
+                        entry[dt_st] = first(patterns.LINK_TEXT(stat))
+                        entry['{}_href'.format(dt_st)] = first(patterns.LINK_HREF(stat))
+                    else:
+                        entry[dt_st] = first(patterns.TEXT(stat))
+
+                    if 'csk' in stat.attrib:
+                        entry['{}_csk'.format(dt_st)] = stat.attrib['csk']
+
+                    if 'data-append-csv' in stat.attrib:
+                        entry['{}_data_append_csv'.format(dt_st)] = stat.attrib['data-append-csv']
+                except KeyError:
+                    pass
+                    
+
+            entries.append(entry)
+        pass # end player for
+
+        yield table_id, entries
+
+
+def get_stats_tables(selector, table_ids=None):
+    '''
+    Yields the stats tables of the page in document order. Most of them are
+    inside HTML comments: only the comments holding a stats table (one of
+    table_ids, if given) are parsed, as fragments.
+    '''
+    nodes_xpath = ('//table[contains(@class, "stats_table")]'
+                   ' | //comment()[contains(., "stats_table")]')
+
+    for node in selector.xpath(nodes_xpath):
+        if node.root.tag != 'table':  # comment
+            fragment = node.root.text
+            if table_ids and not any('id="{}"'.format(x) in fragment for x in table_ids):
+                continue
+
+            fragment_selector = scrapy.selector.Selector(text=fragment)
+            for data_table in fragment_selector.xpath('//table[contains(@class, "stats_table")]'):
+                yield data_table
+        else:
+            yield node
+
+def get_stats_tables_full(selector):
+    '''
+    Returns the stats tables of the page, removing every HTML comment marker
+    and parsing the whole body again (-a extract=full).
+    '''
+    # Tables are commented: need to remove HTML comments.
+    html_body = selector.xpath('//body').get()
+    html_body_uncommented = html_body.replace("<!--", "").replace("-->", "")
+    selector = scrapy.selector.Selector(text=html_body_uncommented)
+    return selector.xpath('//table[contains(@class, "stats_table")]')
+
+
+def get_player_item_from_text(url, text, extract='comments', table_ids=None):
+    '''
+    get_player_item from the page HTML. Runs in the parse worker processes.
+    '''
+    selector = scrapy.selector.Selector(text=text)
+    return get_player_item(url, selector, extract, table_ids)
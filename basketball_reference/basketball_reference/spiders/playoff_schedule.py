@@ -4,7 +4,9 @@ from scrapy.linkextractors import LinkExtractor
 from datetime import date
 # from scrapy.spiders import CrawlSpider, Rule
 
-import re
+from basketball_reference import patterns
+from basketball_reference.patterns import first
+from basketball_reference.records import GameRecord
 
 class BoxscoresSpider(scrapy.Spider):
     name = 'playoff_schedule'
@@ -30,6 +32,12 @@ class BoxscoresSpider(scrapy.Spider):
             if kwargs['date'] == 'today' or kwargs['date'] == 'season':
                 self.seasons = [date.today().year - 1, date.today().year, date.today().year + 1]
 
+        # Converts numeric fields to numbers at parse time (see schemas.py).
+        if 'typed' in kwargs:
+            self.typed = True
+        else:
+            self.typed = False
+
 
     def start_requests(self):
         '''
@@ -47,32 +55,33 @@ class BoxscoresSpider(scrapy.Spider):
         '''
         Extracts information about the 
         '''
-        games_xpath = '//table[@id="schedule"]//tbody//tr[not(contains(@class, "thead"))]'
-        games = response.xpath(games_xpath)
+        games = patterns.SCHEDULE_ROWS(response.selector.root)
 
-        season = re.search(r"/NBA_([0-9]{4})?_games.html", response.url).group(1)
+        season = patterns.PLAYOFF_SCHEDULE_URL_RE.search(response.url).group(1)
 
         entries = []
         for game in games:
             entry = self.get_game_entry()
 
-            entry["game_id"] = game.xpath('.//*[@data-stat="date_game"]//@csk').get()
+            entry["game_id"] = first(patterns.STAT_CSK(game, stat="date_game"))
             
             game_id = entry["game_id"] 
             y, m, d = int(game_id[0:4]), int(game_id[4:6]), int(game_id[6:8])
             entry["date"] = date(y, m, d).isoformat()
 
-            entry["start_time"] = game.xpath('.//*[@data-stat="game_start_time"]//text()').get()
-            entry["visitor_team"] = game.xpath('.//*[@data-stat="visitor_team_name"]//text()').get()
-            entry["visitor_team_id"] = game.xpath('.//*[@data-stat="visitor_team_name"]//@csk').get()[:3]
-            entry["visitor_pts"] = game.xpath('.//*[@data-stat="visitor_pts"]//text()').get()
-            entry["home_team"] = game.xpath('.//*[@data-stat="home_team_name"]//text()').get()
-            entry["home_team_id"] = game.xpath('.//*[@data-stat="home_team_name"]//@csk').get()[:3]
-            entry["home_pts"] = game.xpath('.//*[@data-stat="home_pts"]//text()').get()
-            entry["overtimes"] = game.xpath('.//*[@data-stat="overtimes"]//text()').get()
-            entry["attendance"] = game.xpath('.//*[@data-stat="attendance"]//text()').get()
-            entry["game_remarks"] = game.xpath('.//*[@data-stat="game_remarks"]//text()').get()
-
+            entry["start_time"] = first(patterns.STAT_TEXT(game, stat="game_start_time"))
+            entry["visitor_team"] = first(patterns.STAT_TEXT(game, stat="visitor_team_name"))
+            entry["visitor_team_id"] = first(patterns.STAT_CSK(game, stat="visitor_team_name"))[:3]
+            entry["visitor_pts"] = first(patterns.STAT_TEXT(game, stat="visitor_pts"))
+            entry["home_team"] = first(patterns.STAT_TEXT(game, stat="home_team_name"))
+            entry["home_team_id"] = first(patterns.STAT_CSK(game, stat="home_team_name"))[:3]
+            entry["home_pts"] = first(patterns.STAT_TEXT(game, stat="home_pts"))
+            entry["overtimes"] = first(patterns.STAT_TEXT(game, stat="overtimes"))
+            entry["attendance"] = first(patterns.STAT_TEXT(game, stat="attendance"))
+            entry["game_remarks"] = first(patterns.STAT_TEXT(game, stat="game_remarks"))
+
+            if self.typed:
+                entry.convert()
             entries.append(entry)
 
         if entries:
@@ -83,27 +92,7 @@ class BoxscoresSpider(scrapy.Spider):
                     'fieldnames': self.get_game_keys() }
 
     def get_game_keys(self):
-        keys = [
-            "game_id",
-            "date",
-            "start_time",
-            "visitor_team",
-            "visitor_team_id",
-            "visitor_pts",
-            "home_team",
-            "home_team_id",
-            "home_pts",
-            "overtimes",
-            "attendance",
-            "game_remarks"
-        ]
-        return keys
+        return GameRecord.FIELDS
 
     def get_game_entry(self):
-        entry = {}
-        keys = self.get_game_keys()
-
-        for key in keys:
-            entry[key] = None
-
-        return entry
+        return GameRecord()
@@ -3,7 +3,16 @@ import scrapy
 from scrapy.linkextractors import LinkExtractor
 from datetime import date
 
-import re, math
+import math
+
+from basketball_reference import patterns
+from basketball_reference.patterns import QUARTER_RE, PLAYER_RE, LEFT_RE, TOP_RE
+from basketball_reference.records import ShotRecord
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 class ShotsSpider(scrapy.Spider):
     name = 'shots'
@@ -52,6 +61,17 @@ class ShotsSpider(scrapy.Spider):
         else:
             self.games = ()
 
+        if 'only-schedules' in kwargs:
+            self.only_schedules = True
+        else:
+            self.only_schedules = False
+
+        # Converts numeric fields to numbers at parse time (see schemas.py).
+        if 'typed' in kwargs:
+            self.typed = True
+        else:
+            self.typed = False
+
 
     def start_requests(self):
         '''
@@ -78,45 +98,41 @@ class ShotsSpider(scrapy.Spider):
         Extracts information about the schedule.
         '''
         if not self.only_schedules:
-            for a in response.xpath('//a/@href'):
-                url = a.extract()
-                if re.match(r'/boxscores/shot-chart/(\d){9}([A-Z]){3}\.html', url):
-                    yield response.follow(url, callback=self.parse_game)
+            for url in patterns.SHOT_CHART_LINKS(response.selector.root):
+                yield response.follow(url, callback=self.parse_game)
 
             
     def parse_game(self, response):
-        game_id = re.search(r"/([\dA-Z]*)?.html", response.url).group(1)
+        game_id = patterns.GAME_ID_RE.search(response.url).group(1)
 
         shot_entries = []
         
-        teams = response.xpath('//div[starts-with(@id, "shots-")]')
+        teams = patterns.SHOTS_DIVS(response.selector.root)
 
         for team_shots in teams:
-            team_id = re.search(r"shots-([A-Z]{3})", team_shots.attrib['id']).group(1)
-            
-            shots = team_shots.xpath('*[@tip]')
-            
-            for shot in shots:
-                html_tip = shot.attrib['tip']
-                quarter = re.search(r'([\w\s]+),', html_tip).group(1)
-                time = re.search(r' ([\d]{1,2}:[\d]{2}.[\d]{1,2}) ', html_tip).group(1)
+            team_id = patterns.SHOTS_DIV_ID_RE.search(team_shots.get('id')).group(1)
 
-                if bool(re.search(r'2-pointer', html_tip)):
-                    points = 2
-                elif bool(re.search(r'3-pointer', html_tip)):
-                    points = 3
+            # Attributes of every shot of the team, in one pass.
+            shots = [(shot.get('tip'), shot.get('class'), shot.get('style'))
+                        for shot in team_shots
+                        if isinstance(shot.tag, str) and shot.get('tip') is not None]
 
+            xs = [LEFT_RE.search(html_style).group(1) for _, _, html_style in shots]
+            ys = [TOP_RE.search(html_style).group(1) for _, _, html_style in shots]
+            distances, angles, zones, corners = get_shots_geometry(xs, ys)
 
-                html_class = shot.attrib['class']
-                make = bool(re.search(r' make$', html_class))
-                player_id = re.search(r' p-([a-z]{1,7}[\d]{2}) ', html_class).group(1)
+            for index, (html_tip, html_class, html_style) in enumerate(shots):
+                quarter = QUARTER_RE.search(html_tip).group(1)
 
-                html_style = shot.attrib['style']
-                x = re.search(r'left:([\d]*)px', html_style).group(1)
-                y = re.search(r'top:([\d]*)px', html_style).group(1)
-                
-                distance = self.get_distance_cm(x, y)
+                if '2-pointer' in html_tip:
+                    points = 2
+                elif '3-pointer' in html_tip:
+                    points = 3
+                else:
+                    points = None
 
+                make = html_class.endswith(' make')
+                player_id = PLAYER_RE.search(html_class).group(1)
 
                 entry = self.get_shot_entry()
                 entry['game_id'] = game_id
@@ -125,12 +141,19 @@ class ShotsSpider(scrapy.Spider):
                 entry['quarter'] = quarter
                 entry['make'] = make
                 entry['points'] = points
-                entry['x_px'] = x
-                entry['y_px'] = y
-                entry['distance_cm'] = round(distance)
-
+                entry['x_px'] = xs[index]
+                entry['y_px'] = ys[index]
+                entry['distance_cm'] = distances[index]
+                entry['angle_deg'] = angles[index]
+                entry['zone'] = zones[index]
+                entry['corner_three'] = points == 3 and corners[index]
+
+                if self.typed:
+                    entry.convert()
                 shot_entries.append(entry)
-                    
+
+        # One item per game, once both teams are extracted.
+        if teams:
             yield { 'file_name': game_id[4:], 
                     'type': 'shot', 
                     'dir': 'games/shots/{}'.format(game_id[:4]), 
@@ -141,37 +164,91 @@ class ShotsSpider(scrapy.Spider):
 
     
     def get_shot_keys(self):
-        keys = [
-            'game_id',
-            'team_id',
-            'player_id',
-            'quarter',
-            'make',
-            'points',
-            'x_px',
-            'y_px',
-            'distance_cm',
-        ]
-        return keys
+        return ShotRecord.FIELDS
 
 
     def get_shot_entry(self):
-        entry = {}
-        keys = self.get_shot_keys()
-        for key in keys:
-            entry[key] = None
-        return entry
-
-
-
-    def get_distance_cm(self, x, y):
-        FT_TO_CM = 30.48
-        COURT_SIZE_PX = {'x': 500, 'y': 472}
-        COURT_SIZE_FT = {'x': 50, 'y': 94 / 2}
-        COURT_SIZE_CM = {'x': COURT_SIZE_FT['x'] * FT_TO_CM, 'y': COURT_SIZE_FT['y'] * FT_TO_CM}
-        POS_CM = {'x': float(x) / 10 * FT_TO_CM, 'y': float(y) / 10 * FT_TO_CM}
-        HOOP_POSITION_CM = {'x': COURT_SIZE_CM['x'] / 2, 'y': 160.02}
-        squared_x = (POS_CM['x'] - HOOP_POSITION_CM['x']) ** 2
-        squared_y = (POS_CM['y'] - HOOP_POSITION_CM['y']) ** 2
-        return math.sqrt(squared_x + squared_y)
+        return ShotRecord()
+
+
+# Court geometry. The chart is half a court, 10 px per foot, with the
+# baseline at the top (y = 0).
+FT_TO_CM = 30.48
+COURT_SIZE_FT = {'x': 50, 'y': 94 / 2}
+COURT_SIZE_CM = {'x': COURT_SIZE_FT['x'] * FT_TO_CM, 'y': COURT_SIZE_FT['y'] * FT_TO_CM}
+HOOP_POSITION_CM = {'x': COURT_SIZE_CM['x'] / 2, 'y': 160.02}
+
+RESTRICTED_AREA_CM = 4 * FT_TO_CM
+PAINT_HALF_WIDTH_CM = 8 * FT_TO_CM
+PAINT_LENGTH_CM = 19 * FT_TO_CM
+CORNER_THREE_CM = 22 * FT_TO_CM  # from the hoop, along the baseline
+CORNER_LENGTH_CM = 14 * FT_TO_CM  # straight part of the 3-point line
+THREE_POINT_CM = 23.75 * FT_TO_CM
+
+
+def get_shots_geometry(xs, ys):
+    '''
+    Computes, for all the shots of a team at once, from their x and y pixel
+    positions (strings):
+      - the distance to the hoop in cm (rounded),
+      - the angle to the hoop in degrees (0 is facing the hoop, rounded),
+      - the court zone: restricted_area, paint, corner_three, 
+        above_break_three or mid_range,
+      - whether the position is in the corners (below the 3-point arc break).
+    Uses NumPy if installed.
+    '''
+    if not xs:
+        return [], [], [], []
+
+    if np is None:
+        return get_shots_geometry_scalar(xs, ys)
+
+    pos_x = np.array(xs, dtype=float) / 10 * FT_TO_CM
+    pos_y = np.array(ys, dtype=float) / 10 * FT_TO_CM
+    delta_x = pos_x - HOOP_POSITION_CM['x']
+    delta_y = pos_y - HOOP_POSITION_CM['y']
+
+    distances = np.sqrt(delta_x ** 2 + delta_y ** 2)
+    angles = np.degrees(np.arctan2(delta_x, delta_y))
+
+    corners = pos_y <= CORNER_LENGTH_CM
+    zones = np.select(
+        [distances <= RESTRICTED_AREA_CM,
+         (np.abs(delta_x) <= PAINT_HALF_WIDTH_CM) & (pos_y <= PAINT_LENGTH_CM),
+         corners & (np.abs(delta_x) >= CORNER_THREE_CM),
+         distances >= THREE_POINT_CM],
+        ['restricted_area', 'paint', 'corner_three', 'above_break_three'],
+        default='mid_range')
+
+    return (np.rint(distances).astype(int).tolist(), 
+            np.rint(angles).astype(int).tolist(),
+            zones.tolist(), 
+            corners.tolist())
+
+def get_shots_geometry_scalar(xs, ys):
+    distances, angles, zones, corners = [], [], [], []
+    for x, y in zip(xs, ys):
+        pos_x = float(x) / 10 * FT_TO_CM
+        pos_y = float(y) / 10 * FT_TO_CM
+        delta_x = pos_x - HOOP_POSITION_CM['x']
+        delta_y = pos_y - HOOP_POSITION_CM['y']
+
+        distance = math.sqrt(delta_x ** 2 + delta_y ** 2)
+        corner = pos_y <= CORNER_LENGTH_CM
+
+        if distance <= RESTRICTED_AREA_CM:
+            zone = 'restricted_area'
+        elif abs(delta_x) <= PAINT_HALF_WIDTH_CM and pos_y <= PAINT_LENGTH_CM:
+            zone = 'paint'
+        elif corner and abs(delta_x) >= CORNER_THREE_CM:
+            zone = 'corner_three'
+        elif distance >= THREE_POINT_CM:
+            zone = 'above_break_three'
+        else:
+            zone = 'mid_range'
 
+        distances.append(round(distance))
+        angles.append(round(math.degrees(math.atan2(delta_x, delta_y))))
+        zones.append(zone)
+        corners.append(corner)
+    return distances, angles, zones, corners
@@ -0,0 +1,5 @@
+# Parse benchmarks of the spider callbacks.
+#
+# Run from the project directory (where scrapy.cfg is), e.g.:
+#
+#     $ python -m benchmarks.boxscores page.html
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+# Compares the single-pass lxml box score parser against the per-cell XPath
+# implementation of BoxscoresSpider.parse_game.
+#
+# Usage (from the project directory):
+#
+#     $ python -m benchmarks.boxscores <page.html | url> [-n 50]
+#
+# A URL is read from the snapshot store (SNAPSHOT_DIR).
+
+import argparse, csv, io, time
+
+from scrapy.http import HtmlResponse
+from scrapy.utils.project import get_project_settings
+
+from basketball_reference.snapshots import SnapshotStore
+from basketball_reference.spiders.boxscores import BoxscoresSpider
+
+
+def load_response(source):
+    if source.startswith('http'):
+        store = SnapshotStore(get_project_settings().get('SNAPSHOT_DIR'))
+        snapshot = store.get(source)
+        if snapshot is None:
+            raise SystemExit('No snapshot stored for {}'.format(source))
+        return HtmlResponse(url=source, body=snapshot['body'], encoding='utf-8')
+
+    # Local files are named after the game, as in the site: <game_id>.html
+    with open(source, mode='rb') as f:
+        body = f.read()
+    url = 'https://www.basketball-reference.com/boxscores/{}'.format(
+                source.replace('\\', '/').split('/')[-1])
+    return HtmlResponse(url=url, body=body, encoding='utf-8')
+
+
+def render_csv(items):
+    output = io.StringIO()
+    for item in items:
+        writer = csv.DictWriter(output, fieldnames=item['fieldnames'], 
+                                extrasaction='ignore', lineterminator='\n')
+        writer.writeheader()
+        for entry in item['data']:
+            writer.writerow(entry)
+    return output.getvalue()
+
+
+def run(spider, response, number):
+    start = time.perf_counter()
+    for _ in range(number):
+        items = list(spider.parse_game(response))
+    elapsed = time.perf_counter() - start
+    rows = sum(len(item['data']) for item in items)
+    return items, elapsed, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Single-pass lxml vs per-cell XPath box score parser.')
+    parser.add_argument('source', help='box score HTML file or snapshot URL')
+    parser.add_argument('-n', '--number', type=int, default=50, 
+                        help='parses per implementation')
+    args = parser.parse_args()
+
+    response = load_response(args.source)
+
+    results = {}
+    for name in ['xpath', 'lxml']:
+        spider = BoxscoresSpider(parser=name)
+        results[name] = run(spider, response, args.number)
+
+    if render_csv(results['xpath'][0]) != render_csv(results['lxml'][0]):
+        raise SystemExit('CSV output differs between implementations.')
+
+    for name, (items, elapsed, rows) in results.items():
+        print('{:>6}: {:8.2f} ms/page  {:10.0f} rows/s'.format(
+                name, elapsed / args.number * 1000, rows * args.number / elapsed))
+    print('speedup: {:.1f}x'.format(results['xpath'][1] / results['lxml'][1]))
+
+
+if __name__ == '__main__':
+    main()
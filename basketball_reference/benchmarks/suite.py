@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+
+# Benchmark suite of the spider callbacks and the pipeline write path, run
+# against recorded HTML fixtures (a snapshot store, see snapshots.py).
+#
+# The committed fixtures are reduced pages with the markup of the real ones
+# (commented tables, shot tooltips, ...), also used by the tests. record
+# --force replaces them with the real pages.
+#
+# Usage (from the project directory):
+#
+#     $ python -m benchmarks.suite record --force       # downloads the real pages
+#     $ python -m benchmarks.suite run --json now.json
+#     $ python -m benchmarks.suite run --baseline now.json  # fails on regressions
+
+import argparse, json, os, sys, tempfile, time, tracemalloc
+import urllib.request
+
+from scrapy.http import HtmlResponse
+from scrapy.utils.project import get_project_settings
+
+from basketball_reference import pipelines
+from basketball_reference.snapshots import SnapshotStore
+from basketball_reference.spiders.boxscores import BoxscoresSpider
+from basketball_reference.spiders.player import PlayerSpider
+from basketball_reference.spiders.shots import ShotsSpider
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+BASE_URL = 'https://www.basketball-reference.com'
+FIXTURES = {
+    'schedule': BASE_URL + '/leagues/NBA_2021_games-december.html',
+    'boxscore': BASE_URL + '/boxscores/202012220BRK.html',
+    'shot_chart': BASE_URL + '/boxscores/shot-chart/202012220BRK.html',
+    'player_list': BASE_URL + '/players/c/',
+    'player': BASE_URL + '/players/c/cartevi01.html',
+}
+
+# Digests of the committed reduced fixtures (about 5 rows per table): their
+# timings say little about the real pages, record them before comparing runs.
+SYNTHETIC_DIGESTS = {
+    'a99098d92e8ee481c3f2b6dc6c6a342f1c77d4e8',
+    'e1762a7f7359e181856b210abdad99966b7090f3',
+    '767a2bd59a2d50dd688c31310ffd5a6dd59dcdd7',
+    'b19ef9348289ad0661843b6c7b6d18e5a20567ec',
+    'a698f2894c36c92cba636e8d234a91a26ef1e9be',
+}
+
+# name: (fixture, spider factory, callback name, items used by the write benchmarks)
+CASES = {
+    'parse_schedule': ('schedule', lambda: BoxscoresSpider(), 'parse_schedule', True),
+    'parse_game (boxscores)': ('boxscore', lambda: BoxscoresSpider(), 'parse_game', True),
+    'parse_game (boxscores, xpath)': ('boxscore', lambda: BoxscoresSpider(parser='xpath'), 'parse_game', False),
+    'parse_game (shots)': ('shot_chart', lambda: ShotsSpider(), 'parse_game', True),
+    'parse_list': ('player_list', lambda: PlayerSpider(), 'parse_list', True),
+    'parse_player': ('player', lambda: PlayerSpider(), 'parse_player', True),
+    'parse_player (full)': ('player', lambda: PlayerSpider(extract='full'), 'parse_player', False),
+}
+
+PIPELINES = {
+    'csv': pipelines.BasketballReferencePipeline,
+    'csv (pooled)': pipelines.CsvWriterPipeline,
+    'parquet': pipelines.ParquetPipeline,
+}
+
+
+def record(args):
+    '''
+    Downloads the fixtures into the store, respecting the site rate limit.
+    '''
+    store = SnapshotStore(args.fixtures)
+    for name, url in FIXTURES.items():
+        if url in store and not args.force:
+            continue
+        print('Recording {} ({})'.format(name, url))
+        request = urllib.request.Request(url, headers={'User-Agent': 'basketball_reference'})
+        with urllib.request.urlopen(request) as response:
+            headers = {'Content-Type': response.headers.get('Content-Type', 'text/html')}
+            store.put(url, response.read(), headers, response.status)
+        time.sleep(3)
+
+
+def load_responses(fixtures_dir):
+    store = SnapshotStore(fixtures_dir)
+    responses = {}
+    for name, url in FIXTURES.items():
+        snapshot = store.get(url)
+        if snapshot is None:
+            sys.exit('Missing fixture {}, run: python -m benchmarks.suite record'.format(name))
+        responses[name] = HtmlResponse(url=url, body=snapshot['body'], encoding='utf-8')
+    return responses
+
+
+def get_synthetic(fixtures_dir):
+    '''
+    Names of the fixtures still the committed reduced pages.
+    '''
+    store = SnapshotStore(fixtures_dir)
+    return [name for name, url in FIXTURES.items()
+            if url in store and store.get(url)['digest'] in SYNTHETIC_DIGESTS]
+
+
+def run_callback(spider, callback, response):
+    result = getattr(spider, callback)(response)
+    return [x for x in result if isinstance(x, dict)]
+
+
+def bench_callback(factory, callback, response, number):
+    spider = factory()
+
+    # Peak Python heap of a single parse
+    tracemalloc.start()
+    items = run_callback(spider, callback, response)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(number):
+        run_callback(spider, callback, response)
+    elapsed = time.perf_counter() - start
+
+    rows = sum(pipelines.count_rows(item) for item in items)
+    result = {
+        'pages_per_sec': number / elapsed,
+        'rows_per_sec': rows * number / elapsed,
+        'rows': rows,
+        'peak_memory_kb': peak_memory / 1024,
+    }
+    return result, items
+
+
+def bench_pipeline(pipeline_cls, items, number):
+    '''
+    Writes items number times into a temporary OUTPUT_DIR.
+    '''
+    with tempfile.TemporaryDirectory() as output_dir:
+        settings = get_project_settings().copy()
+        settings.set('OUTPUT_DIR', output_dir)
+        settings.set('DELTA_ENABLED', False)  # every run writes the files
+        spider = BoxscoresSpider()
+        spider.settings = settings
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        for _ in range(number):
+            pipeline = pipeline_cls()
+            pipeline.open_spider(spider)
+            for item in items:
+                pipeline.process_item(item, spider)
+            if hasattr(pipeline, 'close_spider'):
+                pipeline.close_spider(spider)
+        elapsed = time.perf_counter() - start
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        bytes_written = 0
+        for dir_path, dir_names, file_names in os.walk(output_dir):
+            for file_name in file_names:
+                bytes_written += os.path.getsize(os.path.join(dir_path, file_name))
+
+    rows = sum(pipelines.count_rows(item) for item in items)
+    return {
+        'pages_per_sec': len(items) * number / elapsed,
+        'rows_per_sec': rows * number / elapsed,
+        'rows': rows,
+        'peak_memory_kb': peak_memory / 1024,
+        'bytes_written': bytes_written,
+    }
+
+
+def run(args):
+    responses = load_responses(args.fixtures)
+
+    results = {}
+    all_items = []
+    for name, (fixture, factory, callback, written) in CASES.items():
+        results[name], items = bench_callback(factory, callback, responses[fixture], args.number)
+        if written:
+            all_items.extend(items)
+
+    for name, pipeline_cls in PIPELINES.items():
+        if pipeline_cls is pipelines.ParquetPipeline and pipelines.pa is None:
+            continue
+        results['write: {}'.format(name)] = bench_pipeline(pipeline_cls, all_items, args.number)
+
+    print('{:<32} {:>10} {:>12} {:>8} {:>12}'.format(
+            'benchmark', 'pages/s', 'rows/s', 'rows', 'peak KiB'))
+    for name, result in results.items():
+        print('{:<32} {:>10.1f} {:>12.0f} {:>8} {:>12.0f}'.format(
+                name, result['pages_per_sec'], result['rows_per_sec'],
+                result['rows'], result['peak_memory_kb']))
+
+    if args.json:
+        with open(args.json, mode='w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        synthetic = get_synthetic(args.fixtures)
+        if synthetic:
+            print('Warning: {} are the committed reduced fixtures, run: python -m benchmarks.suite '
+                  'record --force'.format(', '.join(synthetic)), file=sys.stderr)
+
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+        regressions = []
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            ratio = result['pages_per_sec'] / baseline[name]['pages_per_sec']
+            if ratio < 1 - args.tolerance:
+                regressions.append('{}: {:.0%} of baseline'.format(name, ratio))
+        if regressions:
+            sys.exit('Performance regressions:\n  ' + '\n  '.join(regressions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Spider callbacks and pipelines benchmarks.')
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help='fixtures snapshot store')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    record_parser = commands.add_parser('record', help='download the fixtures')
+    record_parser.add_argument('--force', action='store_true', help='download them again')
+    record_parser.set_defaults(func=record)
+
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('-n', '--number', type=int, default=20, help='runs per benchmark')
+    run_parser.add_argument('--json', help='write the results to this file')
+    run_parser.add_argument('--baseline', help='results file to compare with')
+    run_parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='allowed pages/s drop against the baseline (0.2 = 20%%)')
+    run_parser.set_defaults(func=run)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+# Offline tests. Pages come from the benchmark fixtures (benchmarks/fixtures,
+# a snapshot store, see snapshots.py).
+
+import os, sys
+
+import pytest
+from scrapy.settings import Settings
+from scrapy.signalmanager import SignalManager
+from scrapy.statscollectors import MemoryStatsCollector
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from basketball_reference import settings as project_settings
+
+
+class Spider:
+    '''
+    Stand-in for the spider passed to the pipelines: settings and logger.
+    '''
+    name = 'test'
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.logger = Logger()
+
+
+class Logger:
+    def __init__(self):
+        self.errors = []
+
+    def error(self, message):
+        self.errors.append(message)
+
+    def info(self, message):
+        pass
+
+    warning = info
+
+
+@pytest.fixture
+def settings(tmp_path):
+    settings = Settings()
+    settings.setmodule(project_settings)
+    settings.set('OUTPUT_DIR', str(tmp_path / 'data'))
+    return settings
+
+@pytest.fixture
+def spider(settings):
+    return Spider(settings)
+
+class Crawler:
+    '''
+    Stand-in for the crawler of the middlewares and extensions: settings,
+    stats and signals, no engine.
+    '''
+    engine = None
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.stats = MemoryStatsCollector(self)
+        self.signals = SignalManager(self)
+
+@pytest.fixture
+def crawler(settings):
+    return Crawler(settings)
+
+
+class Clock:
+    '''
+    Replaces time.monotonic in the tests, advanced by hand.
+    '''
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    import time
+    clock = Clock()
+    monkeypatch.setattr(time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture(scope='session')
+def responses():
+    '''
+    Responses of the benchmark fixtures, by name (see benchmarks/suite.py).
+    '''
+    from benchmarks.suite import FIXTURES_DIR, load_responses
+    return load_responses(FIXTURES_DIR)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import os, csv, gzip
+
+from basketball_reference.compaction import SeasonArchive
+
+
+def write_game(dir_path, game_id, rows, fieldnames=('game_id', 'pnum')):
+    os.makedirs(dir_path, exist_ok=True)
+    with open('{}/{}.csv'.format(dir_path, game_id[4:]), mode='w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore', lineterminator='\n')
+        writer.writeheader()
+        writer.writerows({'game_id': game_id, 'pnum': str(x), 'pts': '10'} for x in range(rows))
+
+def read_archive(path):
+    with gzip.open(path, mode='rt', encoding='utf-8', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def test_compact(tmp_path):
+    dir_path = str(tmp_path / '2020')
+    write_game(dir_path, '202012230BOS', 2)
+    write_game(dir_path, '202012250LAL', 1)
+    assert SeasonArchive(dir_path).compact() == ['202012230BOS', '202012250LAL']
+
+    # Unchanged games are skipped, an earlier game rewrites the archive
+    write_game(dir_path, '202012220BRK', 3)
+    archive = SeasonArchive(dir_path)
+    assert archive.compact() == ['202012220BRK']
+    assert archive.game_ids() == ['202012220BRK', '202012230BOS', '202012250LAL']
+    assert [x['pnum'] for x in archive.read_game('202012230BOS')] == ['0', '1']
+
+    rows = read_archive(archive.path)
+    assert [x['game_id'] for x in rows] == ['202012220BRK'] * 3 + ['202012230BOS'] * 2 + ['202012250LAL']
+
+def test_compact_new_columns(tmp_path):
+    dir_path = str(tmp_path / '2020')
+    write_game(dir_path, '202012220BRK', 1)
+    SeasonArchive(dir_path).compact()
+    write_game(dir_path, '202012230BOS', 1, fieldnames=('game_id', 'pts', 'pnum'))
+
+    write_game(dir_path, '202012250LAL', 1)
+    archive = SeasonArchive(dir_path)
+    archive.compact()
+    assert archive.index['fieldnames'] == ['game_id', 'pnum', 'pts']
+    assert archive.read_game('202012220BRK') == [{'game_id': '202012220BRK', 'pnum': '0', 'pts': ''}]
+    assert archive.read_game('202012230BOS') == [{'game_id': '202012230BOS', 'pnum': '0', 'pts': '10'}]
+    assert [x['pts'] for x in read_archive(archive.path)] == ['', '10', '']
+
+def test_compact_remove_twice(tmp_path):
+    dir_path = str(tmp_path / '2020')
+    write_game(dir_path, '202012220BRK', 2)
+    assert SeasonArchive(dir_path).compact(remove=True) == ['202012220BRK']
+    assert not os.path.exists(dir_path)
+
+    archive = SeasonArchive(dir_path)
+    assert archive.compact(remove=True) == []
+    assert archive.game_ids() == ['202012220BRK']
+
+def test_compact_new_columns_first_run(tmp_path):
+    dir_path = str(tmp_path / '2020')
+    write_game(dir_path, '202012220BRK', 1)
+    write_game(dir_path, '202012230BOS', 1, fieldnames=('game_id', 'pnum', 'pts'))
+    archive = SeasonArchive(dir_path)
+    archive.compact(remove=True)
+    assert [x['pts'] for x in read_archive(archive.path)] == ['', '10']
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from scrapy import Request
+from scrapy.exceptions import IgnoreRequest
+from twisted.python.failure import Failure as TwistedFailure
+
+from basketball_reference.frontier import CrawlFrontier, get_kind, PENDING, DONE, FAILED
+from basketball_reference.middlewares import FrontierMiddleware
+from basketball_reference.spiders.boxscores import BoxscoresSpider
+
+GAME_URLS = ['https://www.basketball-reference.com/boxscores/202012220BRK.html',
+             'https://www.basketball-reference.com/boxscores/202012230BOS.html']
+
+
+def test_frontier(tmp_path):
+    frontier = CrawlFrontier(str(tmp_path / 'boxscores.sqlite'))
+    frontier.add(GAME_URLS[0], 'parse_game')
+    frontier.add(GAME_URLS[1], 'parse_game')
+    frontier.set_status(GAME_URLS[0], DONE)
+    frontier.add(GAME_URLS[0], 'parse_game')  # already known
+    frontier.close()
+
+    frontier = CrawlFrontier(str(tmp_path / 'boxscores.sqlite'))
+    assert frontier.get_status(GAME_URLS[0]) == DONE
+    assert frontier.get_urls(PENDING) == [(GAME_URLS[1], 'parse_game')]
+    assert frontier.count() == {DONE: 1, PENDING: 1}
+    assert get_kind(GAME_URLS[0]) == 'game'
+
+
+def get_middleware(crawler, tmp_path):
+    crawler.settings.set('FRONTIER_DIR', str(tmp_path / 'frontier'))
+    return FrontierMiddleware(crawler)
+
+def test_resume(crawler, responses, tmp_path):
+    spider = BoxscoresSpider()
+    response = responses['schedule'].replace(request=Request(responses['schedule'].url))
+
+    start_requests = [Request(response.url, callback=spider.parse_schedule)]
+    middleware = get_middleware(crawler, tmp_path)
+    assert len(list(middleware.process_start_requests(start_requests, spider))) == 1
+    result = list(middleware.process_spider_output(response, spider.parse_schedule(response), spider))
+    assert [x.url for x in result if isinstance(x, Request)] == GAME_URLS
+    middleware.request_failed(GAME_URLS[1], spider, Failure())
+    middleware.spider_closed(spider)
+
+    # Restarted crawl: the schedule is done, the first game is resumed
+    middleware = get_middleware(crawler, tmp_path)
+    requests = list(middleware.process_start_requests(start_requests, spider))
+    assert [(x.url, x.callback.__name__) for x in requests] == [(GAME_URLS[0], 'parse_game')]
+    assert middleware.get_frontier(spider).get_status(GAME_URLS[1]) == FAILED
+    middleware.spider_closed(spider)
+
+    # Retry pass: only the failed game
+    crawler.settings.set('FRONTIER_RETRY', True)
+    middleware = get_middleware(crawler, tmp_path)
+    requests = list(middleware.process_start_requests(start_requests, spider))
+    assert [x.url for x in requests] == [GAME_URLS[1]]
+
+def test_dropped_requests(crawler, tmp_path):
+    spider = BoxscoresSpider()
+    middleware = get_middleware(crawler, tmp_path)
+    frontier = middleware.get_frontier(spider)
+
+    requests = [Request(GAME_URLS[0]), Request(GAME_URLS[0] + '#line_score'), Request(GAME_URLS[0]),
+                Request(GAME_URLS[1]), Request('https://www.sports-reference.com/')]
+    assert all(middleware.filter_output(x, spider) for x in requests)
+    for request in requests[:4]:
+        middleware.request_scheduled(request, spider)
+
+    # Duplicates: of another URL are done, of the same URL left to the scheduled one
+    middleware.request_dropped(requests[1], spider)
+    middleware.request_dropped(requests[2], spider)
+    assert frontier.get_status(requests[1].url) == DONE
+    assert frontier.get_status(GAME_URLS[0]) == PENDING
+
+    middleware.request_failed(GAME_URLS[1], spider, TwistedFailure(IgnoreRequest('Forbidden by robots.txt')))
+    assert frontier.get_status(GAME_URLS[1]) == DONE
+    assert frontier.get_status('https://www.sports-reference.com/') is None
+    middleware.spider_closed(spider)
+
+
+class Failure:
+    def getErrorMessage(self):
+        return 'Connection refused'
+
+    def check(self, *types):
+        return None
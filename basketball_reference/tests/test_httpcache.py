@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from scrapy import Request
+from scrapy.http import HtmlResponse
+
+from basketball_reference.httpcache import SeasonCachePolicy
+
+URL = 'https://www.basketball-reference.com/boxscores/202012220BRK.html'
+SCHEDULE_URL = 'https://www.basketball-reference.com/leagues/NBA_2021_games-december.html'
+
+
+def get_cached_response(url, date=None):
+    headers = {'Date': date} if date else {}
+    return HtmlResponse(url, body=b'', headers=headers)
+
+def test_last_date(settings):
+    policy = SeasonCachePolicy(settings)
+    assert str(policy.get_last_date(URL)) == '2020-12-22'
+    assert str(policy.get_last_date(SCHEDULE_URL)) == '2020-12-31'
+    assert policy.get_last_date('https://www.basketball-reference.com/players/c/') is None
+
+def test_final_copy_is_fresh(settings):
+    policy = SeasonCachePolicy(settings)
+    cached = get_cached_response(URL, 'Sat, 26 Dec 2020 10:00:00 GMT')
+    assert policy.is_cached_response_fresh(cached, Request(URL))
+
+def test_game_night_copy_is_downloaded(settings):
+    policy = SeasonCachePolicy(settings)
+    for date in ['Tue, 22 Dec 2020 23:00:00 GMT', None]:
+        request = Request(URL)
+        assert not policy.is_cached_response_fresh(get_cached_response(URL, date), request)
+        assert b'If-None-Match' not in request.headers
+
+def test_current_pages_are_revalidated(settings):
+    policy = SeasonCachePolicy(settings)
+    url = 'https://www.basketball-reference.com/players/c/'
+    cached = get_cached_response(url, 'Sat, 26 Dec 2020 10:00:00 GMT')
+    cached.headers['Last-Modified'] = 'Fri, 25 Dec 2020 10:00:00 GMT'
+    request = Request(url)
+    assert not policy.is_cached_response_fresh(cached, request)
+    assert b'If-Modified-Since' in request.headers
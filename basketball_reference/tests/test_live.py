@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import pytest
+from scrapy import Request
+from scrapy.http import HtmlResponse
+
+from basketball_reference.spiders.boxscores import BoxscoresSpider
+
+GAME_ID = '202012220BRK'
+
+
+@pytest.fixture
+def polls(monkeypatch):
+    '''
+    Games whose next poll was scheduled, in order.
+    '''
+    from twisted.internet import reactor
+    polls = []
+    monkeypatch.setattr(reactor, 'callLater', lambda delay, f, game_id: polls.append(game_id))
+    return polls
+
+def get_spider(max_polls=3):
+    spider = BoxscoresSpider(poll='120', max_polls=str(max_polls))
+    spider.live_games[GAME_ID] = {'rows': {}, 'polls': 0}
+    return spider
+
+def get_response(responses, status='4th Qtr, 2:10'):
+    response = responses['boxscore']
+    body = response.body.replace(b'<body>', '<body><div class="scorebox_meta"><div>{}</div></div>'.format(
+                                    status).encode('utf-8'), 1)
+    request = get_spider().get_live_request(GAME_ID)
+    return response.replace(body=body, request=request)
+
+
+def test_halftime_is_not_final(responses, polls):
+    spider = get_spider()
+    response = get_response(responses, 'Halftime')
+    items = list(spider.parse_live_game(response))
+    assert [x['type'] for x in items] == ['boxscore_update', 'boxscore_update']
+
+    # Unchanged rows: still polled until the page is final
+    assert list(spider.parse_live_game(response)) == []
+    assert polls == [GAME_ID, GAME_ID]
+
+    items = list(spider.parse_live_game(get_response(responses, 'Final/OT')))
+    assert [x['type'] for x in items] == ['boxscore', 'boxscore']
+    assert len(polls) == 2
+    assert not spider.live_games
+
+def test_max_polls(responses, polls):
+    spider = get_spider(max_polls=2)
+    response = get_response(responses)
+    list(spider.parse_live_game(response))
+    items = list(spider.parse_live_game(response))
+    assert [x['type'] for x in items] == ['boxscore', 'boxscore']
+    assert not spider.live_games
+
+def test_unpublished_game(polls):
+    spider = get_spider()
+    url = spider.get_live_request(GAME_ID).url
+    response = HtmlResponse(url, status=404, body=b'', request=Request(url, meta={'game_id': GAME_ID}))
+    for _ in range(3):
+        assert list(spider.parse_live_game(response)) == []
+    assert len(polls) == 2
+    assert not spider.live_games
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from scrapy import Request
+
+from basketball_reference.extensions import MetricsServer
+from basketball_reference.middlewares import InstrumentationMiddleware
+from basketball_reference.spiders.boxscores import BoxscoresSpider
+
+
+def test_parse_seconds_without_instrumentation(settings, crawler, responses):
+    settings.set('INSTRUMENTATION_ENABLED', False)
+    settings.set('METRICS_ENABLED', True)
+    metrics = MetricsServer.from_crawler(crawler)
+    middleware = InstrumentationMiddleware.from_crawler(crawler)
+
+    spider = BoxscoresSpider()
+    response = responses['boxscore'].replace(request=Request(responses['boxscore'].url, callback=spider.parse_game))
+    items = list(middleware.process_spider_output(response, spider.parse_game(response), spider))
+    assert len(items) == 2
+
+    lines = metrics.render().splitlines()
+    assert 'basketball_reference_parse_seconds_count{callback="parse_game",spider=""} 1' in lines
+    assert any(x.startswith('basketball_reference_parse_seconds{callback="parse_game",quantile="0.5"') for x in lines)
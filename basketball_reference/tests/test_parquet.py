@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from basketball_reference.items import get_row_item, get_end_item
+from basketball_reference.pipelines import ParquetPipeline
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+from test_pipelines import get_boxscore_item, crawl
+
+
+def read_partition(settings):
+    path = '{}/parquet/boxscores/year=2020/box_type=basic'.format(settings.get('OUTPUT_DIR'))
+    return path, pq.read_table(path).to_pylist()
+
+
+def test_stream_items(settings, spider):
+    settings.set('PARQUET_BATCH_SIZE', 2)
+    item = get_boxscore_item('202012220BRK', 5)
+    items = [get_row_item('boxscore', item['dir'], item['file_name'], item['fieldnames'], x)
+             for x in item['data']]
+    items.append(get_end_item('boxscore', item['dir'], item['file_name']))
+
+    crawl(ParquetPipeline(), items, spider)
+
+    path, rows = read_partition(settings)
+    assert sorted(x['pnum'] for x in rows) == [0, 1, 2, 3, 4]
+    assert not spider.logger.errors
+
+
+def test_batches_are_new_parts(settings, spider):
+    settings.set('PARQUET_BATCH_SIZE', 3)
+    crawl(ParquetPipeline(), [get_boxscore_item('202012220BRK', 3),
+                              get_boxscore_item('202012230BOS', 3)], spider)
+    path, rows = read_partition(settings)
+    assert len(os.listdir(path)) == 2
+    assert len(rows) == 6
+
+
+def test_rescraped_games_replace_stored_rows(settings, spider):
+    crawl(ParquetPipeline(), [get_boxscore_item('202012220BRK', 3),
+                              get_boxscore_item('202012230BOS', 2)], spider)
+    crawl(ParquetPipeline(), [get_boxscore_item('202012230BOS', 4)], spider)
+
+    path, rows = read_partition(settings)
+    games = [x['game_id'] for x in rows]
+    assert games.count('202012220BRK') == 3
+    assert games.count('202012230BOS') == 4
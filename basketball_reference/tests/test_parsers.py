@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import os, csv
+
+from basketball_reference.pipelines import BasketballReferencePipeline
+from basketball_reference.spiders.boxscores import BoxscoresSpider
+from basketball_reference.spiders.games import GamesSpider
+from basketball_reference.spiders.player import PlayerSpider
+from basketball_reference.spiders.shots import ShotsSpider
+
+
+def get_rows(items):
+    return [(x['dir'], x['file_name'], [dict(row.items()) for row in x['data']]) for x in items]
+
+
+def test_boxscore_parsers(responses):
+    items = list(BoxscoresSpider().parse_game(responses['boxscore']))
+    xpath_items = list(BoxscoresSpider(parser='xpath').parse_game(responses['boxscore']))
+    assert get_rows(items) == get_rows(xpath_items)
+
+    assert [x['dir'] for x in items] == ['games/boxscores/advanced/2020', 'games/boxscores/basic/2020']
+    assert {row['team_id'] for row in items[1]['data']} == {'GSW', 'BRK'}
+
+def test_boxscore_stream(responses):
+    items = list(BoxscoresSpider().parse_game(responses['boxscore']))
+    stream_items = list(BoxscoresSpider(stream='1').parse_game(responses['boxscore']))
+
+    stream_rows = {}  # dir -> rows, in order
+    for x in stream_items:
+        stream_rows.setdefault(x['dir'], []).extend(dict(row.items()) for row in x['data'])
+    assert stream_rows == {x['dir']: [dict(row.items()) for row in x['data']] for x in items}
+    assert len([x for x in stream_items if x.get('end')]) == 2
+
+def test_typed_boxscore(responses, spider):
+    # A player without field goal attempts has an empty fg_pct cell
+    body = responses['boxscore'].body.replace(b'<td data-stat="fg_pct">.000</td>', b'<td data-stat="fg_pct"></td>', 1)
+    response = responses['boxscore'].replace(body=body)
+
+    items = list(BoxscoresSpider(typed='1').parse_game(response))
+    rows = items[1]['data']
+    assert [(x['pnum'], x['fg_pct']) for x in rows[:2]] + [(rows[5]['pnum'], rows[5]['fg_pct'])] == [
+        (1, None), (2, 0.1), (6, 0.5)]
+
+    pipeline = BasketballReferencePipeline()
+    pipeline.open_spider(spider)
+    pipeline.process_item(items[1], spider)
+    path = '{}/{}/{}.csv'.format(spider.settings.get('OUTPUT_DIR'), items[1]['dir'], items[1]['file_name'])
+    with open(path, encoding='utf-8', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [x['fg_pct'] for x in rows[:2]] == ['', '0.1']
+
+def test_player_extract(responses):
+    item = next(PlayerSpider().parse_player(responses['player']))
+    full_item = next(PlayerSpider(extract='full').parse_player(responses['player']))
+    assert item['data'] == full_item['data']
+    assert list(item['data']) == ['per_game', 'totals', 'advanced']
+
+def test_shots(responses):
+    items = [x for x in ShotsSpider().parse_game(responses['shot_chart']) if isinstance(x, dict)]
+    assert sum(len(x['data']) for x in items) == 80
+
+def test_shots_schedule(responses):
+    requests = list(ShotsSpider(seasons='2021').parse_schedule(responses['schedule']))
+    assert [x.url for x in requests] == ['https://www.basketball-reference.com/boxscores/shot-chart/202012220BRK.html']
+    assert not list(ShotsSpider(**{'only-schedules': '1'}).parse_schedule(responses['schedule']))
+
+def get_urls(spider, response):
+    return [x.url for x in spider.parse_schedule(response) if not isinstance(x, dict)]
+
+def test_games_fan_out(responses, settings):
+    BASE_URL = 'https://www.basketball-reference.com/boxscores/'
+    boxscores = [BASE_URL + '202012220BRK.html', BASE_URL + '202012230BOS.html']
+    shots = [BASE_URL + 'shot-chart/202012220BRK.html', BASE_URL + 'shot-chart/202012230BOS.html']
+
+    assert get_urls(GamesSpider(), responses['schedule']) == [boxscores[0], shots[0], boxscores[1], shots[1]]
+    assert get_urls(GamesSpider(**{'no-shots': '1'}), responses['schedule']) == boxscores
+    assert get_urls(GamesSpider(**{'no-boxscores': '1'}), responses['schedule']) == shots
+
+    # Stored box scores and shot charts are skipped separately
+    output_dir = settings.get('OUTPUT_DIR')
+    for path in ['games/boxscores/basic/2020/12220BRK.csv', 'games/shots/2020/12230BOS.csv']:
+        os.makedirs(os.path.dirname('{}/{}'.format(output_dir, path)), exist_ok=True)
+        open('{}/{}'.format(output_dir, path), mode='w').close()
+
+    spider = GamesSpider(incremental='1')
+    spider.settings = settings
+    list(spider.start_requests())
+    assert get_urls(spider, responses['schedule']) == [shots[0], boxscores[1]]
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+import os, csv, json
+
+from basketball_reference.items import get_row_item, get_end_item
+from twisted.internet import defer, threads
+
+from basketball_reference.pipelines import BasketballReferencePipeline, CsvWriterPipeline, ThreadedWriterPipeline
+from basketball_reference.spiders.boxscores import BoxscoresSpider
+from basketball_reference.spiders.player import PlayerSpider
+
+
+def get_boxscore_item(game_id, rows):
+    return { 'file_name': game_id[4:],
+             'type': 'boxscore',
+             'dir': 'games/boxscores/basic/{}'.format(game_id[:4]),
+             'data': [{'game_id': game_id, 'pnum': x} for x in range(rows)],
+             'fieldnames': ['game_id', 'pnum'] }
+
+def read_rows(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def crawl(pipeline, items, spider):
+    pipeline.open_spider(spider)
+    for item in items:
+        pipeline.process_item(item, spider)
+    pipeline.close_spider(spider)
+
+
+def test_consolidated_refresh_replaces_stored_games(settings, spider):
+    settings.set('CSV_CONSOLIDATE', True)
+    path = '{}/games/boxscores/basic/2020.csv'.format(settings.get('OUTPUT_DIR'))
+
+    crawl(CsvWriterPipeline(), [get_boxscore_item('202012220BRK', 3),
+                                get_boxscore_item('202012230BOS', 2)], spider)
+    crawl(CsvWriterPipeline(), [get_boxscore_item('202012230BOS', 4),
+                                get_boxscore_item('202012250LAL', 1)], spider)
+
+    rows = read_rows(path)
+    games = [x['game_id'] for x in rows]
+    assert games.count('202012220BRK') == 3
+    assert games.count('202012230BOS') == 4
+    assert games.count('202012250LAL') == 1
+    assert not spider.logger.errors
+
+
+def test_consolidated_new_columns(settings, spider):
+    settings.set('CSV_CONSOLIDATE', True)
+    path = '{}/games/boxscores/basic/2020.csv'.format(settings.get('OUTPUT_DIR'))
+    crawl(CsvWriterPipeline(), [get_boxscore_item('202012220BRK', 2)], spider)
+
+    item = get_boxscore_item('202012230BOS', 1)
+    item['fieldnames'] = ['game_id', 'pts', 'pnum']
+    item['data'][0]['pts'] = '12'
+    crawl(CsvWriterPipeline(), [item], spider)
+
+    with open(path, encoding='utf-8') as f:
+        assert f.readline() == 'game_id,pts,pnum\n'
+    rows = read_rows(path)
+    assert [(x['game_id'], x['pts'], x['pnum']) for x in rows] == [
+        ('202012220BRK', '', '0'), ('202012220BRK', '', '1'), ('202012230BOS', '12', '0')]
+
+def test_consolidated_game_written_twice(settings, spider):
+    settings.set('CSV_CONSOLIDATE', True)
+    path = '{}/games/boxscores/basic/2020.csv'.format(settings.get('OUTPUT_DIR'))
+
+    crawl(CsvWriterPipeline(), [get_boxscore_item('202012220BRK', 3),
+                                get_boxscore_item('202012230BOS', 2),
+                                get_boxscore_item('202012220BRK', 2)], spider)
+    games = [x['game_id'] for x in read_rows(path)]
+    assert games == ['202012230BOS'] * 2 + ['202012220BRK'] * 2
+
+    # Stream items: the rows of a game up to its end item are one write
+    items = []
+    for rows in [3, 1]:
+        item = get_boxscore_item('202012250LAL', rows)
+        items += [get_row_item('boxscore', item['dir'], item['file_name'], item['fieldnames'], x)
+                  for x in item['data']]
+        items.append(get_end_item('boxscore', item['dir'], item['file_name'], item['fieldnames']))
+    crawl(CsvWriterPipeline(), items, spider)
+    games = [x['game_id'] for x in read_rows(path)]
+    assert games == ['202012230BOS'] * 2 + ['202012220BRK'] * 2 + ['202012250LAL']
+
+
+def test_delta_manifest(settings, spider, responses):
+    settings.set('DELTA_ENABLED', True)
+    output_dir = settings.get('OUTPUT_DIR')
+    items = list(BoxscoresSpider().parse_game(responses['boxscore']))
+    items += list(PlayerSpider().parse_player(responses['player']))
+
+    crawl(BasketballReferencePipeline(), items, spider)
+    with open('{}/.delta/manifest.json'.format(output_dir), encoding='utf-8') as f:
+        manifest = json.load(f)
+    assert sorted(manifest) == ['games/boxscores/advanced/2020/12220BRK.csv',
+                                'games/boxscores/basic/2020/12220BRK.csv',
+                                'players/data/c/cartevi01.json']
+    path = '{}/games/boxscores/basic/2020/12220BRK.csv'.format(output_dir)
+    assert manifest['games/boxscores/basic/2020/12220BRK.csv'][1] == os.path.getsize(path)
+    mtime = os.path.getmtime(path)
+    os.utime(path, (mtime - 60, mtime - 60))
+
+    # Same pages again: nothing written. Then one of them changes.
+    crawl(BasketballReferencePipeline(), items, spider)
+    assert os.path.getmtime(path) == mtime - 60
+    items[1]['data'][0]['pts'] = '99'
+    crawl(BasketballReferencePipeline(), items, spider)
+
+    changes = []
+    for file_name in sorted(os.listdir('{}/.delta/changes'.format(output_dir))):
+        with open('{}/.delta/changes/{}'.format(output_dir, file_name), encoding='utf-8') as f:
+            changes.append(json.load(f))
+    assert changes[-1] == {'games/boxscores/basic/2020/12220BRK.csv': 'modified'}
+    assert read_rows(path)[0]['pts'] == '99'
+
+def test_delta_file_rewritten_since(settings, spider, responses):
+    settings.set('DELTA_ENABLED', True)
+    items = list(BoxscoresSpider().parse_game(responses['boxscore']))
+    crawl(BasketballReferencePipeline(), items, spider)
+
+    # Rewritten without DELTA_ENABLED (or by hand): the manifest is stale
+    path = '{}/games/boxscores/basic/2020/12220BRK.csv'.format(settings.get('OUTPUT_DIR'))
+    with open(path, mode='a', encoding='utf-8') as f:
+        f.write('edited\n')
+    crawl(BasketballReferencePipeline(), items, spider)
+    assert 'edited' not in [x['game_id'] for x in read_rows(path)]
+
+
+class PoolWrites:
+    '''
+    Stand-in for deferToThreadPool: writes are run by finish(), in any order.
+    '''
+    def __init__(self):
+        self.running = []  # [deferred, function, args]
+        self.items = []  # items written, in order
+
+    def __call__(self, reactor, pool, function, item, spider):
+        d = defer.Deferred()
+        self.running.append([d, function, (item, spider)])
+        return d
+
+    def finish(self, index=0):
+        d, function, args = self.running.pop(index)
+        function(*args)
+        self.items.append(args[0])
+        d.callback(None)
+
+def test_threaded_writes_of_a_file_are_serialized(settings, spider, monkeypatch):
+    writes = PoolWrites()
+    monkeypatch.setattr(threads, 'deferToThreadPool', writes)
+    path = '{}/games/boxscores/basic/2020/12220BRK.csv'.format(settings.get('OUTPUT_DIR'))
+
+    items = [get_boxscore_item('202012220BRK', 1), get_boxscore_item('202012230BOS', 1),
+             get_boxscore_item('202012220BRK', 3), get_boxscore_item('202012220BRK', 2)]
+    pipeline = ThreadedWriterPipeline()
+    pipeline.open_spider(spider)
+    try:
+        for item in items:
+            pipeline.process_item(item, spider)
+
+        # The second write of 12220BRK waits for the first one
+        assert [x[2][0] for x in writes.running] == items[:2]
+        writes.finish(1)
+        writes.finish(0)
+        assert [x[2][0] for x in writes.running] == [items[2]]
+
+        d = pipeline.close_spider(spider)
+        while writes.running:
+            writes.finish()
+        assert d.called
+    finally:
+        if pipeline.pool.started:
+            pipeline.pool.stop()
+
+    assert sorted(map(id, writes.items)) == sorted(map(id, items))
+    assert len(read_rows(path)) == 2
+    assert not spider.logger.errors
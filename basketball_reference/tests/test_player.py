@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import os, asyncio
+from datetime import date
+
+from scrapy.http import HtmlResponse
+
+from basketball_reference.spiders.player import PlayerSpider
+
+URL = 'https://www.basketball-reference.com/players/c/cartevi01.html'
+
+PAGE = b'''<html><body>
+<table class="stats_table" id="per_game"><tbody>
+<tr><th data-stat="season">1998-99</th><td data-stat="pts_per_g">18.3</td></tr>
+</tbody></table>
+<!-- <table class="stats_table" id="totals"><tbody>
+<tr><th data-stat="season">1998-99</th><td data-stat="pts">913</td></tr>
+</tbody></table> -->
+</body></html>'''
+
+
+def test_parse_player_in_pool():
+    spider = PlayerSpider(processes='1')
+    response = HtmlResponse(URL, body=PAGE, encoding='utf-8')
+
+    async def parse():
+        try:
+            return await spider.parse_player_in_pool(response)
+        finally:
+            spider.closed('finished')
+
+    items = asyncio.run(parse())
+    assert items == list(spider.parse_player_inline(response))
+    assert sorted(items[0]['data']) == ['per_game', 'totals']
+
+def test_active_players_from_stored_list(settings):
+    today = date.today()
+    season = today.year + 1 if today.month >= 9 else today.year
+
+    # (player, year_max): only the first two played in the last 2 seasons
+    rows = [('cartevi01', season), ('curryst01', season - 1), ('camby01', season - 2), ('cookda01', '')]
+    list_dir = '{}/players/list'.format(settings.get('OUTPUT_DIR'))
+    os.makedirs(list_dir)
+    with open('{}/c.csv'.format(list_dir), mode='w', encoding='utf-8') as f:
+        f.write('player_href,year_max\n')
+        for player_id, year_max in rows:
+            f.write('/players/c/{}.html,{}\n'.format(player_id, year_max))
+
+    spider = PlayerSpider(active='2', l='c,d', ids='cartevi01')
+    spider.settings = settings
+    assert [x.url for x in spider.start_requests()] == [
+        URL, 'https://www.basketball-reference.com/players/c/curryst01.html',
+        'https://www.basketball-reference.com/players/d']
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from scrapy import Request
+from scrapy.http import HtmlResponse
+
+from basketball_reference.middlewares import TokenBucket, RateLimitMiddleware
+
+URL = 'https://www.basketball-reference.com/boxscores/202012220BRK.html'
+
+
+def test_token_bucket(clock):
+    bucket = TokenBucket(rate=0.5, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 2  # queued after the burst
+    assert bucket.reserve() == 4
+
+    clock.now += 10
+    assert bucket.reserve() == 0  # refilled, up to capacity
+
+def test_token_bucket_pause(clock):
+    bucket = TokenBucket(rate=1, capacity=1)
+    bucket.reserve()
+    bucket.pause(30)
+    assert bucket.is_paused()
+    assert bucket.reserve() >= 30
+
+    clock.now += 31
+    assert not bucket.is_paused()
+
+
+def get_middleware(crawler):
+    middleware = RateLimitMiddleware(crawler)
+    delays = []
+    middleware.delay = lambda bucket, wait: delays.append(wait)
+    return middleware, delays
+
+def test_waiting_requests_wait_for_the_pause(crawler, clock):
+    middleware, delays = get_middleware(crawler)
+    request = Request(URL)
+    for _ in range(3):
+        middleware.process_request(request, None)
+    assert len(delays) == 2  # the first one goes right away
+
+    # A 429 arrives while the others wait
+    bucket = middleware.buckets['www.basketball-reference.com']
+    bucket.pause(60)
+    clock.now += delays[0]
+    middleware.delay_done(bucket.is_paused(), bucket)
+    assert delays[-1] >= 60 - delays[0]
+
+    clock.now += 60
+    assert middleware.delay_done(bucket.is_paused(), bucket) is None
+
+
+def test_cached_responses_do_not_ramp_up(crawler):
+    middleware, delays = get_middleware(crawler)
+    request = Request(URL)
+    middleware.process_request(request, None)
+    bucket = middleware.buckets['www.basketball-reference.com']
+    bucket.rate = middleware.min_rate
+
+    cached = HtmlResponse(URL, body=b'', request=request, flags=['cached'])
+    middleware.process_response(request, cached, None)
+    assert bucket.rate == middleware.min_rate
+
+    middleware.process_response(request, HtmlResponse(URL, body=b'', request=request), None)
+    assert bucket.rate > middleware.min_rate
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from basketball_reference.pipelines import CsvWriterPipeline, ParquetPipeline
+from basketball_reference.sharding import get_shards, ShardMerger
+
+from conftest import Spider
+from test_pipelines import get_boxscore_item, crawl, read_rows
+
+
+def test_split_seasons():
+    shards = get_shards('boxscores', {'from_season': '2001', 'to_season': '2005'}, 2)
+    assert [x['seasons'] for x in shards] == ['2001,2003,2005', '2002,2004']
+    assert shards[0]['months'] == ','.join(str(x) for x in range(1, 13))
+
+def test_split_months():
+    shards = get_shards('shots', {'seasons': '2021', 'months': '10,11,12'}, 2)
+    assert [(x['seasons'], x['months']) for x in shards] == [('2021', '10,12'), ('2021', '11')]
+
+def test_split_letters():
+    shards = get_shards('player', {'l': 'a,b,c', 'typed': '1'}, 5)
+    assert shards == [{'l': 'a', 'typed': '1'}, {'l': 'b', 'typed': '1'}, {'l': 'c', 'typed': '1'}]
+
+def test_unshardable():
+    assert get_shards('boxscores', {'date': 'today'}, 2) is None
+    assert get_shards('games', {'seasons': '2021'}, 2) is None
+
+
+def test_merge_parquet(settings, spider):
+    pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+    crawl(ParquetPipeline(), [get_boxscore_item('202012220BRK', 3),
+                              get_boxscore_item('202012230BOS', 2)], spider)
+
+    shard_dir = '{}/.shards/0'.format(settings.get('OUTPUT_DIR'))
+    shard_settings = settings.copy()
+    shard_settings.set('OUTPUT_DIR', '{}/output'.format(shard_dir))
+    crawl(ParquetPipeline(), [get_boxscore_item('202012230BOS', 4)], Spider(shard_settings))
+
+    merger = ShardMerger(settings, 'boxscores')
+    merger.merge(shard_dir)
+
+    path = '{}/parquet/boxscores/year=2020/box_type=basic'.format(settings.get('OUTPUT_DIR'))
+    games = [x['game_id'] for x in pq.read_table(path).to_pylist()]
+    assert games.count('202012220BRK') == 3
+    assert games.count('202012230BOS') == 4
+    assert not os.path.exists(shard_dir)
+
+def test_merge_consolidated(settings, spider):
+    settings.set('CSV_CONSOLIDATE', True)
+    crawl(CsvWriterPipeline(), [get_boxscore_item('202012220BRK', 3),
+                                get_boxscore_item('202012230BOS', 2)], spider)
+
+    shard_dir = '{}/.shards/0'.format(settings.get('OUTPUT_DIR'))
+    shard_settings = settings.copy()
+    shard_settings.set('OUTPUT_DIR', '{}/output'.format(shard_dir))
+    crawl(CsvWriterPipeline(), [get_boxscore_item('202012230BOS', 4),
+                                get_boxscore_item('202012250LAL', 1)], Spider(shard_settings))
+    unfinished = '{}/output/games/boxscores/basic/2020/12260NYK.csv.1.2.tmp'.format(shard_dir)
+    os.makedirs(os.path.dirname(unfinished))
+    open(unfinished, mode='w').close()
+
+    merger = ShardMerger(settings, 'boxscores')
+    merger.merge(shard_dir)
+
+    games = [x['game_id'] for x in read_rows('{}/games/boxscores/basic/2020.csv'.format(settings.get('OUTPUT_DIR')))]
+    assert games == ['202012220BRK'] * 3 + ['202012230BOS'] * 4 + ['202012250LAL']
+    assert merger.unfinished == ['games/boxscores/basic/2020/12260NYK.csv.1.2.tmp']
+    assert not os.path.exists('{}/games/boxscores/basic/2020'.format(settings.get('OUTPUT_DIR')))
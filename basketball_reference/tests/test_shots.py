@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from basketball_reference.patterns import LEFT_RE, TOP_RE
+from basketball_reference.spiders import shots
+from basketball_reference.spiders.shots import ShotsSpider, get_shots_geometry, get_shots_geometry_scalar
+
+
+def get_positions(response):
+    styles = response.xpath('//div[contains(@class, "tooltip")]/@style').getall()
+    return [LEFT_RE.search(x).group(1) for x in styles], [TOP_RE.search(x).group(1) for x in styles]
+
+def test_geometry_numpy(responses):
+    pytest.importorskip('numpy')
+    xs, ys = get_positions(responses['shot_chart'])
+    assert len(xs) == 80
+
+    distances, angles, zones, corners = get_shots_geometry(xs, ys)
+    assert (distances, angles, zones, corners) == get_shots_geometry_scalar(xs, ys)
+    assert all(isinstance(x, bool) for x in corners)
+    assert len(set(zones)) > 1
+
+def test_shot_rows_numpy(responses, monkeypatch):
+    pytest.importorskip('numpy')
+    items = [x for x in ShotsSpider().parse_game(responses['shot_chart']) if isinstance(x, dict)]
+    monkeypatch.setattr(shots, 'np', None)
+    scalar_items = [x for x in ShotsSpider().parse_game(responses['shot_chart']) if isinstance(x, dict)]
+    assert [[dict(row.items()) for row in x['data']] for x in items] == \
+           [[dict(row.items()) for row in x['data']] for x in scalar_items]
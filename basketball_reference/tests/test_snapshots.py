@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import pytest
+from scrapy import Request
+from scrapy.exceptions import IgnoreRequest
+
+from basketball_reference.middlewares import SnapshotMiddleware
+from basketball_reference.spiders.boxscores import BoxscoresSpider
+
+
+def get_rows(items):
+    return [(x['dir'], x['file_name'], [dict(row.items()) for row in x['data']]) for x in items]
+
+def get_middleware(crawler, tmp_path, **settings):
+    crawler.settings.set('SNAPSHOT_DIR', str(tmp_path / 'snapshots'))
+    for name, value in settings.items():
+        crawler.settings.set(name, value)
+    return SnapshotMiddleware.from_crawler(crawler)
+
+def test_record_replay(crawler, responses, tmp_path):
+    spider = BoxscoresSpider()
+
+    middleware = get_middleware(crawler, tmp_path, SNAPSHOT_ENABLED=True)
+    for response in responses.values():
+        request = Request(response.url)
+        assert middleware.process_request(request, spider) is None
+        middleware.process_response(request, response, spider)
+
+    middleware = get_middleware(crawler, tmp_path, SNAPSHOT_ENABLED=False, SNAPSHOT_REPLAY=True)
+    for response in responses.values():
+        replayed = middleware.process_request(Request(response.url), spider)
+        assert replayed.body == response.body
+        assert 'snapshot' in replayed.flags
+
+    # The replayed pages parse to the same items
+    replayed = middleware.process_request(Request(responses['boxscore'].url), spider)
+    assert get_rows(spider.parse_game(replayed)) == get_rows(spider.parse_game(responses['boxscore']))
+    assert crawler.stats.get_value('snapshot/miss') is None
+
+def test_replay_miss(crawler, spider, tmp_path):
+    middleware = get_middleware(crawler, tmp_path, SNAPSHOT_REPLAY=True)
+    with pytest.raises(IgnoreRequest):
+        middleware.process_request(Request('https://www.basketball-reference.com/robots.txt'), spider)
+    assert crawler.stats.get_value('snapshot/miss') == 1
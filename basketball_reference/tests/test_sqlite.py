@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import sqlite3
+
+from basketball_reference.pipelines import SQLitePipeline
+from basketball_reference.sharding import ShardMerger
+from basketball_reference.spiders.boxscores import BoxscoresSpider
+from basketball_reference.spiders.player import PlayerSpider
+
+from conftest import Spider
+from test_pipelines import crawl
+
+
+def count(path, table, where=''):
+    conn = sqlite3.connect(path)
+    result = conn.execute('SELECT COUNT(*) FROM {} {}'.format(table, where)).fetchone()[0]
+    conn.close()
+    return result
+
+def get_boxscore_items(responses):
+    return list(BoxscoresSpider().parse_game(responses['boxscore']))
+
+def test_boxscore_written_twice(settings, spider, responses):
+    settings.set('SQLITE_PATH', settings.get('OUTPUT_DIR') + '/db.sqlite')
+    items = get_boxscore_items(responses)
+    rows = len(items[1]['data'])
+    crawl(SQLitePipeline(), items, spider)
+    assert count(settings.get('SQLITE_PATH'), 'boxscores_basic') == rows
+
+    # Corrected box score, with a row less
+    items = get_boxscore_items(responses)
+    items[1]['data'].pop()
+    crawl(SQLitePipeline(), items, spider)
+    assert count(settings.get('SQLITE_PATH'), 'boxscores_basic') == rows - 1
+    assert count(settings.get('SQLITE_PATH'), 'boxscores_advanced') == len(items[0]['data'])
+
+def test_players_without_id(settings, spider, responses):
+    settings.set('SQLITE_PATH', settings.get('OUTPUT_DIR') + '/db.sqlite')
+    items = [x for x in PlayerSpider().parse_list(responses['player_list']) if isinstance(x, dict)]
+    rows = len(items[0]['data'])
+    items[0]['data'][0]['player_id'] = None
+    items[0]['data'][0]['player_href'] = None
+    for _ in range(2):
+        crawl(SQLitePipeline(), items, spider)
+    assert count(settings.get('SQLITE_PATH'), 'players') == rows - 1
+    assert count(settings.get('SQLITE_PATH'), 'players', 'WHERE player_id IS NULL') == 0
+
+def test_merge_boxscores(settings, spider, responses):
+    settings.set('SQLITE_PATH', settings.get('OUTPUT_DIR') + '/db.sqlite')
+    crawl(SQLitePipeline(), get_boxscore_items(responses), spider)
+
+    shard_dir = '{}/.shards/0'.format(settings.get('OUTPUT_DIR'))
+    shard_settings = settings.copy()
+    shard_settings.set('SQLITE_PATH', '{}/db.sqlite'.format(shard_dir))
+    items = get_boxscore_items(responses)
+    items[1]['data'].pop()
+    crawl(SQLitePipeline(), items, Spider(shard_settings))
+
+    ShardMerger(settings, 'boxscores').merge(shard_dir)
+    assert count(settings.get('SQLITE_PATH'), 'boxscores_basic') == len(items[1]['data'])